@@ -0,0 +1,184 @@
+"""Expense analytics served from the expense_rollups table.
+
+Every expense write adds its amounts to one row per (group, user, period
+bucket) for each of day, week and month, so reading a dashboard costs the
+number of buckets in the window, not the number of expenses behind it.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+
+PERIODS = ("day", "week", "month")
+
+# (group_id, user_id, period, period_start) -> [paid, share, expense_count]
+Deltas = Dict[Tuple[int, int, str, date], list]
+
+
+def period_start(moment: datetime, period: str) -> date:
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if period == "week":
+        return day - timedelta(days=day.weekday())  # Monday
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def new_deltas() -> Deltas:
+    return defaultdict(lambda: [0.0, 0.0, 0])
+
+
+def add_payment(deltas: Deltas, group_id: int, user_id: int, moment: datetime, amount: float):
+    for period in PERIODS:
+        entry = deltas[(group_id, user_id, period, period_start(moment, period))]
+        entry[0] += amount
+        entry[2] += 1
+
+
+def add_share(deltas: Deltas, group_id: int, user_id: int, moment: datetime, amount: float):
+    for period in PERIODS:
+        deltas[(group_id, user_id, period, period_start(moment, period))][1] += amount
+
+
+def apply_deltas(bind, deltas: Deltas, chunk_size: int = 500):
+    """Add ``deltas`` to the rollups with INSERT ... ON CONFLICT DO UPDATE.
+
+    ``bind`` is a Session or Connection; the caller commits.
+    """
+    dialect = bind.dialect if hasattr(bind, "dialect") else bind.get_bind().dialect
+    insert = sqlite.insert if dialect.name == "sqlite" else postgresql.insert
+    Rollup = models.ExpenseRollup
+
+    rows = [
+        {
+            "group_id": group_id, "user_id": user_id, "period": period, "period_start": start,
+            "paid": paid, "share": share, "expense_count": count
+        }
+        for (group_id, user_id, period, start), (paid, share, count) in deltas.items()
+    ]
+    for i in range(0, len(rows), chunk_size):
+        stmt = insert(Rollup).values(rows[i:i + chunk_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Rollup.group_id, Rollup.user_id, Rollup.period, Rollup.period_start],
+            set_={
+                "paid": Rollup.paid + stmt.excluded.paid,
+                "share": Rollup.share + stmt.excluded.share,
+                "expense_count": Rollup.expense_count + stmt.excluded.expense_count,
+            }
+        )
+        bind.execute(stmt)
+
+
+def rebuild_rollups(conn, paid=None, share=None):
+    """Recompute all rollups from expenses and splits, in each group's base currency.
+
+    ``paid`` and ``share`` are the expense and split amount columns to sum
+    (base_amount by default); migrations pass the columns of their time.
+    """
+    Expense, Split = models.Expense, models.ExpenseSplit
+    paid = Expense.base_amount if paid is None else paid
+    share = Split.base_amount if share is None else share
+    deltas = new_deltas()
+    for group_id, paid_by, created_at, amount in conn.execute(
+        select(Expense.group_id, Expense.paid_by, Expense.created_at, paid)
+    ):
+        add_payment(deltas, group_id, paid_by, created_at, amount)
+
+    shares = select(Expense.group_id, Split.user_id, Expense.created_at, share).join(
+        Expense, Expense.id == Split.expense_id
+    )
+    for group_id, user_id, created_at, amount in conn.execute(shares):
+        add_share(deltas, group_id, user_id, created_at, amount)
+
+    conn.execute(delete(models.ExpenseRollup))
+    apply_deltas(conn, deltas)
+
+
+def _window(query, period: str, start: Optional[date], end: Optional[date]):
+    Rollup = models.ExpenseRollup
+    query = query.filter(Rollup.period == period)
+    if start is not None:
+        query = query.filter(Rollup.period_start >= period_start(start, period))
+    if end is not None:
+        query = query.filter(Rollup.period_start <= end)
+    return query
+
+
+def group_analytics(db, group_id: int, period: str = "month", start: date = None, end: date = None) -> Dict:
+    Rollup = models.ExpenseRollup
+
+    series = _window(
+        db.query(Rollup.period_start, func.sum(Rollup.paid), func.sum(Rollup.expense_count))
+        .filter(Rollup.group_id == group_id),
+        period, start, end
+    ).group_by(Rollup.period_start).order_by(Rollup.period_start)
+    series = [
+        {"period_start": bucket, "total": round(total, 2), "expense_count": count}
+        for bucket, total, count in series
+    ]
+
+    members = _window(
+        db.query(Rollup.user_id, models.User.name, func.sum(Rollup.paid), func.sum(Rollup.share))
+        .join(models.User, models.User.id == Rollup.user_id)
+        .filter(Rollup.group_id == group_id),
+        period, start, end
+    ).group_by(Rollup.user_id, models.User.name).all()
+
+    return {
+        "group_id": group_id,
+        "period": period,
+        "start": start,
+        "end": end,
+        "total": round(sum(point["total"] for point in series), 2),
+        "expense_count": sum(point["expense_count"] for point in series),
+        "series": series,
+        "by_payer": sorted(
+            ({"user_id": user_id, "user_name": name, "amount": round(paid, 2)}
+             for user_id, name, paid, _ in members if paid),
+            key=lambda entry: -entry["amount"]
+        ),
+        "by_member": sorted(
+            ({"user_id": user_id, "user_name": name, "amount": round(share, 2)}
+             for user_id, name, _, share in members if share),
+            key=lambda entry: -entry["amount"]
+        ),
+    }
+
+
+def user_analytics(db, user_id: int, period: str = "month", start: date = None, end: date = None) -> Dict:
+    Rollup = models.ExpenseRollup
+
+    series = _window(
+        db.query(Rollup.period_start, func.sum(Rollup.paid), func.sum(Rollup.share))
+        .filter(Rollup.user_id == user_id),
+        period, start, end
+    ).group_by(Rollup.period_start).order_by(Rollup.period_start)
+    series = [
+        {"period_start": bucket, "paid": round(paid, 2), "share": round(share, 2)}
+        for bucket, paid, share in series
+    ]
+
+    groups = _window(
+        db.query(Rollup.group_id, models.Group.name, func.sum(Rollup.paid), func.sum(Rollup.share))
+        .join(models.Group, models.Group.id == Rollup.group_id)
+        .filter(Rollup.user_id == user_id),
+        period, start, end
+    ).group_by(Rollup.group_id, models.Group.name).order_by(Rollup.group_id)
+
+    return {
+        "user_id": user_id,
+        "period": period,
+        "start": start,
+        "end": end,
+        "total_paid": round(sum(point["paid"] for point in series), 2),
+        "total_share": round(sum(point["share"] for point in series), 2),
+        "series": series,
+        "by_group": [
+            {"group_id": group_id, "group_name": name, "paid": round(paid, 2), "share": round(share, 2)}
+            for group_id, name, paid, share in groups
+        ],
+    }
@@ -1,10 +1,27 @@
-import requests
-import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional
 from sqlalchemy.orm import Session
+import asyncio
 import crud
+import fx
 import models
 import os
+import re
+import logging
+from inference import get_inference_manager, InferenceUnavailable, HF_API_BASE_URL
+
+TEXT_GENERATION_MODEL = "mistralai/Mistral-7B-Instruct-v0.1"
+
+logger = logging.getLogger(__name__)
+
+# Canned questions (the chat suggestions) that are answered straight from the
+# database instead of going through the model, mapped to their fallback intent
+LOCAL_QUERIES = {
+    "what are the current balances": "balance",
+    "show me recent expenses": "expense",
+    "show me the latest expenses": "expense",
+    "whats the total expenses": "total",
+    "list all groups": "group",
+}
 
 class ChatbotService:
     def __init__(self, db: Session):
@@ -17,7 +34,10 @@ class ChatbotService:
         # "microsoft/DialoGPT-large" - Better quality responses
         
         # For more advanced responses, you can use:
-        self.text_generation_url = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.1"
+        self.text_generation_url = f"{HF_API_BASE_URL}/{TEXT_GENERATION_MODEL}"
+        
+        # Shared across requests so model health survives between calls
+        self.inference = get_inference_manager([TEXT_GENERATION_MODEL])
     
     def get_context_data(self, user_id: int = None, group_id: int = None) -> Dict[str, Any]:
         """Gather relevant context data from the database"""
@@ -52,8 +72,9 @@ class ChatbotService:
                     }
                     for member in group.members
                 ],
+                "base_currency": group.base_currency,
                 "expenses": [],
-                "total_expenses": 0
+                "total_expenses": 0  # in fx.FX_BASE_CURRENCY, so groups can be added up
             }
             
             # Get expenses for this group
@@ -62,9 +83,10 @@ class ChatbotService:
                     "id": expense.id,
                     "description": expense.description,
                     "amount": expense.amount,
+                    "currency": expense.currency or group.base_currency,
                     "paid_by": expense.payer.name,
                     "paid_by_id": expense.paid_by,
-                    "split_type": expense.split_type.value,
+                    "split_type": expense.split_type,
                     "created_at": expense.created_at.isoformat(),
                     "splits": [
                         {
@@ -76,7 +98,9 @@ class ChatbotService:
                     ]
                 }
                 group_data["expenses"].append(expense_data)
-                group_data["total_expenses"] += expense.amount
+                group_data["total_expenses"] += fx.convert(
+                    expense.amount, expense.currency or group.base_currency, fx.FX_BASE_CURRENCY, expense.created_at
+                )
             
             # Get balances for this group
             try:
@@ -115,19 +139,19 @@ Groups and Expenses:
         for group in context['groups']:
             context_summary += f"\n{group['name']} Group:"
             context_summary += f"\n  Members: {', '.join([m['name'] for m in group['members']])}"
-            context_summary += f"\n  Total Expenses: ${group['total_expenses']:.2f}"
+            context_summary += f"\n  Total Expenses: {group['total_expenses']:.2f} {fx.FX_BASE_CURRENCY}"
             
             if group['expenses']:
                 context_summary += f"\n  Recent Expenses:"
                 for expense in group['expenses'][-3:]:  # Last 3 expenses
-                    context_summary += f"\n    - {expense['description']}: ${expense['amount']:.2f} (paid by {expense['paid_by']})"
+                    context_summary += f"\n    - {expense['description']}: {expense['amount']:.2f} {expense['currency']} (paid by {expense['paid_by']})"
             
             if group['balances']:
                 context_summary += f"\n  Balances:"
                 for balance in group['balances']:
                     if balance['net_balance'] != 0:
                         status = "owes" if balance['net_balance'] < 0 else "is owed"
-                        context_summary += f"\n    - {balance['user_name']}: {status} ${abs(balance['net_balance']):.2f}"
+                        context_summary += f"\n    - {balance['user_name']}: {status} {abs(balance['net_balance']):.2f} {group['base_currency']}"
         
         # Create the full prompt
         full_prompt = f"""
@@ -145,54 +169,85 @@ Assistant Response:"""
     
     def query_huggingface_api(self, prompt: str) -> str:
         """Query Hugging Face API for text generation"""
-        headers = {}
-        if self.hf_api_key:
-            headers["Authorization"] = f"Bearer {self.hf_api_key}"
-        
-        # Try the text generation model first
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": 200,
-                "temperature": 0.7,
-                "do_sample": True,
-                "top_p": 0.9,
-                "return_full_text": False
-            }
+        parameters = {
+            "max_new_tokens": 200,
+            "temperature": 0.7,
+            "do_sample": True,
+            "top_p": 0.9,
+            "return_full_text": False
         }
         
         try:
-            response = requests.post(
-                self.text_generation_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    generated_text = result[0].get("generated_text", "")
-                    return generated_text.strip()
-                elif isinstance(result, dict) and "generated_text" in result:
-                    return result["generated_text"].strip()
-            
+            return self.inference.generate(prompt, parameters)
+        except InferenceUnavailable as e:
             # If the model is loading, try a simpler approach
-            elif response.status_code == 503:
+            if e.reason == "loading":
                 return "The AI model is currently loading. Please try again in a moment."
-                
-        except Exception as e:
-            print(f"Hugging Face API error: {e}")
+        except Exception:
+            logger.exception("Hugging Face API error")
         
         # Fallback to rule-based responses if API fails
         return self.get_fallback_response(prompt)
     
-    def get_fallback_response(self, prompt: str) -> str:
+    async def stream_huggingface_api(self, prompt: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream generated tokens from the inference backend as they are produced"""
+        parameters = {
+            "max_new_tokens": 200,
+            "temperature": 0.7,
+            "do_sample": True,
+            "top_p": 0.9,
+            "return_full_text": False
+        }
+        
+        try:
+            async for chunk in self.inference.stream(prompt, parameters):
+                yield chunk
+            return
+        except InferenceUnavailable as e:
+            if e.reason == "loading":
+                yield "The AI model is currently loading. Please try again in a moment."
+                return
+        
+        yield self.get_fallback_response(prompt, context)
+    
+    async def stream_text(self, text: str) -> AsyncIterator[str]:
+        """Stream an already available response line by line"""
+        for line in text.splitlines(keepends=True):
+            yield line
+    
+    def get_local_response(self, query: str, context: Dict[str, Any] = None) -> Optional[str]:
+        """Answer the canned suggestion queries without calling the model"""
+        normalized = re.sub(r"[^a-z ]", "", query.lower()).strip()
+        intent = LOCAL_QUERIES.get(normalized)
+        if intent is None:
+            return None
+        return self.get_fallback_response(intent, context)
+    
+    def stream_query(self, query: str, user_context: Dict[str, Any] = None) -> AsyncIterator[str]:
+        """Gather context and return an iterator over the response chunks.
+
+        All database work happens here, before streaming starts, so the
+        returned iterator only does network I/O.
+        """
+        context = self.get_context_data()
+        
+        local_response = self.get_local_response(query, context)
+        if local_response is not None:
+            return self.stream_text(local_response)
+        
+        if user_context:
+            context.update(user_context)
+        
+        prompt = self.create_prompt(context, query)
+        return self.stream_huggingface_api(prompt, context)
+    
+    def get_fallback_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Provide rule-based responses when API is unavailable"""
         query_lower = prompt.lower()
         
         # Get context data for fallback responses
-        context = self.get_context_data()
+        if context is None:
+            context = self.get_context_data()
         
         if "balance" in query_lower or "owe" in query_lower:
             # Find balance information
@@ -203,9 +258,9 @@ Assistant Response:"""
                     for balance in group['balances']:
                         if balance['net_balance'] != 0:
                             if balance['net_balance'] < 0:
-                                response += f"  • {balance['user_name']} owes ${abs(balance['net_balance']):.2f}\n"
+                                response += f"  • {balance['user_name']} owes {abs(balance['net_balance']):.2f} {group['base_currency']}\n"
                             else:
-                                response += f"  • {balance['user_name']} is owed ${balance['net_balance']:.2f}\n"
+                                response += f"  • {balance['user_name']} is owed {balance['net_balance']:.2f} {group['base_currency']}\n"
                     response += "\n"
             return response
         
@@ -224,7 +279,7 @@ Assistant Response:"""
             if recent_expenses:
                 response = "Here are the recent expenses:\n\n"
                 for expense in recent_expenses:
-                    response += f"• {expense['description']}: ${expense['amount']:.2f}\n"
+                    response += f"• {expense['description']}: {expense['amount']:.2f} {expense['currency']}\n"
                     response += f"  Paid by {expense['paid_by']} in {expense['group_name']}\n\n"
                 return response
             else:
@@ -233,11 +288,11 @@ Assistant Response:"""
         elif "total" in query_lower:
             # Calculate totals
             total_expenses = sum(group['total_expenses'] for group in context['groups'])
-            response = f"Total expenses across all groups: ${total_expenses:.2f}\n\n"
+            response = f"Total expenses across all groups: {total_expenses:.2f} {fx.FX_BASE_CURRENCY}\n\n"
             
             response += "Breakdown by group:\n"
             for group in context['groups']:
-                response += f"• {group['name']}: ${group['total_expenses']:.2f}\n"
+                response += f"• {group['name']}: {group['total_expenses']:.2f} {fx.FX_BASE_CURRENCY}\n"
             
             return response
         
@@ -248,7 +303,7 @@ Assistant Response:"""
                 for group in context['groups']:
                     response += f"• {group['name']}\n"
                     response += f"  Members: {', '.join([m['name'] for m in group['members']])}\n"
-                    response += f"  Total expenses: ${group['total_expenses']:.2f}\n\n"
+                    response += f"  Total expenses: {group['total_expenses']:.2f} {fx.FX_BASE_CURRENCY}\n\n"
                 return response
             else:
                 return "No groups found. Create a group to start tracking expenses!"
@@ -267,8 +322,9 @@ Note: The AI model might be loading. For best results, try again in a moment."""
     async def process_query(self, query: str, user_context: Dict[str, Any] = None) -> str:
         """Process a natural language query and return a response"""
         try:
-            # Get context data
-            context = self.get_context_data()
+            # Database and model calls block, so they run off the event loop;
+            # that also lets identical concurrent prompts share one upstream call
+            context = await asyncio.to_thread(self.get_context_data)
             
             # Add user context if provided
             if user_context:
@@ -278,7 +334,7 @@ Note: The AI model might be loading. For best results, try again in a moment."""
             prompt = self.create_prompt(context, query)
             
             # Query Hugging Face API
-            response = self.query_huggingface_api(prompt)
+            response = await asyncio.to_thread(self.query_huggingface_api, prompt)
             
             return response
             
@@ -287,24 +343,4 @@ Note: The AI model might be loading. For best results, try again in a moment."""
     
     def get_quick_stats(self) -> Dict[str, Any]:
         """Get quick statistics for the chatbot"""
-        context = self.get_context_data()
-        
-        stats = {
-            "total_users": len(context["users"]),
-            "total_groups": len(context["groups"]),
-            "total_expenses": sum(group["total_expenses"] for group in context["groups"]),
-            "recent_expenses": []
-        }
-        
-        # Get recent expenses across all groups
-        all_expenses = []
-        for group in context["groups"]:
-            for expense in group["expenses"]:
-                expense["group_name"] = group["name"]
-                all_expenses.append(expense)
-        
-        # Sort by date and get recent ones
-        all_expenses.sort(key=lambda x: x["created_at"], reverse=True)
-        stats["recent_expenses"] = all_expenses[:5]
-        
-        return stats
+        return crud.get_chat_stats(self.db)
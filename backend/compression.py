@@ -0,0 +1,134 @@
+"""Response compression, Cache-Control policies and ETags.
+
+Bodies of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli
+(when the ``brotli`` package is installed and the client accepts it) or
+gzip. Responses that stream more than one body chunk, such as the chat
+event stream, are passed through untouched.
+
+Routes are given a Cache-Control policy by endpoint function name. GET
+responses of routes with a cacheable policy also get a weak ETag, and a
+matching If-None-Match is answered with an empty 304.
+"""
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding the client accepts (ignoring q-values other than 0)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing bodies and applying ``cache_policies``
+    (endpoint name -> Cache-Control value)"""
+
+    def __init__(self, app, cache_policies: Dict[str, str] = None, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.cache_policies = cache_policies or {}
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", "")) if COMPRESSION_ENABLED else None
+        if_none_match = request_headers.get("if-none-match")
+        start = None
+        chunks = []
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # A streamed body: send what we have and stay out of the way
+                streaming = True
+                await send(self.with_policy(scope, start))
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+            await self.finish(scope, start, b"".join(chunks), encoding, if_none_match, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def with_policy(self, scope, start):
+        policy = self.cache_policies.get(getattr(scope.get("endpoint"), "__name__", None))
+        headers = MutableHeaders(scope=start)
+        if policy and "cache-control" not in headers:
+            headers["Cache-Control"] = policy
+        return start
+
+    async def finish(self, scope, start, body: bytes, encoding: Optional[str], if_none_match: Optional[str], send):
+        start = self.with_policy(scope, start)
+        headers = MutableHeaders(scope=start)
+
+        cache_control = headers.get("cache-control", "")
+        if scope["method"] == "GET" and start["status"] == 200 and cache_control and "no-store" not in cache_control:
+            tag = etag(body)
+            headers["ETag"] = tag
+            if if_none_match and tag in [value.strip() for value in if_none_match.split(",")]:
+                del headers["content-length"]
+                del headers["content-type"]
+                start["status"] = 304
+                await send(start)
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        content_type = headers.get("content-type", "")
+        if (
+            len(body) >= self.minimum_size
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+            and "content-encoding" not in headers
+        ):
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                body = compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,90 @@
+"""Shared fixtures: tests run against a throwaway SQLite database.
+
+DATABASE_URL is set before any backend module is imported, so the engine
+in database.py points at a temporary file. Each test that asks for ``db``
+or ``client`` gets a freshly migrated file and empty in-process caches.
+"""
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="splitwise-test-")
+_db_path = os.path.join(_db_dir, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+
+import pytest
+
+
+def _reset_caches():
+    import crud
+    import debts
+    import group_state
+
+    crud._chat_stats_cache.update(stats=None, expires_at=0.0)
+    crud._idempotency_purge["next_at"] = 0.0
+    crud._membership_cache.clear()
+    crud._membership_versions.clear()
+    debts._graph.update(graph=None, expires_at=0.0, dirty=set())
+    debts._plans.clear()
+    group_state._states.clear()
+    group_state._versions.clear()
+    group_state._writing.clear()
+    group_state._total_bytes = 0
+
+
+@pytest.fixture
+def database():
+    """A freshly migrated, empty database"""
+    import database as db_module
+    import migrate
+
+    db_module.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(_db_path + suffix):
+            os.remove(_db_path + suffix)
+    migrate.upgrade()
+    _reset_caches()
+    yield db_module
+    db_module.engine.dispose()
+
+
+@pytest.fixture
+def db(database):
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(database):
+    from fastapi.testclient import TestClient
+
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_group(client):
+    """Create users and a group of them; returns (group id, user ids)"""
+    def make(names=("alice", "bob", "carol"), base_currency="USD"):
+        user_ids = [
+            client.post("/users/", json={"name": name, "email": f"{name}@example.com"}).json()["id"]
+            for name in names
+        ]
+        group = client.post("/groups/", json={"name": "Trip", "user_ids": user_ids, "base_currency": base_currency})
+        assert group.status_code == 200, group.text
+        return group.json()["id"], user_ids
+    return make
+
+
+@pytest.fixture
+def add_expense(client):
+    """Add an expense (an equal split by default) and return it"""
+    def add(group_id, **fields):
+        fields.setdefault("description", "Dinner")
+        fields.setdefault("split_type", "equal")
+        response = client.post(f"/groups/{group_id}/expenses", json=fields)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return add
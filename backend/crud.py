@@ -1,15 +1,77 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, delete, insert, or_, case, select, literal, literal_column, table, column, Float, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
 import models
 import schemas
+from database import lock_for_write, single_writer
+import splits as split_engine
+import analytics
+import debts
+import group_state
+import fx
 from typing import List, Dict
 from collections import defaultdict
+import hashlib
+import os
+import re
+import threading
+import time
 
+# Cached /chat/stats payload. Writes in this process update it in place;
+# the TTL picks up writes made by other workers.
+CHAT_STATS_TTL = float(os.getenv("CHAT_STATS_TTL", "30"))
+_chat_stats_lock = threading.Lock()
+_chat_stats_cache = {"stats": None, "expires_at": 0.0}
+
+# How long an Idempotency-Key is remembered, and how often expired keys
+# are purged (at most once per interval per worker, on the write path)
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_PURGE_INTERVAL = 600
+_idempotency_purge = {"next_at": 0.0}
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request"""
+
+class IdempotencyKeyInProgress(Exception):
+    """Another request with the same key has not finished yet"""
+
+# Per-group member sets used by the expense write path. Membership changes
+# in this process bump the group's version; the TTL bounds how long changes
+# made by other workers go unseen.
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "30"))
+_membership_lock = threading.Lock()
+_membership_cache = {}  # group_id -> GroupMembership
+_membership_versions = defaultdict(int)  # group_id -> version
+
+class GroupMembership:
+    """Cached name, base currency and members of one group"""
+
+    __slots__ = ("group_id", "name", "base_currency", "member_ids", "member_set", "version", "expires_at")
+
+    def __init__(self, group_id: int, name: str, base_currency: str, member_ids: List[int], version: int):
+        self.group_id = group_id
+        self.name = name
+        self.base_currency = base_currency
+        self.member_ids = tuple(member_ids)  # join order, for split fan-out
+        self.member_set = frozenset(member_ids)
+        self.version = version
+        self.expires_at = time.monotonic() + MEMBERSHIP_CACHE_TTL
+
+    @property
+    def count(self) -> int:
+        return len(self.member_ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.member_set
+
+@single_writer
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(**user.dict())
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    _update_chat_stats(users=1)
     return db_user
 
 def get_user(db: Session, user_id: int):
@@ -18,18 +80,153 @@ def get_user(db: Session, user_id: int):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def _insert(db: Session, model):
+    """INSERT supporting ON CONFLICT for the session's database"""
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
+
+@single_writer
+def bulk_upsert_users(db: Session, users: List[schemas.UserCreate]):
+    """Insert users or update their names, matched by email, in one statement"""
+    # ON CONFLICT cannot touch the same row twice; the last entry wins
+    rows = {user.email: user for user in users}
+    if not rows:
+        return []
+    
+    now = datetime.utcnow()
+    stmt = _insert(db, models.User).values([
+        {"name": user.name, "email": user.email, "created_at": now}
+        for user in rows.values()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.User.email],
+        set_={"name": stmt.excluded.name}
+    ).returning(models.User.id, models.User.name, models.User.email, models.User.created_at)
+    
+    result = db.execute(stmt).all()
+    db.commit()
+    group_state.rename({row.id: row.name for row in result})
+    _invalidate_chat_stats()
+    return [schemas.User(id=row.id, name=row.name, email=row.email, created_at=row.created_at) for row in result]
+
+@single_writer
+def add_group_members(db: Session, group_id: int, user_ids: List[int]) -> Dict:
+    """Add users to a group with one multi-row insert, skipping existing members"""
+    requested = list(dict.fromkeys(user_ids))
+    existing = set()
+    if requested:
+        existing = {row.id for row in db.query(models.User.id).filter(models.User.id.in_(requested))}
+    valid = [user_id for user_id in requested if user_id in existing]
+    
+    added = []
+    if valid:
+        stmt = _insert(db, models.GroupMember).values([
+            {"group_id": group_id, "user_id": user_id} for user_id in valid
+        ]).on_conflict_do_nothing(
+            index_elements=[models.GroupMember.group_id, models.GroupMember.user_id]
+        ).returning(models.GroupMember.user_id)
+        added = db.execute(stmt).scalars().all()
+    db.commit()
+    if added:
+        _invalidate_membership(group_id)
+    
+    return {
+        "group_id": group_id,
+        "added": sorted(added),
+        "removed": [],
+        "missing": [user_id for user_id in requested if user_id not in existing],
+        "member_count": _member_count(db, group_id)
+    }
+
+@single_writer
+def remove_group_members(db: Session, group_id: int, user_ids: List[int]) -> Dict:
+    """Remove users from a group with a single DELETE.
+
+    Raises ValueError, removing no one, if any of them still has a
+    balance in the group: their debts would be left without a member.
+    """
+    removed = []
+    if user_ids:
+        lock_for_write(db)
+        db.query(models.Group.id).filter(models.Group.id == group_id).with_for_update().first()
+        balances = get_group_net_balances(db, group_id)
+        unsettled = sorted(user_id for user_id in set(user_ids) if balances.get(user_id, 0))
+        if unsettled:
+            db.rollback()
+            raise ValueError(f"Users {unsettled} still have a balance in this group; settle up before removing them")
+        stmt = delete(models.GroupMember).where(
+            models.GroupMember.group_id == group_id,
+            models.GroupMember.user_id.in_(list(user_ids))
+        ).returning(models.GroupMember.user_id)
+        removed = db.execute(stmt).scalars().all()
+    db.commit()
+    if removed:
+        _invalidate_membership(group_id)
+    
+    return {
+        "group_id": group_id,
+        "added": [],
+        "removed": sorted(removed),
+        "missing": [],
+        "member_count": _member_count(db, group_id)
+    }
+
+def _member_count(db: Session, group_id: int) -> int:
+    return db.query(func.count(models.GroupMember.id)).filter(models.GroupMember.group_id == group_id).scalar()
+
+def get_group_membership(db: Session, group_id: int):
+    """Name, base currency and member ids of a group, or None if it does not exist"""
+    with _membership_lock:
+        cached = _membership_cache.get(group_id)
+        version = _membership_versions[group_id]
+        if cached is not None and cached.version == version and time.monotonic() < cached.expires_at:
+            return cached
+    
+    group = db.query(models.Group.name, models.Group.base_currency).filter(models.Group.id == group_id).first()
+    if group is None:
+        return None
+    member_ids = [
+        row.user_id for row in
+        db.query(models.GroupMember.user_id)
+        .filter(models.GroupMember.group_id == group_id)
+        .order_by(models.GroupMember.id)
+    ]
+    membership = GroupMembership(group_id, group.name, group.base_currency, member_ids, version)
+    
+    with _membership_lock:
+        # Skip caching if membership changed while we were loading it
+        if _membership_versions[group_id] == version:
+            _membership_cache[group_id] = membership
+    return membership
+
+def _invalidate_membership(group_id: int):
+    with _membership_lock:
+        _membership_versions[group_id] += 1
+        _membership_cache.pop(group_id, None)
+
+@single_writer
 def create_group(db: Session, group: schemas.GroupCreate):
-    db_group = models.Group(name=group.name)
+    base_currency = (group.base_currency or fx.FX_BASE_CURRENCY).upper()
+    if not fx.is_known(base_currency):
+        raise ValueError(f"No exchange rates for {base_currency}")
+    
+    db_group = models.Group(name=group.name, base_currency=base_currency)
     db.add(db_group)
-    db.commit()
-    db.refresh(db_group)
+    db.flush()
     
-    # Add members to group
-    for user_id in group.user_ids:
-        db_member = models.GroupMember(group_id=db_group.id, user_id=user_id)
-        db.add(db_member)
+    # Add members to group in one multi-row insert, same transaction
+    user_ids = list(dict.fromkeys(group.user_ids))
+    if user_ids:
+        db.execute(
+            models.GroupMember.__table__.insert(),
+            [{"group_id": db_group.id, "user_id": user_id} for user_id in user_ids]
+        )
     
     db.commit()
+    db.refresh(db_group)
+    _invalidate_membership(db_group.id)
+    _update_chat_stats(groups=1)
     return db_group
 
 def get_group(db: Session, group_id: int):
@@ -39,68 +236,477 @@ def get_groups(db: Session, skip: int = 0, limit: int = 100):
     """Get all groups with their members and expenses"""
     return db.query(models.Group).offset(skip).limit(limit).all()
 
-def create_expense(db: Session, group_id: int, expense: schemas.ExpenseCreate):
-    # Convert enum to string value
-    split_type_value = expense.split_type.value if hasattr(expense.split_type, 'value') else str(expense.split_type)
+GROUP_FIELDS = ("id", "name", "base_currency", "created_at", "member_count", "expense_count", "total_expenses", "members", "expenses")
+GROUP_VIEWS = {
+    "summary": ("id", "name", "base_currency", "created_at", "member_count", "expense_count", "total_expenses"),
+    "full": ("id", "name", "base_currency", "created_at", "members", "expenses", "total_expenses"),
+}
+
+def get_group_fields(db: Session, fields, skip: int = 0, limit: int = 100, group_id: int = None) -> List[Dict]:
+    """Groups with only ``fields`` loaded.
+
+    Columns and counts come from one query (counts and totals as correlated
+    subqueries); members and expenses, when asked for, take one more query
+    each for the whole page.
+    """
+    Group = models.Group
+    fields = set(fields) | {"id"}
+    
+    columns = [Group.id] + [getattr(Group, name) for name in ("name", "base_currency", "created_at") if name in fields]
+    if "member_count" in fields:
+        columns.append(
+            select(func.count(models.GroupMember.id))
+            .where(models.GroupMember.group_id == Group.id)
+            .scalar_subquery().label("member_count")
+        )
+    if "expense_count" in fields:
+        columns.append(
+            select(func.count(models.Expense.id))
+            .where(models.Expense.group_id == Group.id)
+            .scalar_subquery().label("expense_count")
+        )
+    if "total_expenses" in fields and "expenses" not in fields:
+        # Monthly rollups hold every expense already converted to the base currency
+        Rollup = models.ExpenseRollup
+        columns.append(
+            select(func.round(func.coalesce(func.sum(Rollup.paid), 0.0), 2))
+            .where((Rollup.group_id == Group.id) & (Rollup.period == "month"))
+            .scalar_subquery().label("total_expenses")
+        )
+    
+    query = db.query(*columns)
+    if group_id is not None:
+        query = query.filter(Group.id == group_id)
+    groups = [dict(row._mapping) for row in query.order_by(Group.id).offset(skip).limit(limit)]
+    group_ids = [group["id"] for group in groups]
+    
+    if "members" in fields:
+        members = defaultdict(list)
+        if group_ids:
+            for member in (
+                db.query(models.GroupMember)
+                .options(joinedload(models.GroupMember.user))
+                .filter(models.GroupMember.group_id.in_(group_ids))
+                .order_by(models.GroupMember.id)
+            ):
+                members[member.group_id].append(member)
+        for group in groups:
+            group["members"] = members[group["id"]]
+    
+    if "expenses" in fields:
+        expenses = defaultdict(list)
+        if group_ids:
+            for expense in (
+                db.query(models.Expense)
+                .options(
+                    joinedload(models.Expense.payer),
+                    selectinload(models.Expense.splits).joinedload(models.ExpenseSplit.user)
+                )
+                .filter(models.Expense.group_id.in_(group_ids))
+                .order_by(models.Expense.id)
+            ):
+                expenses[expense.group_id].append(expense)
+        for group in groups:
+            group["expenses"] = expenses[group["id"]]
+            if "total_expenses" in fields:
+                # The base currency amounts stored at write time, as the rollups sum
+                group["total_expenses"] = sum(
+                    split_engine.to_cents(expense.base_amount) for expense in group["expenses"]
+                ) / 100
+    
+    return groups
+
+def normalize_group(group: Dict) -> Dict:
+    """A get_group_fields group with every referenced user listed once
+    under ``users``, for schemas.NormalizedGroup"""
+    users = {}
+    for member in group.get("members") or []:
+        users[member.user_id] = member.user
+    for expense in group.get("expenses") or []:
+        users[expense.paid_by] = expense.payer
+        for split in expense.splits:
+            users[split.user_id] = split.user
+    return {**group, "users": users}
+
+def _check_members(membership: GroupMembership, expense: schemas.ExpenseCreate, computed: List):
+    if expense.currency not in (None, membership.base_currency) and not fx.is_known(expense.currency):
+        raise ValueError(f"No exchange rates for {expense.currency}")
+    if expense.paid_by not in membership:
+        raise ValueError(f"User {expense.paid_by} is not a member of this group")
+    outsiders = [user_id for user_id, _, _ in computed if user_id not in membership]
+    if outsiders:
+        raise ValueError(f"Users {outsiders} are not members of this group")
+
+def _base_cents(membership: GroupMembership, expense: schemas.ExpenseCreate, computed: List, created_at: datetime):
+    """(total, split shares) in cents of the group's base currency; the
+    shares add up to the total (see fx.convert_split)"""
+    return fx.convert_split(
+        expense.amount,
+        [amount for _, amount, _ in computed],
+        expense.currency or membership.base_currency,
+        membership.base_currency,
+        created_at
+    )
+
+def _balance_deltas(expenses) -> Dict[int, int]:
+    """Cents (of the base currency) each user's group balance moves by for
+    (expense, computed splits, base cents) triples"""
+    deltas = defaultdict(int)
+    for expense, expense_splits, (total, shares) in expenses:
+        deltas[expense.paid_by] += total
+        for (user_id, _, _), cents in zip(expense_splits, shares):
+            deltas[user_id] -= cents
+    return deltas
+
+def _commit_balance_write(db: Session, group_id: int, deltas: Dict[int, int]):
+    """Commit a write that moves balances by ``deltas`` cents, keeping the
+    in-memory group state consistent with it (see group_state)"""
+    group_state.begin_write(group_id)
+    try:
+        db.commit()
+    except Exception:
+        group_state.abort_write(group_id)
+        raise
+    group_state.apply(group_id, deltas)
+
+def _record_rollups(db: Session, group_id: int, expenses, created_at: datetime):
+    """Add (expense, computed splits, base cents) triples to the analytics rollups"""
+    deltas = analytics.new_deltas()
+    for expense, expense_splits, (total, shares) in expenses:
+        analytics.add_payment(deltas, group_id, expense.paid_by, created_at, total / 100)
+        for (user_id, _, _), cents in zip(expense_splits, shares):
+            analytics.add_share(deltas, group_id, user_id, created_at, cents / 100)
+    analytics.apply_deltas(db, deltas)
+
+@single_writer
+def create_expense(
+    db: Session,
+    group_id: int,
+    expense: schemas.ExpenseCreate,
+    membership: GroupMembership = None,
+    idempotency_key: str = None
+):
+    """Insert an expense and its splits in one transaction.
+
+    Raises ValueError if the split is invalid or the payer or a split user
+    is not a group member.
+    """
+    if membership is None:
+        membership = get_group_membership(db, group_id)
+    computed = split_engine.compute_splits(expense, membership.member_ids)
+    _check_members(membership, expense, computed)
+    now = datetime.utcnow()
+    total, shares = _base_cents(membership, expense, computed, now)
     
     db_expense = models.Expense(
         description=expense.description,
         amount=expense.amount,
+        currency=expense.currency or membership.base_currency,
+        base_amount=total / 100,
         paid_by=expense.paid_by,
         group_id=group_id,
-        split_type=split_type_value  # Store as string
+        split_type=expense.split_type.value,
+        created_at=now
     )
     db.add(db_expense)
-    db.commit()
-    db.refresh(db_expense)
+    db.flush()
     
-    # Calculate splits
-    group = get_group(db, group_id)
-    member_count = len(group.members)
-    
-    if split_type_value == "equal":
-        split_amount = expense.amount / member_count
-        for member in group.members:
-            db_split = models.ExpenseSplit(
-                expense_id=db_expense.id,
-                user_id=member.user_id,
-                amount=split_amount,
-                percentage=100.0 / member_count
-            )
-            db.add(db_split)
-    else:  # PERCENTAGE
-        for split in expense.splits:
-            split_amount = (expense.amount * split.percentage) / 100
-            db_split = models.ExpenseSplit(
-                expense_id=db_expense.id,
-                user_id=split.user_id,
-                amount=split_amount,
-                percentage=split.percentage
-            )
-            db.add(db_split)
+    db.execute(models.ExpenseSplit.__table__.insert(), [
+        {
+            "expense_id": db_expense.id, "group_id": group_id, "user_id": user_id,
+            "amount": amount, "base_amount": cents / 100, "percentage": percentage
+        }
+        for (user_id, amount, percentage), cents in zip(computed, shares)
+    ])
+    converted = [(expense, computed, (total, shares))]
+    _record_rollups(db, group_id, converted, now)
+    if idempotency_key is not None:
+        db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == idempotency_key
+        ).update({"expense_id": db_expense.id}, synchronize_session=False)
+    _commit_balance_write(db, group_id, _balance_deltas(converted))
+    db.refresh(db_expense)
     
-    db.commit()
+    debts.invalidate({expense.paid_by, *(user_id for user_id, _, _ in computed)})
+    _update_chat_stats(expense=_recent_expense_row(db_expense, membership.name))
     return db_expense
 
-def get_group_balances(db: Session, group_id: int):
-    # Get all expenses and splits for the group
-    expenses = db.query(models.Expense).filter(models.Expense.group_id == group_id).all()
+def _request_hash(group_id: int, expense: schemas.ExpenseCreate) -> str:
+    return hashlib.sha256(f"{group_id}:{expense.model_dump_json()}".encode()).hexdigest()
+
+@single_writer
+def _find_idempotency_key(db: Session, key: str):
+    row = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).first()
+    if row is not None and row.created_at < datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_KEY_TTL):
+        db.delete(row)
+        db.commit()
+        return None
+    return row
+
+def _replay(db: Session, row, request_hash: str):
+    if row.request_hash != request_hash:
+        raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+    if row.expense_id is None:
+        raise IdempotencyKeyInProgress("A request with this Idempotency-Key is still in progress")
+    return db.query(models.Expense).filter(
+        models.Expense.id == row.expense_id,
+        models.Expense.group_id == row.group_id
+    ).first()
+
+@single_writer
+def _purge_idempotency_keys(db: Session):
+    now = time.monotonic()
+    if now < _idempotency_purge["next_at"]:
+        return
+    _idempotency_purge["next_at"] = now + IDEMPOTENCY_PURGE_INTERVAL
+    cutoff = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+
+@single_writer
+def create_expense_once(
+    db: Session,
+    group_id: int,
+    expense: schemas.ExpenseCreate,
+    idempotency_key: str,
+    membership: GroupMembership = None
+):
+    """create_expense guarded by an Idempotency-Key.
+
+    Returns (expense, replayed). A retry returns the expense created by
+    the first request without writing anything. The key is claimed with
+    INSERT ... ON CONFLICT DO NOTHING in the same transaction as the
+    expense, so of two simultaneous duplicates only one inserts; the other
+    waits on the key's unique index and then replays the winner's result.
+    """
+    request_hash = _request_hash(group_id, expense)
+    existing = _find_idempotency_key(db, idempotency_key)
+    if existing is not None:
+        return _replay(db, existing, request_hash), True
     
-    # Calculate balances
-    user_balances = defaultdict(float)  # net balance for each user
-    user_names = {}
+    claimed = db.execute(
+        _insert(db, models.IdempotencyKey).values(
+            key=idempotency_key,
+            request_hash=request_hash,
+            group_id=group_id,
+            created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=[models.IdempotencyKey.key])
+        .returning(models.IdempotencyKey.key)
+    ).first()
+    if claimed is None:
+        db.rollback()
+        existing = _find_idempotency_key(db, idempotency_key)
+        if existing is None:
+            raise IdempotencyKeyInProgress("A request with this Idempotency-Key is still in progress")
+        return _replay(db, existing, request_hash), True
     
-    for expense in expenses:
-        # Payer gets positive balance
-        user_balances[expense.paid_by] += expense.amount
-        user_names[expense.paid_by] = expense.payer.name
-        
-        # Each split participant gets negative balance
-        for split in expense.splits:
-            user_balances[split.user_id] -= split.amount
-            user_names[split.user_id] = split.user.name
+    db_expense = create_expense(db, group_id, expense, membership, idempotency_key=idempotency_key)
+    _purge_idempotency_keys(db)
+    return db_expense, False
+
+@single_writer
+def create_expenses(db: Session, group_id: int, expenses: List[schemas.ExpenseCreate], membership: GroupMembership = None):
+    """Bulk import: all expenses or none, splits computed in one batch"""
+    if membership is None:
+        membership = get_group_membership(db, group_id)
+    if not expenses:
+        return []
+    computed = split_engine.compute_batch(expenses, membership.member_ids)
+    for position, (expense, expense_splits) in enumerate(zip(expenses, computed)):
+        try:
+            _check_members(membership, expense, expense_splits)
+        except ValueError as e:
+            raise ValueError(f"Expense {position}: {e}") from None
+    
+    now = datetime.utcnow()
+    converted = [
+        (expense, expense_splits, _base_cents(membership, expense, expense_splits, now))
+        for expense, expense_splits in zip(expenses, computed)
+    ]
+    expense_ids = db.execute(
+        insert(models.Expense).returning(models.Expense.id, sort_by_parameter_order=True),
+        [
+            {
+                "description": expense.description,
+                "amount": expense.amount,
+                "currency": expense.currency or membership.base_currency,
+                "base_amount": total / 100,
+                "paid_by": expense.paid_by,
+                "group_id": group_id,
+                "split_type": expense.split_type.value,
+                "created_at": now
+            }
+            for expense, _, (total, _) in converted
+        ]
+    ).scalars().all()
+    
+    db.execute(models.ExpenseSplit.__table__.insert(), [
+        {
+            "expense_id": expense_id, "group_id": group_id, "user_id": user_id,
+            "amount": amount, "base_amount": cents / 100, "percentage": percentage
+        }
+        for expense_id, (_, expense_splits, (_, shares)) in zip(expense_ids, converted)
+        for (user_id, amount, percentage), cents in zip(expense_splits, shares)
+    ])
+    _record_rollups(db, group_id, converted, now)
+    _commit_balance_write(db, group_id, _balance_deltas(converted))
+    debts.invalidate({
+        user_id
+        for expense, expense_splits, _ in converted
+        for user_id in (expense.paid_by, *(split_user for split_user, _, _ in expense_splits))
+    })
+    _invalidate_chat_stats()
+    
+    return (
+        db.query(models.Expense)
+        .filter(models.Expense.id.in_(expense_ids))
+        .order_by(models.Expense.id)
+        .all()
+    )
+
+@single_writer
+def create_settlements(
+    db: Session,
+    group_id: int,
+    settlements: List[schemas.SettlementCreate],
+    membership: GroupMembership = None
+):
+    """Record repayments with one multi-row INSERT, all or nothing"""
+    if membership is None:
+        membership = get_group_membership(db, group_id)
+    outsiders = sorted({
+        user_id
+        for settlement in settlements
+        for user_id in (settlement.from_user_id, settlement.to_user_id)
+        if user_id not in membership
+    })
+    if outsiders:
+        raise ValueError(f"Users {outsiders} are not members of this group")
+    if not settlements:
+        return []
+    
+    now = datetime.utcnow()
+    created = db.scalars(
+        insert(models.Settlement).returning(models.Settlement, sort_by_parameter_order=True),
+        [
+            {
+                "group_id": group_id,
+                "from_user_id": settlement.from_user_id,
+                "to_user_id": settlement.to_user_id,
+                "amount": settlement.amount,
+                "created_at": now
+            }
+            for settlement in settlements
+        ]
+    ).all()
+    
+    deltas = defaultdict(int)
+    for settlement in settlements:
+        deltas[settlement.from_user_id] += split_engine.to_cents(settlement.amount)
+        deltas[settlement.to_user_id] -= split_engine.to_cents(settlement.amount)
+    _commit_balance_write(db, group_id, deltas)
+    debts.invalidate(deltas.keys())
+    return created
+
+@single_writer
+def settle_group(db: Session, group_id: int, membership: GroupMembership = None):
+    """Settle every balance in the group with the fewest transfers.
+
+    The plan is computed and inserted in one transaction holding the
+    group's row lock (the database write lock on SQLite), so a concurrent
+    settle-all, from any worker, waits and then finds the balances
+    already settled.
+    """
+    lock_for_write(db)
+    db.query(models.Group.id).filter(models.Group.id == group_id).with_for_update().first()
+    balances = {user_id: int(round(balance * 100)) for user_id, balance in get_group_net_balances(db, group_id).items()}
+    plan = [
+        schemas.SettlementCreate(from_user_id=debtor, to_user_id=creditor, amount=cents / 100)
+        for debtor, creditor, cents in debts.simplify(balances)
+    ]
+    if not plan:
+        db.rollback()  # release the row lock
+        return []
+    return create_settlements(db, group_id, plan, membership)
+
+def get_settlements(db: Session, group_id: int, skip: int = 0, limit: int = 100):
+    return (
+        db.query(models.Settlement)
+        .filter(models.Settlement.group_id == group_id)
+        .order_by(models.Settlement.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+def get_group_net_balances(db: Session, group_id: int) -> Dict[int, float]:
+    """Net balance per user in a group, in its base currency, aggregated in SQL.
+
+    Sums the base-currency amounts stored with each expense and split, in
+    which an expense's splits add up to its total, so the balances of a
+    group always add up to zero. All queries filter on group_id, so on
+    partitioned tables they only touch the group's partition.
+    """
+    Expense, Split = models.Expense, models.ExpenseSplit
+    user_balances = defaultdict(int)  # cents
+    
+    # Payer gets positive balance
+    paid = (
+        db.query(Expense.paid_by, func.sum(Expense.base_amount))
+        .filter(Expense.group_id == group_id)
+        .group_by(Expense.paid_by)
+    )
+    for user_id, amount in paid:
+        user_balances[user_id] += split_engine.to_cents(amount)
+    
+    # Each split participant gets negative balance
+    owed = (
+        db.query(Split.user_id, func.sum(Split.base_amount))
+        .filter(Split.group_id == group_id)
+        .group_by(Split.user_id)
+    )
+    for user_id, amount in owed:
+        user_balances[user_id] -= split_engine.to_cents(amount)
+    
+    # Repayments (in the base currency) move balance from the receiver to the payer
+    settled = (
+        db.query(models.Settlement.from_user_id, models.Settlement.to_user_id, func.sum(models.Settlement.amount))
+        .filter(models.Settlement.group_id == group_id)
+        .group_by(models.Settlement.from_user_id, models.Settlement.to_user_id)
+    )
+    for from_user_id, to_user_id, amount in settled:
+        user_balances[from_user_id] += split_engine.to_cents(amount)
+        user_balances[to_user_id] -= split_engine.to_cents(amount)
     
-    # Convert to balance format
+    return {user_id: cents / 100 for user_id, cents in sorted(user_balances.items())}
+
+def get_user_names(db: Session, user_ids) -> Dict[int, str]:
+    if not user_ids:
+        return {}
+    return dict(db.query(models.User.id, models.User.name).filter(models.User.id.in_(list(user_ids))).all())
+
+def get_group_balances(db: Session, group_id: int):
+    if group_state.ENABLED:
+        state = group_state.get(group_id)
+        if state is None:
+            seen_version = group_state.version(group_id)
+            user_balances = get_group_net_balances(db, group_id)
+            state = group_state.put(group_id, user_balances, get_user_names(db, user_balances.keys()), seen_version)
+        return build_balances(state.net_balances(), state.user_names())
+    
+    user_balances = get_group_net_balances(db, group_id)
+    user_names = get_user_names(db, user_balances.keys())
+    return build_balances(user_balances, user_names)
+
+def get_cached_group_balances(group_id: int):
+    """Balances of a group held by the in-process group state, else None"""
+    state = group_state.get(group_id)
+    if state is None:
+        return None
+    return build_balances(state.net_balances(), state.user_names())
+
+def build_balances(user_balances: Dict[int, float], user_names: Dict[int, str]) -> List[schemas.Balance]:
+    """Turn net balances into who-owes-whom entries"""
     balances = []
     for user_id, net_balance in user_balances.items():
         owes_to = []
@@ -175,3 +781,215 @@ def get_user_balances(db: Session, user_id: int):
         groups=group_balances,
         total_net_balance=round(total_net_balance, 2)
     )
+
+def normalize_user_balance(balance: schemas.UserBalance) -> Dict:
+    """A get_user_balances result with user names moved to ``users``"""
+    users = {balance.user_id: balance.user_name}
+    groups = []
+    for group in balance.groups:
+        entries = {}
+        for key in ("owes_to", "owed_by"):
+            entries[key] = []
+            for entry in group[key]:
+                users[entry["user_id"]] = entry["user_name"]
+                entries[key].append({"user_id": entry["user_id"], "amount": entry["amount"]})
+        groups.append({**group, **entries})
+    return {
+        "user_id": balance.user_id,
+        "groups": groups,
+        "total_net_balance": balance.total_net_balance,
+        "users": users
+    }
+
+def _recent_expense_row(expense, group_name: str) -> Dict:
+    return {
+        "id": expense.id,
+        "description": expense.description,
+        "amount": expense.amount,
+        "currency": expense.currency,
+        "paid_by": expense.payer.name,
+        "paid_by_id": expense.paid_by,
+        "split_type": expense.split_type,
+        "created_at": expense.created_at.isoformat(),
+        "group_name": group_name
+    }
+
+def _update_chat_stats(users: int = 0, groups: int = 0, expense: Dict = None):
+    """Apply a write to the cached stats instead of recomputing them"""
+    with _chat_stats_lock:
+        stats = _chat_stats_cache["stats"]
+        if stats is None:
+            return
+        stats["total_users"] += users
+        stats["total_groups"] += groups
+        if expense is not None:
+            stats["total_expenses"] = round(stats["total_expenses"] + fx.convert(
+                expense["amount"], expense["currency"], fx.FX_BASE_CURRENCY, expense["created_at"]
+            ), 2)
+            stats["recent_expenses"] = [expense] + stats["recent_expenses"][:4]
+
+def _invalidate_chat_stats():
+    with _chat_stats_lock:
+        _chat_stats_cache["stats"] = None
+
+def compute_chat_stats(db: Session) -> Dict:
+    """Aggregate counters and the five most recent expenses in SQL"""
+    total_users = db.query(func.count(models.User.id)).scalar()
+    total_groups = db.query(func.count(models.Group.id)).scalar()
+    # Total in FX_BASE_CURRENCY: summed per currency and day, then converted
+    currency = func.coalesce(models.Expense.currency, models.Group.base_currency)
+    day = case((currency == fx.FX_BASE_CURRENCY, None), else_=func.date(models.Expense.created_at))
+    sums = (
+        db.query(literal_column("0"), currency, day, func.sum(models.Expense.amount))
+        .join(models.Group, models.Group.id == models.Expense.group_id)
+        .group_by(currency, day)
+    )
+    total_expenses = fx.convert_totals(sums, fx.FX_BASE_CURRENCY).get(0, 0.0)
+    
+    recent = (
+        db.query(
+            models.Expense.id,
+            models.Expense.description,
+            models.Expense.amount,
+            func.coalesce(models.Expense.currency, models.Group.base_currency).label("currency"),
+            models.Expense.paid_by,
+            models.Expense.split_type,
+            models.Expense.created_at,
+            models.User.name.label("payer_name"),
+            models.Group.name.label("group_name"),
+        )
+        .join(models.User, models.User.id == models.Expense.paid_by)
+        .join(models.Group, models.Group.id == models.Expense.group_id)
+        .order_by(models.Expense.created_at.desc())
+        .limit(5)
+        .all()
+    )
+    
+    return {
+        "total_users": total_users,
+        "total_groups": total_groups,
+        "total_expenses": round(total_expenses, 2),
+        "currency": fx.FX_BASE_CURRENCY,
+        "recent_expenses": [
+            {
+                "id": row.id,
+                "description": row.description,
+                "amount": row.amount,
+                "currency": row.currency,
+                "paid_by": row.payer_name,
+                "paid_by_id": row.paid_by,
+                "split_type": row.split_type,
+                "created_at": row.created_at.isoformat(),
+                "group_name": row.group_name
+            }
+            for row in recent
+        ]
+    }
+
+def get_chat_stats(db: Session) -> Dict:
+    """Return the cached stats, recomputing them once the TTL has expired"""
+    with _chat_stats_lock:
+        stats = _chat_stats_cache["stats"]
+        if stats is not None and time.monotonic() < _chat_stats_cache["expires_at"]:
+            return dict(stats)
+    
+    stats = compute_chat_stats(db)
+    with _chat_stats_lock:
+        _chat_stats_cache["stats"] = stats
+        _chat_stats_cache["expires_at"] = time.monotonic() + CHAT_STATS_TTL
+        return dict(stats)
+
+def _fts5_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every word, as a prefix"""
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"*' for word in words)
+
+def _search_backend(db: Session) -> str:
+    """Search implementation: postgresql (tsvector and trigrams), sqlite (FTS5) or like"""
+    dialect = db.get_bind().dialect.name
+    return dialect if dialect in ("postgresql", "sqlite") else "like"
+
+def search_expenses(
+    db: Session,
+    q: str,
+    group_id: int = None,
+    user_id: int = None,
+    date_from=None,
+    date_to=None,
+    skip: int = 0,
+    limit: int = 20
+) -> Dict:
+    """Expenses whose description matches ``q``, best matches first.
+
+    PostgreSQL ranks full-text matches and fuzzy (trigram) matches together;
+    the fuzzy match compares ``q`` with the closest part of the description
+    (word_similarity), so a short query still finds a long description.
+    SQLite uses its FTS5 index; anything else falls back to LIKE.
+    """
+    Expense = models.Expense
+    backend = _search_backend(db)
+    
+    query = (
+        db.query(
+            Expense.id, Expense.description, Expense.amount,
+            func.coalesce(Expense.currency, models.Group.base_currency).label("currency"), Expense.paid_by,
+            Expense.group_id, Expense.split_type, Expense.created_at,
+            models.User.name.label("payer_name"), models.Group.name.label("group_name")
+        )
+        .join(models.User, models.User.id == Expense.paid_by)
+        .join(models.Group, models.Group.id == Expense.group_id)
+    )
+    
+    if backend == "postgresql":
+        vector = func.to_tsvector("english", Expense.description)
+        ts_query = func.websearch_to_tsquery("english", q)
+        rank = func.ts_rank(vector, ts_query) + func.word_similarity(q, Expense.description)
+        # q <% description is served by the gin_trgm_ops index
+        query = query.filter(or_(vector.op("@@")(ts_query), literal(q).op("<%")(Expense.description)))
+    elif backend == "sqlite":
+        match = _fts5_query(q)
+        if not match:
+            return {"total": 0, "items": []}
+        fts_table = table("expenses_fts", column("rowid", Integer))
+        fts = (
+            select(fts_table.c.rowid.label("id"), literal_column("bm25(expenses_fts)", Float).label("score"))
+            .where(literal_column("expenses_fts").op("MATCH")(match))
+            .subquery()
+        )
+        query = query.join(fts, fts.c.id == Expense.id)
+        rank = -fts.c.score  # bm25: lower is better
+    else:
+        query = query.filter(Expense.description.ilike(f"%{q}%"))
+        rank = Expense.created_at
+    
+    if group_id is not None:
+        query = query.filter(Expense.group_id == group_id)
+    if user_id is not None:
+        involved = select(models.ExpenseSplit.expense_id).where(models.ExpenseSplit.user_id == user_id)
+        query = query.filter(or_(Expense.paid_by == user_id, Expense.id.in_(involved)))
+    if date_from is not None:
+        query = query.filter(Expense.created_at >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.filter(Expense.created_at < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    
+    total = query.count()
+    rows = query.add_columns(rank.label("rank")).order_by(rank.desc(), Expense.created_at.desc()).offset(skip).limit(limit)
+    return {
+        "total": total,
+        "items": [
+            {
+                "id": row.id,
+                "description": row.description,
+                "amount": row.amount,
+                "currency": row.currency,
+                "paid_by": row.paid_by,
+                "payer_name": row.payer_name,
+                "group_id": row.group_id,
+                "group_name": row.group_name,
+                "split_type": row.split_type,
+                "created_at": row.created_at,
+                "rank": float(row.rank) if backend != "like" else 0.0
+            }
+            for row in rows
+        ]
+    }
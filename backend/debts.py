@@ -0,0 +1,279 @@
+"""Cross-group debt simplification.
+
+Every split someone else paid for is a debt edge from the split's user to
+the payer, and every settlement an edge from its receiver to its payer.
+The edges are summed per (debtor, creditor) pair in SQL, netted into one
+position per user, and the users are grouped into connected components
+with a disjoint set. Each component is settled on its own with
+a greedy plan: exact matches first, then the largest debtor pays the
+largest creditor. That takes at most n - 1 transfers for n users, usually
+far fewer.
+
+The graph is rebuilt from scratch at most every DEBT_GRAPH_TTL seconds,
+which picks up writes made by other workers. A write in this process only
+reloads the edges of the components its users belong to and patches them
+into the cached graph. Plans are cached per component, keyed by the
+component's balances, so a write in one circle of friends does not
+recompute the plans of the others.
+"""
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import case, func, or_
+
+import fx
+import models
+
+DEBT_GRAPH_TTL = float(os.getenv("DEBT_GRAPH_TTL", "30"))
+COMPONENT_CACHE_SIZE = int(os.getenv("DEBT_COMPONENT_CACHE_SIZE", "4096"))
+
+# (debtor, creditor, cents)
+Transfer = Tuple[int, int, int]
+
+_lock = threading.Lock()
+_graph = {"graph": None, "version": 0, "expires_at": 0.0, "dirty": set()}  # dirty: users written since
+_plans = OrderedDict()  # component balances -> transfers
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item: int) -> int:
+        parent = self.parent
+        if item not in parent:
+            parent[item] = item
+            self.size[item] = 1
+            return item
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]  # path halving
+            item = parent[item]
+        return item
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+
+def load_edges(db, user_ids: Iterable[int] = None) -> Dict[Tuple[int, int], int]:
+    """Total owed per (debtor, creditor) across all groups, in cents of
+    FX_BASE_CURRENCY, counting settlements as debts in the opposite direction.
+
+    With ``user_ids``, only the edges touching those users.
+    """
+    Expense, Split, Group = models.Expense, models.ExpenseSplit, models.Group
+    currency = Group.base_currency
+    day = case((currency == fx.FX_BASE_CURRENCY, None), else_=func.date(Expense.created_at))
+    rows = (
+        db.query(Split.user_id, Expense.paid_by, currency, day, func.sum(Split.base_amount))
+        .join(Expense, (Expense.id == Split.expense_id) & (Expense.group_id == Split.group_id))
+        .join(Group, Group.id == Expense.group_id)
+        .filter(Split.user_id != Expense.paid_by)
+        .group_by(Split.user_id, Expense.paid_by, currency, day)
+    )
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        rows = rows.filter(or_(Split.user_id.in_(user_ids), Expense.paid_by.in_(user_ids)))
+    edges = defaultdict(int)
+    for pair, amount in fx.convert_totals(
+        (((debtor, creditor), code, day, amount) for debtor, creditor, code, day, amount in rows),
+        fx.FX_BASE_CURRENCY
+    ).items():
+        edges[pair] += int(round(amount * 100))
+
+    # A repayment cancels that much of the payer's debt to the receiver
+    Settlement = models.Settlement
+    currency = Group.base_currency
+    day = case((currency == fx.FX_BASE_CURRENCY, None), else_=func.date(Settlement.created_at))
+    repaid = (
+        db.query(Settlement.from_user_id, Settlement.to_user_id, currency, day, func.sum(Settlement.amount))
+        .join(Group, Group.id == Settlement.group_id)
+        .group_by(Settlement.from_user_id, Settlement.to_user_id, currency, day)
+    )
+    if user_ids is not None:
+        repaid = repaid.filter(or_(Settlement.from_user_id.in_(user_ids), Settlement.to_user_id.in_(user_ids)))
+    for pair, amount in fx.convert_totals(
+        (((to_user_id, from_user_id), code, day, amount) for from_user_id, to_user_id, code, day, amount in repaid),
+        fx.FX_BASE_CURRENCY
+    ).items():
+        edges[pair] += int(round(amount * 100))
+    return edges
+
+
+def simplify(balances: Dict[int, int]) -> List[Transfer]:
+    """Transfers settling ``balances`` (cents, positive = is owed)"""
+    transfers = []
+
+    # Pair up debtors and creditors with exactly opposite positions first
+    creditors_by_amount = defaultdict(list)
+    for user_id, balance in balances.items():
+        if balance > 0:
+            creditors_by_amount[balance].append(user_id)
+    debtors = []
+    matched = set()
+    for user_id, balance in sorted(balances.items()):
+        if balance < 0:
+            candidates = creditors_by_amount.get(-balance)
+            if candidates:
+                creditor = candidates.pop()
+                matched.add(creditor)
+                transfers.append((user_id, creditor, -balance))
+            else:
+                debtors.append((balance, user_id))  # most negative pops first
+    creditors = [(-balance, user_id) for user_id, balance in balances.items() if balance > 0 and user_id not in matched]
+
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    while debtors and creditors:
+        debt, debtor = heapq.heappop(debtors)
+        credit, creditor = heapq.heappop(creditors)
+        amount = min(-debt, -credit)
+        transfers.append((debtor, creditor, amount))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor))
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor))
+    return transfers
+
+
+class DebtGraph:
+    """Net positions and connected components of the whole user graph"""
+
+    def __init__(self, edges: Dict[Tuple[int, int], int]):
+        self.balances = defaultdict(int)
+        self.members = defaultdict(list)  # root -> user ids
+        self.root = {}
+        self._add(edges)
+
+    def _add(self, edges: Dict[Tuple[int, int], int]):
+        components = DisjointSet()
+        for (debtor, creditor), cents in edges.items():
+            self.balances[debtor] -= cents
+            self.balances[creditor] += cents
+            components.union(debtor, creditor)
+        for user_id in components.parent:
+            root = components.find(user_id)
+            self.root[user_id] = root
+            self.members[root].append(user_id)
+
+    def affected(self, user_ids: Iterable[int]) -> Set[int]:
+        """``user_ids`` and everyone in their components"""
+        users = set(user_ids)
+        for user_id in list(users):
+            users.update(self.component(user_id))
+        return users
+
+    def patched(self, users: Set[int], edges: Dict[Tuple[int, int], int]) -> Optional["DebtGraph"]:
+        """A copy with the components of ``users`` (see ``affected``) rebuilt
+        from ``edges``, every edge touching them; the rest is shared.
+
+        None when an edge reaches outside ``users`` (another worker wrote
+        to a component this graph has not seen): rebuild it all instead.
+        """
+        if any(debtor not in users or creditor not in users for debtor, creditor in edges):
+            return None
+        graph = DebtGraph({})
+        graph.balances = self.balances.copy()
+        graph.root = dict(self.root)
+        graph.members = self.members.copy()
+        for user_id in users:
+            graph.balances.pop(user_id, None)
+            root = graph.root.pop(user_id, None)
+            if root is not None:
+                graph.members.pop(root, None)
+        graph._add(edges)
+        return graph
+
+    def component(self, user_id: int) -> List[int]:
+        root = self.root.get(user_id)
+        return self.members.get(root, []) if root is not None else []
+
+    def plan(self, user_id: int) -> List[Transfer]:
+        """Simplified transfers of the component containing ``user_id``"""
+        balances = {member: self.balances[member] for member in self.component(user_id)}
+        key = tuple(sorted((member, cents) for member, cents in balances.items() if cents))
+        with _lock:
+            if key in _plans:
+                _plans.move_to_end(key)
+                return _plans[key]
+
+        transfers = simplify(balances)
+        with _lock:
+            _plans[key] = transfers
+            while len(_plans) > COMPONENT_CACHE_SIZE:
+                _plans.popitem(last=False)
+        return transfers
+
+
+def get_graph(db) -> DebtGraph:
+    with _lock:
+        version = _graph["version"]
+        graph = _graph["graph"]
+        dirty = set(_graph["dirty"])
+        expires_at = _graph["expires_at"]
+    fresh = graph is not None and time.monotonic() < expires_at
+    if fresh and not dirty:
+        return graph
+
+    patched = None
+    if fresh:
+        users = graph.affected(dirty)
+        patched = graph.patched(users, load_edges(db, users))
+    if patched is None:
+        graph = DebtGraph(load_edges(db))
+        expires_at = time.monotonic() + DEBT_GRAPH_TTL
+    else:
+        graph = patched
+
+    with _lock:
+        # Keep it only if no write happened while it was being built
+        if _graph["version"] == version:
+            _graph.update(graph=graph, expires_at=expires_at, dirty=set())
+    return graph
+
+
+def invalidate(user_ids: Iterable[int] = None):
+    """Call after writes that change who owes whom, with the users whose
+    debts changed; without them the whole graph is rebuilt"""
+    with _lock:
+        _graph["version"] += 1
+        if user_ids is None:
+            _graph["expires_at"] = 0.0
+        else:
+            _graph["dirty"].update(user_ids)
+
+
+def user_debts(db, user_id: int) -> Dict:
+    """The user's net position and their transfers in the simplified plan"""
+    graph = get_graph(db)
+    transfers = [transfer for transfer in graph.plan(user_id) if user_id in transfer[:2]]
+
+    counterparts = {debtor if creditor == user_id else creditor for debtor, creditor, _ in transfers}
+    names = dict(
+        db.query(models.User.id, models.User.name).filter(models.User.id.in_(counterparts | {user_id})).all()
+    )
+
+    return {
+        "user_id": user_id,
+        "user_name": names.get(user_id, ""),
+        "net_balance": graph.balances.get(user_id, 0) / 100,
+        "owes_to": [
+            {"user_id": creditor, "user_name": names.get(creditor, ""), "amount": cents / 100}
+            for debtor, creditor, cents in transfers if debtor == user_id
+        ],
+        "owed_by": [
+            {"user_id": debtor, "user_name": names.get(debtor, ""), "amount": cents / 100}
+            for debtor, creditor, cents in transfers if creditor == user_id
+        ],
+        "component_size": len(graph.component(user_id)),
+    }
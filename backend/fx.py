@@ -0,0 +1,164 @@
+"""Currency conversion from a local rate table.
+
+Rates are read from FX_RATES_FILE, a CSV with ``date,currency,rate`` rows
+giving how many units of ``currency`` one unit of FX_BASE_CURRENCY buys on
+that date. Nothing is fetched over the network; the file is re-read when
+it changes on disk.
+
+A conversion on a given day uses the latest rate published on or before
+that day (or the earliest rate, for days before the table starts). Rates
+are cached per (currency, day) bucket, and ``convert_totals`` converts a
+batch of sums with one lookup per distinct bucket. ``convert_split``
+converts an expense and its splits so the splits still add up to the
+converted total to the cent.
+"""
+import bisect
+import csv
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+from splits import allocate, to_cents
+
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fx_rates.csv"))
+FX_BASE_CURRENCY = os.getenv("FX_BASE_CURRENCY", "USD")
+# How often to check the rate file for changes
+FX_RELOAD_INTERVAL = float(os.getenv("FX_RELOAD_INTERVAL", "60"))
+RATE_CACHE_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_table = {"dates": {}, "rates": {}, "mtime": None, "checked_at": 0.0}
+_rate_cache: Dict[Tuple[str, date], float] = {}
+
+
+class UnknownCurrency(ValueError):
+    pass
+
+
+def _load():
+    """(Re)load the rate file if it changed since the last check"""
+    now = time.monotonic()
+    if now < _table["checked_at"] + FX_RELOAD_INTERVAL:
+        return
+    _table["checked_at"] = now
+    try:
+        mtime = os.path.getmtime(FX_RATES_FILE)
+    except OSError:
+        if _table["mtime"] is not None:
+            logger.warning("FX rate file disappeared; keeping loaded rates", extra={"path": FX_RATES_FILE})
+        return
+    if mtime == _table["mtime"]:
+        return
+
+    series = defaultdict(list)
+    with open(FX_RATES_FILE, newline="") as f:
+        for row in csv.DictReader(f):
+            series[row["currency"].strip().upper()].append(
+                (date.fromisoformat(row["date"].strip()), float(row["rate"]))
+            )
+    dates, rates = {}, {}
+    for currency, points in series.items():
+        points.sort()
+        dates[currency] = [day for day, _ in points]
+        rates[currency] = [rate for _, rate in points]
+
+    _table.update(dates=dates, rates=rates, mtime=mtime)
+    _rate_cache.clear()
+    logger.info("FX rates loaded", extra={"path": FX_RATES_FILE, "currencies": len(dates)})
+
+
+def currencies() -> set:
+    with _lock:
+        _load()
+        return set(_table["dates"]) | {FX_BASE_CURRENCY}
+
+
+def is_known(currency: str) -> bool:
+    return currency in currencies()
+
+
+def rate(currency: str, day: date) -> float:
+    """Units of ``currency`` per unit of FX_BASE_CURRENCY on ``day``"""
+    if currency == FX_BASE_CURRENCY:
+        return 1.0
+    key = (currency, day)
+    with _lock:
+        _load()
+        cached = _rate_cache.get(key)
+        if cached is not None:
+            return cached
+        dates = _table["dates"].get(currency)
+        if not dates:
+            raise UnknownCurrency(f"No exchange rate for {currency}")
+        i = max(bisect.bisect_right(dates, day) - 1, 0)
+        value = _table["rates"][currency][i]
+        if len(_rate_cache) >= RATE_CACHE_SIZE:
+            _rate_cache.clear()
+        _rate_cache[key] = value
+        return value
+
+
+def _day(moment) -> date:
+    if moment is None:
+        return date.today()
+    if isinstance(moment, datetime):
+        return moment.date()
+    if isinstance(moment, str):
+        return date.fromisoformat(moment[:10])
+    return moment
+
+
+def convert(amount: float, currency: str, target: str, moment=None) -> float:
+    if currency == target:
+        return amount
+    day = _day(moment)
+    return amount * rate(target, day) / rate(currency, day)
+
+
+def convert_totals(rows: Iterable[Tuple[Hashable, str, object, float]], target: str) -> Dict[Hashable, float]:
+    """Sum ``(key, currency, day, amount)`` rows per key, in ``target``.
+
+    Rows are typically SQL sums grouped by key, currency and day, so each
+    distinct (currency, day) is looked up once for the whole batch.
+    """
+    factors = {}
+    totals = defaultdict(float)
+    for key, currency, moment, amount in rows:
+        if currency is None or currency == target:
+            totals[key] += amount
+            continue
+        day = _day(moment)
+        factor = factors.get((currency, day))
+        if factor is None:
+            factor = factors[(currency, day)] = rate(target, day) / rate(currency, day)
+        totals[key] += amount * factor
+    return totals
+
+
+def convert_split(amount: float, parts: Sequence[float], currency: str, target: str, moment=None) -> Tuple[int, List[int]]:
+    """``amount`` and the ``parts`` it was split into, in cents of ``target``.
+
+    The amount is converted once and spread over the parts in proportion
+    (largest remainder), rather than each part being converted and rounded
+    on its own, so the parts add up to the converted amount exactly.
+    """
+    cents = [to_cents(part) for part in parts]
+    if currency == target:
+        return to_cents(amount), cents
+    total = to_cents(convert(amount, currency, target, moment))
+    positive = [max(part, 0) for part in cents]
+    negative = [max(-part, 0) for part in cents]
+    if not any(negative):
+        return total, allocate(total, positive) if any(positive) else [0] * len(cents)
+    if not any(positive):
+        return total, allocate(total, negative)
+    # Parts of both signs: convert the positive ones together, and the
+    # negative ones take the rest of the total
+    credit = to_cents(convert(sum(positive) / 100, currency, target, moment))
+    return total, [a + b for a, b in zip(allocate(credit, positive), allocate(total - credit, negative))]
@@ -0,0 +1,162 @@
+"""In-process balances for hot groups (GROUP_STATE_ENABLED=true).
+
+Each cached group keeps its members' ids and net balances (in cents) in
+flat arrays, so serving /groups/{id}/balances builds no ORM objects and
+runs no queries. Groups are loaded on first read, updated in place by the
+expense and settlement write paths of this process, and evicted least
+recently used once the cache grows past GROUP_STATE_MEMORY_BUDGET bytes.
+Entries also expire after GROUP_STATE_TTL seconds so writes made by other
+workers show up.
+
+Writers call begin_write before committing and apply (or abort_write)
+after. A load that overlaps a write in any way is returned but not
+cached: it may or may not include the write, and apply cannot tell.
+"""
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import Dict, Optional
+
+ENABLED = os.getenv("GROUP_STATE_ENABLED", "false").lower() in ("1", "true", "yes")
+MEMORY_BUDGET = int(os.getenv("GROUP_STATE_MEMORY_BUDGET", str(32 * 1024 * 1024)))
+GROUP_STATE_TTL = float(os.getenv("GROUP_STATE_TTL", "10"))
+
+_lock = threading.Lock()
+_states = OrderedDict()  # group_id -> GroupState, least recently used first
+_versions = defaultdict(int)  # group_id -> bumped at the start and end of each write
+_writing = defaultdict(int)  # group_id -> writes between begin_write and apply
+_total_bytes = 0
+
+
+class GroupState:
+    """Net balances of one group's members, in cents"""
+
+    __slots__ = ("group_id", "user_ids", "balances", "names", "index", "nbytes", "expires_at")
+
+    def __init__(self, group_id: int, balances: Dict[int, float], names: Dict[int, str]):
+        user_ids = sorted(balances)
+        self.group_id = group_id
+        self.user_ids = array("q", user_ids)
+        self.balances = array("q", (int(round(balances[user_id] * 100)) for user_id in user_ids))
+        self.names = tuple(names.get(user_id, "") for user_id in user_ids)
+        self.index = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.nbytes = (
+            sys.getsizeof(self) + sys.getsizeof(self.user_ids) + sys.getsizeof(self.balances)
+            + sys.getsizeof(self.names) + sum(sys.getsizeof(name) for name in self.names)
+            + sys.getsizeof(self.index)
+        )
+        self.expires_at = time.monotonic() + GROUP_STATE_TTL
+
+    def apply(self, deltas: Dict[int, int]) -> bool:
+        """Add cents to members' balances; False if a user is not tracked yet"""
+        if any(user_id not in self.index for user_id in deltas):
+            return False
+        for user_id, cents in deltas.items():
+            self.balances[self.index[user_id]] += cents
+        return True
+
+    def net_balances(self) -> Dict[int, float]:
+        return {user_id: cents / 100 for user_id, cents in zip(self.user_ids, self.balances)}
+
+    def user_names(self) -> Dict[int, str]:
+        return dict(zip(self.user_ids, self.names))
+
+
+def version(group_id: int) -> int:
+    with _lock:
+        return _versions[group_id]
+
+
+def get(group_id: int) -> Optional[GroupState]:
+    if not ENABLED:
+        return None
+    with _lock:
+        state = _states.get(group_id)
+        if state is None:
+            return None
+        if time.monotonic() >= state.expires_at:
+            _drop(group_id)
+            return None
+        _states.move_to_end(group_id)
+        return state
+
+
+def put(group_id: int, balances: Dict[int, float], names: Dict[int, str], seen_version: int) -> GroupState:
+    """Cache a group loaded from the database when ``seen_version`` was current"""
+    global _total_bytes
+    state = GroupState(group_id, balances, names)
+    if not ENABLED:
+        return state
+    with _lock:
+        # A write started or finished while loading; the loaded balances may
+        # or may not include it
+        if _versions[group_id] != seen_version or _writing.get(group_id):
+            return state
+        _drop(group_id)
+        _states[group_id] = state
+        _total_bytes += state.nbytes
+        while _total_bytes > MEMORY_BUDGET and len(_states) > 1:
+            _drop(next(iter(_states)))
+    return state
+
+
+def rename(names: Dict[int, str]):
+    """Update user names (user id -> name) in the cached groups"""
+    if not ENABLED:
+        return
+    with _lock:
+        # Loads in flight may have read the old names; do not cache them
+        for group_id in _versions:
+            _versions[group_id] += 1
+        for state in _states.values():
+            if any(user_id in state.index for user_id in names):
+                state.names = tuple(names.get(user_id, name) for user_id, name in zip(state.user_ids, state.names))
+
+
+def begin_write(group_id: int):
+    """Call before committing a write that changes the group's balances"""
+    if not ENABLED:
+        return
+    with _lock:
+        _versions[group_id] += 1
+        _writing[group_id] += 1
+
+
+def apply(group_id: int, deltas: Dict[int, int]):
+    """Record a committed write: cents added to each user's balance.
+
+    Any cached state was loaded before begin_write (later loads are not
+    cached), so it does not include the write yet.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        _end_write(group_id)
+        state = _states.get(group_id)
+        if state is not None and not state.apply(deltas):
+            _drop(group_id)  # reloaded with the new member on next read
+
+
+def abort_write(group_id: int):
+    """Call instead of apply when the write was rolled back"""
+    if not ENABLED:
+        return
+    with _lock:
+        _end_write(group_id)
+
+
+def _end_write(group_id: int):
+    _versions[group_id] += 1
+    _writing[group_id] -= 1
+    if not _writing[group_id]:
+        del _writing[group_id]
+
+
+def _drop(group_id: int):
+    global _total_bytes
+    state = _states.pop(group_id, None)
+    if state is not None:
+        _total_bytes -= state.nbytes
@@ -0,0 +1,50 @@
+"""Gunicorn settings for the production server.
+
+Started by `SERVER_MODE=production python start.py`, or directly with
+`gunicorn -c gunicorn_conf.py main:app`.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+# On SIGTERM workers stop accepting connections and get this long to finish
+# in-flight requests before being killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = None
+errorlog = "-"
+
+# Split the database connection budget between workers. Must happen before
+# the app (and database.py) is preloaded.
+_max_connections = os.getenv("DB_MAX_CONNECTIONS")
+if _max_connections:
+    _per_worker = max(int(_max_connections) // workers, 2)
+    os.environ.setdefault("DB_POOL_SIZE", str(max(_per_worker // 2, 1)))
+    # Overflow takes what the pool (possibly set explicitly) leaves over
+    os.environ.setdefault("DB_MAX_OVERFLOW", str(max(_per_worker - int(os.environ["DB_POOL_SIZE"]), 0)))
+
+
+def when_ready(server):
+    # Everything allocated so far is shared with the workers; keep the
+    # collector from touching (and so copying) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections opened by the master must not be shared between processes
+    from database import all_engines
+    for engine in all_engines():
+        engine.dispose(close=False)
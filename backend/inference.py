@@ -0,0 +1,602 @@
+import requests
+import aiohttp
+import abc
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, AsyncIterator
+from metrics import record_llm_time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+HF_API_BASE_URL = "https://api-inference.huggingface.co/models"
+
+# "huggingface" (remote API) or "local" (llama.cpp model from LOCAL_MODEL_PATH)
+CHAT_BACKEND = os.getenv("CHAT_BACKEND", "huggingface")
+
+# Optional micro-batching: prompts with the same parameters arriving within
+# this window are sent upstream as one batched request (0 disables it)
+BATCH_WINDOW_MS = float(os.getenv("CHAT_BATCH_WINDOW_MS", "0"))
+MAX_BATCH_SIZE = int(os.getenv("CHAT_MAX_BATCH_SIZE", "8"))
+
+
+class InferenceUnavailable(Exception):
+    """Raised when no model could serve a request"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"No model available ({reason})")
+        # "loading", "rate_limited" or "error"
+        self.reason = reason
+
+
+class _InFlightCall:
+    """Result slot shared by every caller waiting on the same prompt"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def set_result(self, result: str):
+        self.result = result
+        self.done.set()
+
+    def set_error(self, error: Exception):
+        if not self.done.is_set():
+            self.error = error
+            self.done.set()
+
+    def wait(self) -> str:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class _PendingBatch:
+    def __init__(self, parameters: Dict[str, Any], options: Dict[str, Any]):
+        self.parameters = parameters
+        self.options = options
+        self.items = []
+
+
+class CircuitBreaker:
+    """Failure tracking for a single model.
+
+    After a failure the model is skipped until ``open_until``; consecutive
+    failures double the backoff up to ``max_backoff``.
+    """
+
+    def __init__(self, base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_reason = None
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_reason = None
+
+    def record_failure(self, reason: str, retry_after: float = None):
+        self.failures += 1
+        self.last_reason = reason
+        backoff = min(self.base_backoff * (2 ** (self.failures - 1)), self.max_backoff)
+        if retry_after is not None:
+            backoff = max(backoff, retry_after)
+        self.open_until = time.monotonic() + backoff
+
+
+class BackendError(Exception):
+    """A single model failed; ``reason`` feeds its circuit breaker"""
+
+    def __init__(self, reason: str, retry_after: float = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class InferenceBackend(abc.ABC):
+    """Runs generation for a model name.
+
+    ``generate`` takes a Hugging Face style payload (``inputs`` may be a
+    string or a list of strings) and returns Hugging Face style output.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def generate(self, model: str, payload: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def stream(self, model: str, prompt: str, parameters: Dict[str, Any]) -> AsyncIterator[str]:
+        raise NotImplementedError
+        yield
+
+
+class HuggingFaceBackend(InferenceBackend):
+    """Remote models on the Hugging Face inference API"""
+
+    name = "huggingface"
+
+    def __init__(self, api_key: str = None, timeout: float = 30):
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def model_url(self, model: str) -> str:
+        return f"{HF_API_BASE_URL}/{model}"
+
+    def headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def generate(self, model: str, payload: Dict[str, Any]) -> Any:
+        response = requests.post(
+            self.model_url(model),
+            headers=self.headers(),
+            json=payload,
+            timeout=self.timeout
+        )
+
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 503:
+            raise BackendError("loading", self.estimated_time(response))
+        if response.status_code == 429:
+            raise BackendError("rate_limited", self.retry_after(response))
+        logger.warning("Inference API error", extra={"model": model, "status_code": response.status_code})
+        raise BackendError("error")
+
+    async def stream(self, model: str, prompt: str, parameters: Dict[str, Any]) -> AsyncIterator[str]:
+        payload = {"inputs": prompt, "parameters": parameters, "stream": True}
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        # Leaving this block (including cancellation on client disconnect)
+        # closes the upstream connection, which stops the generation
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.post(self.model_url(model), headers=self.headers(), json=payload) as response:
+                if response.status == 503:
+                    raise BackendError("loading")
+                if response.status == 429:
+                    raise BackendError("rate_limited", self.retry_after(response))
+                if response.status != 200:
+                    raise BackendError("error")
+                
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    token = event.get("token", {})
+                    if token.get("special"):
+                        continue
+                    text = token.get("text", "")
+                    if text:
+                        yield text
+
+    @staticmethod
+    def retry_after(response) -> Optional[float]:
+        try:
+            return float(response.headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def estimated_time(response) -> Optional[float]:
+        """Loading time the API reports for a cold model"""
+        try:
+            return float(response.json().get("estimated_time"))
+        except Exception:
+            return None
+
+
+class LocalBackend(InferenceBackend):
+    """A quantized GGUF model run on the CPU with llama.cpp.
+
+    The model is loaded once per worker process on first use. Weights are
+    memory-mapped, so workers on the same host share one copy through the
+    page cache. The model name passed by the manager is ignored.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path: str, n_threads: int = None, n_ctx: int = 2048):
+        self.model_path = model_path
+        self.n_threads = n_threads
+        self.n_ctx = n_ctx
+        self.model = None
+        # llama.cpp contexts are not thread-safe
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.model is not None:
+            return self.model
+        if Llama is None:
+            raise RuntimeError("CHAT_BACKEND=local requires the llama-cpp-python package")
+        if not self.model_path or not os.path.exists(self.model_path):
+            raise RuntimeError(f"Local model not found: {self.model_path!r} (set LOCAL_MODEL_PATH)")
+        self.model = Llama(
+            model_path=self.model_path,
+            n_ctx=self.n_ctx,
+            n_threads=self.n_threads,
+            use_mmap=True,
+            verbose=False
+        )
+        return self.model
+
+    @staticmethod
+    def completion_kwargs(parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "max_tokens": parameters.get("max_new_tokens", 200),
+            "temperature": parameters.get("temperature", 0.7) if parameters.get("do_sample", True) else 0.0,
+            "top_p": parameters.get("top_p", 0.9)
+        }
+
+    def generate(self, model: str, payload: Dict[str, Any]) -> Any:
+        kwargs = self.completion_kwargs(payload.get("parameters", {}))
+        inputs = payload["inputs"]
+        prompts = inputs if isinstance(inputs, list) else [inputs]
+
+        results = []
+        with self.lock:
+            llm = self.load()
+            for prompt in prompts:
+                output = llm(prompt, **kwargs)
+                results.append([{"generated_text": output["choices"][0]["text"]}])
+
+        return results if isinstance(inputs, list) else results[0]
+
+    async def stream(self, model: str, prompt: str, parameters: Dict[str, Any]) -> AsyncIterator[str]:
+        kwargs = self.completion_kwargs(parameters)
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                with self.lock:
+                    for output in self.load()(prompt, stream=True, **kwargs):
+                        if cancelled.is_set():
+                            break
+                        chunks.put(output["choices"][0]["text"])
+            except Exception as e:
+                chunks.put(e)
+            chunks.put(None)
+
+        threading.Thread(target=run, daemon=True).start()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(chunks.get)
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            # Stop generating once the consumer goes away
+            cancelled.set()
+
+
+_local_backend = None
+
+
+def get_backend() -> InferenceBackend:
+    """Backend selected by CHAT_BACKEND ("huggingface" or "local")"""
+    global _local_backend
+    if CHAT_BACKEND == "local":
+        if _local_backend is None:
+            threads = os.getenv("LOCAL_MODEL_THREADS")
+            _local_backend = LocalBackend(
+                os.getenv("LOCAL_MODEL_PATH"),
+                n_threads=int(threads) if threads else None
+            )
+        return _local_backend
+    return HuggingFaceBackend(api_key=os.getenv("HUGGINGFACE_API_KEY"))
+
+
+class InferenceManager:
+    """Application-scoped access to an inference backend.
+
+    One instance is shared by every request in the worker, so model health,
+    rate limiting and the response cache survive across requests.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        backend: InferenceBackend = None,
+        min_request_interval: float = 0.0,
+        cache_size: int = 0,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+        max_batch_size: int = MAX_BATCH_SIZE
+    ):
+        self.models = list(models)
+        self.backend = backend or HuggingFaceBackend()
+        self.min_request_interval = min_request_interval
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self.lock = threading.Lock()
+        self.breakers = {model: CircuitBreaker() for model in self.models}
+        self.response_cache = OrderedDict()
+        self.next_request_time = 0.0
+        self.in_flight = {}
+        self.pending_batches = {}
+
+    def available_models(self) -> List[str]:
+        """Healthy models in preference order"""
+        now = time.monotonic()
+        with self.lock:
+            return [model for model in self.models if not self.breakers[model].is_open(now)]
+
+    def record_success(self, model: str):
+        with self.lock:
+            self.breakers[model].record_success()
+
+    def record_failure(self, model: str, reason: str, retry_after: float = None):
+        with self.lock:
+            self.breakers[model].record_failure(reason, retry_after)
+        logger.warning("Model unavailable, skipping it for now", extra={"model": model, "reason": reason})
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {
+                    "model": model,
+                    "available": not breaker.is_open(now),
+                    "failures": breaker.failures,
+                    "last_error": breaker.last_reason,
+                    "retry_in": round(max(breaker.open_until - now, 0.0), 1)
+                }
+                for model, breaker in self.breakers.items()
+            ]
+
+    def unavailable_reason(self) -> str:
+        with self.lock:
+            reasons = {breaker.last_reason for breaker in self.breakers.values()}
+        for reason in ("loading", "rate_limited"):
+            if reason in reasons:
+                return reason
+        return "error"
+
+    def wait_for_slot(self):
+        """Space upstream calls at least min_request_interval apart"""
+        if not self.min_request_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_request_time)
+            self.next_request_time = slot + self.min_request_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def cache_key(self, prompt: str, parameters: Dict[str, Any]) -> str:
+        return hashlib.sha256(f"{sorted(parameters.items())}{prompt}".encode("utf-8")).hexdigest()
+
+    def get_cached(self, key: str) -> Optional[str]:
+        if not self.cache_size:
+            return None
+        with self.lock:
+            if key in self.response_cache:
+                self.response_cache.move_to_end(key)
+                return self.response_cache[key]
+        return None
+
+    def put_cached(self, key: str, text: str):
+        if not self.cache_size:
+            return
+        with self.lock:
+            self.response_cache[key] = text
+            self.response_cache.move_to_end(key)
+            while len(self.response_cache) > self.cache_size:
+                self.response_cache.popitem(last=False)
+
+    def generate(self, prompt: str, parameters: Dict[str, Any], options: Dict[str, Any] = None) -> str:
+        """Generate text with the first healthy model.
+
+        Identical prompts already in flight share one upstream call, and with
+        a batch window configured compatible prompts are sent together.
+        """
+        key = self.cache_key(prompt, parameters)
+        cached = self.get_cached(key)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        try:
+            return self.generate_shared(key, prompt, parameters, options)
+        finally:
+            record_llm_time(time.perf_counter() - start)
+
+    def generate_shared(self, key: str, prompt: str, parameters: Dict[str, Any], options: Dict[str, Any] = None) -> str:
+        with self.lock:
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self.in_flight[key] = call
+
+        if not leader:
+            return call.wait()
+
+        try:
+            if self.batch_window > 0:
+                self.submit_to_batch(prompt, parameters, options, call)
+                text = call.wait()
+            else:
+                text = self.generate_one(prompt, parameters, options)
+                call.set_result(text)
+            self.put_cached(key, text)
+            return text
+        except Exception as e:
+            call.set_error(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def generate_one(self, prompt: str, parameters: Dict[str, Any], options: Dict[str, Any] = None) -> str:
+        payload = {"inputs": prompt, "parameters": parameters}
+        if options:
+            payload["options"] = options
+
+        text = self.parse_generated_text(self.post_to_models(payload))
+        if text is None:
+            raise InferenceUnavailable("error")
+        return text
+
+    def submit_to_batch(self, prompt: str, parameters: Dict[str, Any], options: Dict[str, Any], call: "_InFlightCall"):
+        """Queue a prompt for the next batched request.
+
+        The first prompt for a parameter set opens the batch and flushes it
+        once the window has passed; a full batch is flushed straight away.
+        """
+        batch_key = json.dumps([parameters, options], sort_keys=True)
+        with self.lock:
+            batch = self.pending_batches.get(batch_key)
+            opener = batch is None
+            if opener:
+                batch = _PendingBatch(parameters, options)
+                self.pending_batches[batch_key] = batch
+            batch.items.append((prompt, call))
+            full = len(batch.items) >= self.max_batch_size
+            if full:
+                del self.pending_batches[batch_key]
+
+        if full:
+            self.run_batch(batch)
+        elif opener:
+            time.sleep(self.batch_window)
+            with self.lock:
+                if self.pending_batches.get(batch_key) is not batch:
+                    return
+                del self.pending_batches[batch_key]
+            self.run_batch(batch)
+
+    def run_batch(self, batch: "_PendingBatch"):
+        prompts = [prompt for prompt, _ in batch.items]
+        if len(prompts) == 1:
+            payload = {"inputs": prompts[0], "parameters": batch.parameters}
+        else:
+            payload = {"inputs": prompts, "parameters": batch.parameters}
+        if batch.options:
+            payload["options"] = batch.options
+
+        try:
+            result = self.post_to_models(payload)
+            results = [result] if len(prompts) == 1 else result
+            if not isinstance(results, list) or len(results) != len(prompts):
+                raise InferenceUnavailable("error")
+        except Exception as e:
+            for _, call in batch.items:
+                call.set_error(e)
+            return
+
+        for (_, call), item in zip(batch.items, results):
+            text = self.parse_generated_text(item)
+            if text is None:
+                call.set_error(InferenceUnavailable("error"))
+            else:
+                call.set_result(text)
+
+    def post_to_models(self, payload: Dict[str, Any]) -> Any:
+        """Send the payload to the first healthy model and return its output.
+
+        Models that fail are skipped by later requests until their breaker
+        closes, instead of being retried by every caller.
+        """
+        models = self.available_models()
+        if not models:
+            raise InferenceUnavailable(self.unavailable_reason())
+
+        reason = "error"
+
+        for model in models:
+            self.wait_for_slot()
+            try:
+                result = self.backend.generate(model, payload)
+            except BackendError as e:
+                reason = e.reason
+                self.record_failure(model, e.reason, e.retry_after)
+                continue
+            except Exception as e:
+                logger.warning("Inference request failed", extra={"model": model, "error": str(e)})
+                self.record_failure(model, "error")
+                continue
+
+            self.record_success(model)
+            return result
+
+        raise InferenceUnavailable(reason)
+
+    async def stream(self, prompt: str, parameters: Dict[str, Any]) -> AsyncIterator[str]:
+        """Stream generated text from the first healthy model.
+
+        Failover only happens before the first chunk; raises
+        InferenceUnavailable if nothing could be streamed.
+        """
+        reason = "error"
+        for model in self.available_models():
+            streamed = False
+            try:
+                async for chunk in self.backend.stream(model, prompt, parameters):
+                    streamed = True
+                    yield chunk
+                self.record_success(model)
+                return
+            except BackendError as e:
+                reason = e.reason
+                self.record_failure(model, e.reason, e.retry_after)
+            except Exception as e:
+                logger.warning("Inference streaming failed", extra={"model": model, "error": str(e)})
+                self.record_failure(model, "error")
+            if streamed:
+                return
+
+        raise InferenceUnavailable(reason)
+
+    @staticmethod
+    def parse_generated_text(result: Any) -> Optional[str]:
+        if isinstance(result, list) and len(result) > 0:
+            return result[0].get("generated_text", "").strip()
+        if isinstance(result, dict) and "generated_text" in result:
+            return result["generated_text"].strip()
+        return None
+
+
+_managers: Dict[tuple, InferenceManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_inference_manager(models: List[str], **kwargs) -> InferenceManager:
+    """Return the shared manager for a model list, creating it on first use"""
+    key = tuple(models)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = InferenceManager(models, backend=get_backend(), **kwargs)
+            _managers[key] = manager
+        return manager
+
+
+def all_inference_managers() -> List[InferenceManager]:
+    with _managers_lock:
+        return list(_managers.values())
@@ -0,0 +1,234 @@
+"""Background jobs for work too slow for the request path.
+
+Jobs run on a small pool of JOB_WORKERS threads, separate from the
+threads serving requests, so at most that many heavy jobs (and database
+connections) are busy at once. At most JOB_QUEUE_SIZE jobs may wait in
+each worker process; submitting more raises JobQueueFull.
+
+With JOB_PROCESS_POOL=true, CPU-bound jobs (rollup rebuilds) run in a
+process pool instead, away from this worker's GIL. Jobs that warm
+in-process caches or use the shared inference managers always run on
+threads.
+
+Job status is kept in the ``jobs`` table, so any worker can answer
+GET /jobs/{id}. Finished jobs older than JOB_RETENTION seconds are
+purged as new ones are submitted.
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from database import single_writer
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_PROCESS_POOL = os.getenv("JOB_PROCESS_POOL", "false").lower() in ("1", "true", "yes")
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", "2"))
+# Seconds finished jobs are kept for status queries
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_lock = threading.Lock()
+_pending = 0
+_threads = None
+_processes = None
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _to_dict(job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "result": job.result,
+        "error": job.error,
+    }
+
+
+@single_writer
+def _update(job_id: str, **values):
+    import models
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _init_process():
+    # Connections inherited from the parent must not be shared
+    from database import all_engines
+    for db_engine in all_engines():
+        db_engine.dispose(close=False)
+
+
+def _executor(cpu_bound: bool):
+    global _threads, _processes
+    if cpu_bound and JOB_PROCESS_POOL:
+        if _processes is None:
+            _processes = ProcessPoolExecutor(max_workers=JOB_PROCESS_WORKERS, initializer=_init_process)
+        return _processes
+    if _threads is None:
+        _threads = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    return _threads
+
+
+def submit(kind: str, func: Callable, *args, cpu_bound: bool = False) -> Dict[str, Any]:
+    """Queue ``func(*args)``; its return value becomes the job's result.
+
+    ``func`` and its arguments must be picklable when ``cpu_bound``, and
+    the result must be JSON-serializable.
+    """
+    global _pending
+    with _lock:
+        if _pending >= JOB_QUEUE_SIZE:
+            raise JobQueueFull(f"{_pending} jobs are already waiting")
+        _pending += 1
+
+    try:
+        queued = _insert_job(kind)
+    except Exception:
+        with _lock:
+            _pending -= 1
+        raise
+
+    with _lock:
+        executor = _executor(cpu_bound)
+    future = executor.submit(_run, queued["id"], func, args)
+    future.add_done_callback(lambda done: _finish(queued["id"], done))
+    logger.info("Job queued", extra={"job_id": queued["id"], "kind": kind})
+    return queued
+
+
+@single_writer
+def _insert_job(kind: str) -> Dict[str, Any]:
+    """Record a queued job, purging finished ones past JOB_RETENTION"""
+    import models
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.query(models.Job).filter(
+            models.Job.status.in_(FINISHED),
+            models.Job.finished_at < now - timedelta(seconds=JOB_RETENTION),
+        ).delete(synchronize_session=False)
+        job = models.Job(id=uuid.uuid4().hex, kind=kind, status="queued", created_at=now)
+        db.add(job)
+        db.commit()
+        return _to_dict(job)
+    finally:
+        db.close()
+
+
+def _run(job_id: str, func: Callable, args):
+    """Run a job and record its outcome (in whichever process runs it)"""
+    _update(job_id, status="running", started_at=datetime.utcnow())
+    try:
+        result = func(*args)
+    except Exception as e:
+        logger.error("Job failed", extra={"job_id": job_id, "error": str(e)})
+        _update(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+        return
+    _update(job_id, status="succeeded", result=result, finished_at=datetime.utcnow())
+    logger.info("Job finished", extra={"job_id": job_id})
+
+
+def _finish(job_id: str, future):
+    global _pending
+    with _lock:
+        _pending -= 1
+    try:
+        if future.cancelled():
+            _update(job_id, status="cancelled", finished_at=datetime.utcnow())
+        elif future.exception() is not None:
+            # Recording the outcome itself failed (or the worker process died)
+            error = str(future.exception())
+            logger.error("Job failed", extra={"job_id": job_id, "error": error})
+            _update(job_id, status="failed", error=error, finished_at=datetime.utcnow())
+    except Exception as e:
+        logger.error("Failed to record job outcome", extra={"job_id": job_id, "error": str(e)})
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    import models
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        return _to_dict(job) if job is not None else None
+    finally:
+        db.close()
+
+
+def list_jobs(status: str = None, kind: str = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Most recent jobs first"""
+    import models
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        query = db.query(models.Job)
+        if status is not None:
+            query = query.filter(models.Job.status == status)
+        if kind is not None:
+            query = query.filter(models.Job.kind == kind)
+        return [_to_dict(job) for job in query.order_by(models.Job.created_at.desc()).limit(limit)]
+    finally:
+        db.close()
+
+
+def shutdown():
+    """Stop taking jobs; running ones are left to finish"""
+    global _threads, _processes
+    for executor in (_threads, _processes):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    _threads = _processes = None
+
+
+# Job functions. They open their own sessions: the request's session is
+# closed by the time they run.
+
+def rebuild_rollups() -> Dict[str, Any]:
+    import migrate
+    migrate.rebuild_rollups()
+    return {"rebuilt": "expense_rollups"}
+
+
+def rebuild_debt_graph() -> Dict[str, Any]:
+    """Rebuild the cross-group debt graph so the next read finds it cached"""
+    import debts
+    from database import SessionLocal
+    debts.invalidate()
+    db = SessionLocal()
+    try:
+        graph = debts.get_graph(db)
+        return {"users": len(graph.balances), "components": len(graph.members)}
+    finally:
+        db.close()
+
+
+def chat(query: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
+    from chatbot import ChatbotService
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        response = asyncio.run(ChatbotService(db).process_query(query, user_context))
+        return {"query": query, "response": response, "timestamp": datetime.utcnow().isoformat()}
+    finally:
+        db.close()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""HTTP load test for the Splitwise API.
+
+Load an already running server:
+
+    python loadtest.py --url http://localhost:8000 --duration 20 --concurrency 64
+
+Measure throughput scaling: start the production server with 1, 2, 4 ...
+workers (up to the number of cores) and load each one in turn:
+
+    python loadtest.py --scale --duration 15
+
+Run the same against embedded SQLite instead of Postgres (the schema is
+created before the first server starts), with 10% of requests creating
+expenses to exercise the write path:
+
+    DATABASE_URL=sqlite:////tmp/splitwise-load.db python loadtest.py --scale --write-ratio 0.1
+
+The target database needs at least one group; one is created if missing.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+ENDPOINTS = [
+    "/groups/{group_id}/balances",
+    "/groups/{group_id}",
+    "/chat/stats",
+    "/users/",
+]
+
+
+async def ensure_group(session: aiohttp.ClientSession, url: str) -> int:
+    async with session.get(f"{url}/groups/", params={"limit": 1}) as response:
+        groups = await response.json()
+    if groups:
+        return groups[0]["id"]
+
+    user_ids = []
+    for i in range(4):
+        async with session.post(f"{url}/users/", json={"name": f"Load {i}", "email": f"load{i}-{time.time()}@example.com"}) as response:
+            user_ids.append((await response.json())["id"])
+    async with session.post(f"{url}/groups/", json={"name": "Load test", "user_ids": user_ids}) as response:
+        group_id = (await response.json())["id"]
+    for i in range(20):
+        expense = {"description": f"Expense {i}", "amount": 10 + i, "paid_by": user_ids[i % 4], "split_type": "equal"}
+        async with session.post(f"{url}/groups/{group_id}/expenses", json=expense):
+            pass
+    return group_id
+
+
+async def run_load(url: str, duration: float, concurrency: int, write_ratio: float = 0.0):
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        group_id = await ensure_group(session, url)
+        paths = [endpoint.format(group_id=group_id) for endpoint in ENDPOINTS]
+        async with session.get(f"{url}/groups/{group_id}", params={"fields": "members"}) as response:
+            member_ids = [member["user_id"] for member in (await response.json())["members"]]
+        write_every = round(1 / write_ratio) if write_ratio > 0 else 0
+        deadline = time.perf_counter() + duration
+
+        async def client(n: int):
+            nonlocal errors
+            i = n
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                write = write_every and i % write_every == 0
+                i += 1
+                start = time.perf_counter()
+                try:
+                    if write:
+                        expense = {
+                            "description": f"Load {n}-{i}", "amount": 12.5,
+                            "paid_by": member_ids[i % len(member_ids)], "split_type": "equal"
+                        }
+                        request = session.post(f"{url}/groups/{group_id}/expenses", json=expense)
+                    else:
+                        request = session.get(url + path)
+                    async with request as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": count / elapsed,
+        "p50_ms": latencies[count // 2] * 1000 if count else 0.0,
+        "p99_ms": latencies[min(int(count * 0.99), count - 1)] * 1000 if count else 0.0,
+    }
+
+
+def print_result(label: str, result: dict):
+    print(
+        f"{label:>10}  {result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>7.1f} ms  "
+        f"p99 {result['p99_ms']:>7.1f} ms  errors {result['errors']}"
+    )
+
+
+def wait_until_healthy(url: str, timeout: float = 30) -> bool:
+    import urllib.request
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def scale(args):
+    cores = multiprocessing.cpu_count()
+    counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    url = f"http://127.0.0.1:{args.port}"
+    baseline = None
+
+    # Workers started straight from gunicorn do not migrate; do it once here
+    subprocess.run([sys.executable, "migrate.py"], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+
+    print(f"{cores} cores, {args.concurrency} concurrent clients, {args.duration}s per run")
+    for workers in counts:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(args.port))
+        server = subprocess.Popen(
+            ["gunicorn", "-c", "gunicorn_conf.py", "main:app"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            if not wait_until_healthy(url):
+                print(f"Server with {workers} workers did not start")
+                continue
+            result = asyncio.run(run_load(url, args.duration, args.concurrency, args.write_ratio))
+            baseline = baseline or result["rps"]
+            print_result(f"{workers} worker{'s' if workers > 1 else ''}", result)
+            print(f"{'':>10}  speedup x{result['rps'] / baseline:.2f}")
+        finally:
+            # SIGTERM: the graceful shutdown path used in production
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--write-ratio", type=float, default=0.0, help="fraction of requests that create an expense")
+    parser.add_argument("--scale", action="store_true", help="start gunicorn with 1..N workers and compare")
+    parser.add_argument("--port", type=int, default=8765, help="port for --scale servers")
+    args = parser.parse_args()
+
+    if args.scale:
+        scale(args)
+    else:
+        print_result("total", asyncio.run(run_load(args.url, args.duration, args.concurrency, args.write_ratio)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,171 +1,491 @@
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from datetime import date, datetime
+import json
+import logging
 import os
-import sys
 
-# Add current directory to Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import analytics
+import compression
+import crud
+import debts
+import jobs
+import schemas
+import metrics
+from database import all_engines, get_db, get_read_db, mark_write
+from logging_config import setup_logging
 
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-
-try:
-    import crud
-    import models
-    import schemas
-    from database import SessionLocal, engine, get_db
-    from chatbot import ChatbotService
-except ImportError as e:
-    print(f"Import error: {e}")
-    print(f"Current working directory: {os.getcwd()}")
-    print(f"Python path: {sys.path}")
-    raise
-
-# Create tables
-try:
-    models.Base.metadata.create_all(bind=engine)
-    print("Database tables created successfully")
-except Exception as e:
-    print(f"Error creating database tables: {e}")
-
-app = FastAPI(title="Splitwise API", version="1.0.0")
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-)
+logger = logging.getLogger(__name__)
+
+# The chatbot and inference modules (requests, aiohttp, optional model
+# runtimes) are imported on first use, not at startup. Schema changes are
+# applied by `python migrate.py`, not by importing this module.
+
+router = APIRouter()
+
+# Seconds clients may reuse analytics without asking again; rollups only
+# change on writes, and a minute of staleness is fine for dashboards
+ANALYTICS_CACHE_MAX_AGE = int(os.getenv("ANALYTICS_CACHE_MAX_AGE", "60"))
+
+# Cache-Control per endpoint. "no-cache" responses still get an ETag, so
+# clients revalidate and unchanged payloads come back as an empty 304.
+CACHE_POLICIES = {
+    "read_groups": "private, no-cache",
+    "read_group": "private, no-cache",
+    "read_settlements": "private, no-cache",
+    "read_group_balances": "private, no-cache",
+    "read_user_balances": "private, no-cache",
+    "read_user_simplified_balances": "private, no-cache",
+    "search_expenses": "private, no-cache",
+    "read_group_analytics": f"private, max-age={ANALYTICS_CACHE_MAX_AGE}",
+    "read_user_analytics": f"private, max-age={ANALYTICS_CACHE_MAX_AGE}",
+    "read_jobs": "no-store",
+    "read_job": "no-store",
+    "read_metrics": "no-store",
+    "health_check": "no-store",
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Splitwise API starting")
+    yield
+    jobs.shutdown()
+    for db_engine in all_engines():
+        db_engine.dispose()
+
+def create_app() -> FastAPI:
+    setup_logging()
+    for db_engine in all_engines():
+        metrics.install_sqlalchemy_hooks(db_engine)
+    
+    app = FastAPI(
+        title="Splitwise API",
+        version="1.0.0",
+        default_response_class=metrics.TimedJSONResponse,
+        lifespan=lifespan
+    )
+    
+    # gzip/brotli for large bodies, Cache-Control and ETags
+    app.add_middleware(compression.CompressionMiddleware, cache_policies=CACHE_POLICIES)
+    
+    # Per-route timing metrics and opt-in Server-Timing headers
+    app.add_middleware(metrics.MetricsMiddleware)
+    
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        allow_headers=["*"],
+    )
+    
+    app.include_router(router)
+    return app
 
 # Health check endpoint
-@app.get("/health")
+@router.get("/health")
 def health_check():
     return {"status": "healthy", "message": "Splitwise API is running"}
 
-@app.get("/")
+@router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Prometheus metrics for this worker"""
+    return PlainTextResponse(
+        metrics.registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@router.get("/")
 def read_root():
     return {"message": "Splitwise API is running!"}
 
 # User endpoints
-@app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+@router.post("/users/", response_model=schemas.User)
+def create_user(user: schemas.UserCreate, response: Response, db: Session = Depends(get_db)):
     try:
-        return crud.create_user(db=db, user=user)
+        db_user = crud.create_user(db=db, user=user)
+        mark_write(response)
+        return db_user
     except Exception as e:
-        print(f"Error creating user: {e}")
+        logger.exception("Error creating user")
         raise HTTPException(status_code=500, detail=f"Error creating user: {str(e)}")
 
-@app.get("/users/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@router.post("/users/bulk", response_model=List[schemas.User])
+def bulk_upsert_users(users: schemas.BulkUserCreate, response: Response, db: Session = Depends(get_db)):
+    """Create users, or update the names of existing ones, matched by email"""
+    try:
+        result = crud.bulk_upsert_users(db=db, users=users.users)
+        mark_write(response)
+        return result
+    except Exception as e:
+        logger.exception("Error upserting users")
+        raise HTTPException(status_code=500, detail=f"Error upserting users: {str(e)}")
+
+@router.get("/users/", response_model=List[schemas.User])
+def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     try:
         return crud.get_users(db, skip=skip, limit=limit)
     except Exception as e:
-        print(f"Error fetching users: {e}")
+        logger.exception("Error fetching users")
         raise HTTPException(status_code=500, detail=f"Error fetching users: {str(e)}")
 
-@app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}", response_model=schemas.User)
+def read_user(user_id: int, db: Session = Depends(get_read_db)):
     db_user = crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 # Group endpoints
-@app.post("/groups/", response_model=schemas.Group)
-def create_group(group: schemas.GroupCreate, db: Session = Depends(get_db)):
+@router.post("/groups/", response_model=schemas.Group)
+def create_group(group: schemas.GroupCreate, response: Response, db: Session = Depends(get_db)):
     try:
-        return crud.create_group(db=db, group=group)
+        db_group = crud.create_group(db=db, group=group)
+        mark_write(response)
+        return db_group
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error creating group: {e}")
+        logger.exception("Error creating group")
         raise HTTPException(status_code=500, detail=f"Error creating group: {str(e)}")
 
-@app.get("/groups/", response_model=List[schemas.GroupDetails])
-def read_groups(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all groups with their details"""
+def _group_fields(view: schemas.GroupView, fields: Optional[str]):
+    if not fields:
+        return crud.GROUP_VIEWS[view.value]
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in crud.GROUP_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields {unknown}; choose from {', '.join(crud.GROUP_FIELDS)}"
+        )
+    return requested
+
+@router.get("/groups/", response_model=List[schemas.GroupFields], response_model_exclude_unset=True)
+def read_groups(
+    skip: int = 0,
+    limit: int = 100,
+    view: schemas.GroupView = schemas.GroupView.FULL,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Get groups. ``view=summary`` (or a comma separated ``fields`` list)
+    returns only what list screens need, from a single query."""
+    selected = _group_fields(view, fields)
     try:
-        groups = crud.get_groups(db, skip=skip, limit=limit)
-        group_details = []
-        
-        for group in groups:
-            total_expenses = sum(expense.amount for expense in group.expenses)
-            group_detail = schemas.GroupDetails(
-                id=group.id,
-                name=group.name,
-                created_at=group.created_at,
-                members=group.members,
-                expenses=group.expenses,
-                total_expenses=total_expenses
-            )
-            group_details.append(group_detail)
-        
-        return group_details
+        return crud.get_group_fields(db, selected, skip=skip, limit=limit)
     except Exception as e:
-        print(f"Error fetching groups: {e}")
+        logger.exception("Error fetching groups")
         raise HTTPException(status_code=500, detail=f"Error fetching groups: {str(e)}")
 
-@app.get("/groups/{group_id}", response_model=schemas.GroupDetails)
-def read_group(group_id: int, db: Session = Depends(get_db)):
+def _normalized(model, data) -> Response:
+    """Serialize ``data`` as ``model`` when the route's response_model does not apply"""
+    content = model.model_validate(data).model_dump(mode="json", exclude_unset=True)
+    return metrics.TimedJSONResponse(content)
+
+@router.get("/groups/{group_id}", response_model=schemas.GroupFields, response_model_exclude_unset=True)
+def read_group(
+    group_id: int,
+    view: schemas.GroupView = schemas.GroupView.FULL,
+    fields: Optional[str] = None,
+    shape: schemas.ResponseShape = schemas.ResponseShape.NESTED,
+    db: Session = Depends(get_read_db)
+):
+    """``shape=normalized`` lists each user once under ``users`` instead of
+    nesting them in every member, expense and split"""
+    groups = crud.get_group_fields(db, _group_fields(view, fields), group_id=group_id)
+    if not groups:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    if shape is schemas.ResponseShape.NORMALIZED:
+        return _normalized(schemas.NormalizedGroup, crud.normalize_group(groups[0]))
+    return groups[0]
+
+@router.post("/groups/{group_id}/members", response_model=schemas.GroupMembersResult)
+def add_group_members(
+    group_id: int,
+    members: schemas.GroupMembersUpdate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Add users to a group; existing members are skipped"""
     db_group = crud.get_group(db, group_id=group_id)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
-    total_expenses = sum(expense.amount for expense in db_group.expenses)
+    try:
+        result = crud.add_group_members(db=db, group_id=group_id, user_ids=members.user_ids)
+        mark_write(response)
+        return result
+    except Exception as e:
+        logger.exception("Error adding group members", extra={"group_id": group_id})
+        raise HTTPException(status_code=500, detail=f"Error adding group members: {str(e)}")
+
+@router.post("/groups/{group_id}/members/remove", response_model=schemas.GroupMembersResult)
+def remove_group_members(
+    group_id: int,
+    members: schemas.GroupMembersUpdate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Remove users from a group; users with a balance in it are refused"""
+    db_group = crud.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
     
-    return schemas.GroupDetails(
-        id=db_group.id,
-        name=db_group.name,
-        created_at=db_group.created_at,
-        members=db_group.members,
-        expenses=db_group.expenses,
-        total_expenses=total_expenses
-    )
+    try:
+        result = crud.remove_group_members(db=db, group_id=group_id, user_ids=members.user_ids)
+        mark_write(response)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error removing group members", extra={"group_id": group_id})
+        raise HTTPException(status_code=500, detail=f"Error removing group members: {str(e)}")
 
 # Expense endpoints
-@app.post("/groups/{group_id}/expenses", response_model=schemas.Expense)
+@router.post("/groups/{group_id}/expenses", response_model=schemas.Expense)
 def create_expense(
     group_id: int, 
     expense: schemas.ExpenseCreate, 
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db)
 ):
-    print(f"Received expense creation request for group {group_id}: {expense}")
-    
-    db_group = crud.get_group(db, group_id=group_id)
-    if db_group is None:
+    """Create an expense. Retries sending the same Idempotency-Key header
+    get the original expense back instead of a duplicate."""
+    membership = crud.get_group_membership(db, group_id=group_id)
+    if membership is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
     try:
-        result = crud.create_expense(db=db, group_id=group_id, expense=expense)
-        print(f"Expense created successfully: {result}")
+        if idempotency_key:
+            result, replayed = crud.create_expense_once(
+                db=db, group_id=group_id, expense=expense,
+                idempotency_key=idempotency_key, membership=membership
+            )
+            if replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+                return result
+        else:
+            result = crud.create_expense(db=db, group_id=group_id, expense=expense, membership=membership)
+        mark_write(response)
+        logger.info(
+            "Expense created",
+            extra={"expense_id": result.id, "group_id": group_id, "amount": expense.amount, "sample": True}
+        )
         return result
+    except crud.IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except crud.IdempotencyKeyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error creating expense: {e}")
+        logger.exception("Error creating expense", extra={"group_id": group_id})
         raise HTTPException(status_code=500, detail=f"Error creating expense: {str(e)}")
 
+@router.post("/groups/{group_id}/expenses/bulk", response_model=List[schemas.Expense])
+def create_expenses_bulk(
+    group_id: int,
+    bulk: schemas.BulkExpenseCreate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Import many expenses in one transaction; any invalid expense rejects the batch"""
+    membership = crud.get_group_membership(db, group_id=group_id)
+    if membership is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    try:
+        result = crud.create_expenses(db=db, group_id=group_id, expenses=bulk.expenses, membership=membership)
+        mark_write(response)
+        logger.info("Expenses imported", extra={"group_id": group_id, "count": len(result)})
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error importing expenses", extra={"group_id": group_id})
+        raise HTTPException(status_code=500, detail=f"Error importing expenses: {str(e)}")
+
+@router.get("/expenses/search", response_model=schemas.ExpenseSearchResults)
+def search_expenses(
+    q: str = Query(..., min_length=1),
+    group_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    skip: int = 0,
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_read_db)
+):
+    """Full-text search over expense descriptions, best matches first"""
+    return crud.search_expenses(
+        db, q, group_id=group_id, user_id=user_id,
+        date_from=date_from, date_to=date_to, skip=skip, limit=limit
+    )
+
+# Settlement endpoints
+@router.post("/groups/{group_id}/settlements", response_model=schemas.Settlement)
+def create_settlement(
+    group_id: int,
+    settlement: schemas.SettlementCreate,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """Record that one member paid another back"""
+    membership = crud.get_group_membership(db, group_id=group_id)
+    if membership is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    try:
+        result = crud.create_settlements(db=db, group_id=group_id, settlements=[settlement], membership=membership)
+        mark_write(response)
+        return result[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error creating settlement", extra={"group_id": group_id})
+        raise HTTPException(status_code=500, detail=f"Error creating settlement: {str(e)}")
+
+@router.post("/groups/{group_id}/settle-all", response_model=List[schemas.Settlement])
+def settle_all(
+    group_id: int,
+    response: Response,
+    plan: Optional[schemas.SettlementBatch] = None,
+    db: Session = Depends(get_db)
+):
+    """Apply a settlement plan in one statement. Without a body, settles
+    every balance in the group with the fewest transfers."""
+    membership = crud.get_group_membership(db, group_id=group_id)
+    if membership is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    try:
+        if plan is None:
+            result = crud.settle_group(db=db, group_id=group_id, membership=membership)
+        else:
+            result = crud.create_settlements(db=db, group_id=group_id, settlements=plan.settlements, membership=membership)
+        mark_write(response)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error settling group", extra={"group_id": group_id})
+        raise HTTPException(status_code=500, detail=f"Error settling group: {str(e)}")
+
+@router.get("/groups/{group_id}/settlements", response_model=List[schemas.Settlement])
+def read_settlements(group_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    return crud.get_settlements(db, group_id=group_id, skip=skip, limit=limit)
+
 # Balance endpoints
-@app.get("/groups/{group_id}/balances", response_model=List[schemas.Balance])
-def read_group_balances(group_id: int, db: Session = Depends(get_db)):
+@router.get("/groups/{group_id}/balances", response_model=List[schemas.Balance])
+def read_group_balances(group_id: int, db: Session = Depends(get_read_db)):
+    # Hot groups are answered from memory without touching the database
+    cached = crud.get_cached_group_balances(group_id)
+    if cached is not None:
+        return cached
+    
     db_group = crud.get_group(db, group_id=group_id)
     if db_group is None:
         raise HTTPException(status_code=404, detail="Group not found")
     
     return crud.get_group_balances(db, group_id=group_id)
 
-@app.get("/users/{user_id}/balances", response_model=schemas.UserBalance)
-def read_user_balances(user_id: int, db: Session = Depends(get_db)):
+@router.get("/users/{user_id}/balances", response_model=schemas.UserBalance)
+def read_user_balances(
+    user_id: int,
+    shape: schemas.ResponseShape = schemas.ResponseShape.NESTED,
+    db: Session = Depends(get_read_db)
+):
+    db_user = crud.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    balances = crud.get_user_balances(db, user_id=user_id)
+    if shape is schemas.ResponseShape.NORMALIZED:
+        return _normalized(schemas.NormalizedUserBalance, crud.normalize_user_balance(balances))
+    return balances
+
+@router.get("/users/{user_id}/balances/simplified", response_model=schemas.SimplifiedBalance)
+def read_user_simplified_balances(user_id: int, db: Session = Depends(get_read_db)):
+    """Debts netted across all groups into a minimal set of transfers"""
+    db_user = crud.get_user(db, user_id=user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return debts.user_debts(db, user_id)
+
+# Analytics endpoints
+@router.get("/groups/{group_id}/analytics", response_model=schemas.GroupAnalytics)
+def read_group_analytics(
+    group_id: int,
+    period: schemas.AnalyticsPeriod = schemas.AnalyticsPeriod.MONTH,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Spend per period, per payer and per member, from the rollup tables"""
+    db_group = crud.get_group(db, group_id=group_id)
+    if db_group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    
+    return analytics.group_analytics(db, group_id, period.value, start, end)
+
+@router.get("/users/{user_id}/analytics", response_model=schemas.UserAnalytics)
+def read_user_analytics(
+    user_id: int,
+    period: schemas.AnalyticsPeriod = schemas.AnalyticsPeriod.MONTH,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: Session = Depends(get_read_db)
+):
+    """What a user paid and owed per period and per group, from the rollup tables"""
     db_user = crud.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return crud.get_user_balances(db, user_id=user_id)
+    return analytics.user_analytics(db, user_id, period.value, start, end)
+
+# Background jobs
+def _submit_job(kind: str, func, *args, cpu_bound: bool = False):
+    try:
+        return jobs.submit(kind, func, *args, cpu_bound=cpu_bound)
+    except jobs.JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Job queue is full: {str(e)}")
+
+@router.post("/jobs/rebuild-rollups", response_model=schemas.Job, status_code=202)
+def start_rebuild_rollups():
+    """Recompute the analytics rollups from all expenses in the background"""
+    return _submit_job("rebuild-rollups", jobs.rebuild_rollups, cpu_bound=True)
+
+@router.post("/jobs/rebuild-debts", response_model=schemas.Job, status_code=202)
+def start_rebuild_debts():
+    """Rebuild the cross-group debt graph in the background"""
+    return _submit_job("rebuild-debts", jobs.rebuild_debt_graph)
+
+@router.get("/jobs", response_model=List[schemas.Job])
+def read_jobs(status: Optional[schemas.JobStatus] = None, kind: Optional[str] = None, limit: int = 100):
+    """Recent jobs, newest first"""
+    return jobs.list_jobs(status=status.value if status else None, kind=kind, limit=limit)
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # Chatbot endpoints
-@app.post("/chat")
+@router.post("/chat")
 async def chat_query(
     query_data: dict,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     query = query_data.get("query", "")
     user_context = query_data.get("user_context", {})
@@ -174,6 +494,7 @@ async def chat_query(
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
     try:
+        from chatbot import ChatbotService
         chatbot = ChatbotService(db)
         response = await chatbot.process_query(query, user_context)
         
@@ -182,21 +503,67 @@ async def chat_query(
             "response": response,
             "timestamp": datetime.utcnow().isoformat()
         }
-    except Exception as e:
-        print(f"Chatbot error: {e}")
+    except Exception:
+        logger.exception("Chatbot error")
         return {
             "query": query,
             "response": "I'm sorry, I encountered an error processing your request.",
             "timestamp": datetime.utcnow().isoformat()
         }
 
-@app.get("/chat/stats")
-def get_chat_stats(db: Session = Depends(get_db)):
+@router.post("/chat/jobs", response_model=schemas.Job, status_code=202)
+def start_chat_job(query_data: schemas.ChatJobCreate):
+    """Answer a chat query in the background; poll GET /jobs/{id} for the response"""
+    if not query_data.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    return _submit_job("chat", jobs.chat, query_data.query, query_data.user_context)
+
+@router.post("/chat/stream")
+def chat_stream(
+    query_data: dict,
+    request: Request,
+    db: Session = Depends(get_read_db)
+):
+    """Stream the chatbot response as server-sent events"""
+    query = query_data.get("query", "")
+    user_context = query_data.get("user_context", {})
+    
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
     try:
+        from chatbot import ChatbotService
         chatbot = ChatbotService(db)
-        return chatbot.get_quick_stats()
-    except Exception as e:
-        print(f"Chat stats error: {e}")
+        chunks = chatbot.stream_query(query, user_context)
+    except Exception:
+        logger.exception("Chatbot error")
+        chunks = None
+    
+    async def event_stream():
+        if chunks is None:
+            yield f"data: {json.dumps({'token': 'I am sorry, I encountered an error processing your request.'})}\n\n"
+        else:
+            async for chunk in chunks:
+                # Stop pulling from the model as soon as the client goes away
+                if await request.is_disconnected():
+                    await chunks.aclose()
+                    return
+                yield f"data: {json.dumps({'token': chunk})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'query': query, 'timestamp': datetime.utcnow().isoformat()})}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/chat/stats")
+def get_chat_stats(db: Session = Depends(get_read_db)):
+    try:
+        return crud.get_chat_stats(db)
+    except Exception:
+        logger.exception("Chat stats error")
         return {
             "total_users": 0,
             "total_groups": 0,
@@ -204,6 +571,18 @@ def get_chat_stats(db: Session = Depends(get_db)):
             "recent_expenses": []
         }
 
+@router.get("/chat/models")
+def get_chat_models():
+    """Health of the shared inference models (circuit breaker state)"""
+    from inference import all_inference_managers
+    return [
+        status
+        for manager in all_inference_managers()
+        for status in manager.status()
+    ]
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,247 @@
+import contextvars
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse, HTMLResponse
+from sqlalchemy import event
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# "off", "opt-in" (only requests sending X-Server-Timing) or "always"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "opt-in")
+# Allow ?profile=1 to return a sampling profile of the request
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """Time spent in each subsystem while handling one request"""
+
+    __slots__ = ("db_statements", "db_time", "render_time", "llm_time")
+
+    def __init__(self):
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.llm_time = 0.0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+def record_llm_time(seconds: float):
+    stats = _current.get()
+    if stats is not None:
+        stats.llm_time += seconds
+
+
+class RouteMetrics:
+    __slots__ = ("requests", "duration", "buckets", "db_statements", "db_time", "render_time", "llm_time")
+
+    def __init__(self):
+        self.requests = defaultdict(int)  # status code -> count
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.db_statements = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.llm_time = 0.0
+
+
+class MetricsRegistry:
+    """Per-route totals for this worker, rendered in Prometheus text format.
+
+    Streaming responses are kept apart (``streaming="true"``): their
+    duration is the time until the response starts, not the whole stream.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes: Dict[tuple, RouteMetrics] = defaultdict(RouteMetrics)
+
+    def observe(self, route: str, method: str, status: int, duration: float, stats: RequestStats, streaming: bool = False):
+        with self.lock:
+            metrics = self.routes[(route, method, streaming)]
+            metrics.requests[status] += 1
+            metrics.duration += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    metrics.buckets[i] += 1
+            metrics.db_statements += stats.db_statements
+            metrics.db_time += stats.db_time
+            metrics.render_time += stats.render_time
+            metrics.llm_time += stats.llm_time
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            items = [(_labels(*key), m) for key, m in sorted(self.routes.items())]
+
+            lines.append("# TYPE splitwise_requests_total counter")
+            for labels, m in items:
+                for status, count in sorted(m.requests.items()):
+                    lines.append(f'splitwise_requests_total{{{labels},status="{status}"}} {count}')
+
+            lines.append("# TYPE splitwise_request_duration_seconds histogram")
+            for labels, m in items:
+                total = sum(m.requests.values())
+                for bound, count in zip(DURATION_BUCKETS, m.buckets):
+                    lines.append(f'splitwise_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'splitwise_request_duration_seconds_bucket{{{labels},le="+Inf"}} {total}')
+                lines.append(f"splitwise_request_duration_seconds_sum{{{labels}}} {m.duration:.6f}")
+                lines.append(f"splitwise_request_duration_seconds_count{{{labels}}} {total}")
+
+            for name, attr, kind in (
+                ("splitwise_db_statements_total", "db_statements", "counter"),
+                ("splitwise_db_seconds_total", "db_time", "counter"),
+                ("splitwise_render_seconds_total", "render_time", "counter"),
+                ("splitwise_llm_seconds_total", "llm_time", "counter"),
+            ):
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, m in items:
+                    value = getattr(m, attr)
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f"{name}{{{labels}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(route: str, method: str, streaming: bool) -> str:
+    return f'route="{route}",method="{method}",streaming="{"true" if streaming else "false"}"'
+
+
+registry = MetricsRegistry()
+
+
+def install_sqlalchemy_hooks(engine):
+    """Attribute statement count and time to the current request"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.db_statements += 1
+        stats.db_time += elapsed
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that records how long rendering the body to JSON took.
+
+    Only the final encoding is timed; FastAPI's response_model validation
+    happens before and is counted in the handler's time.
+    """
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = super().render(content)
+        stats = _current.get()
+        if stats is not None:
+            stats.render_time += time.perf_counter() - start
+        return body
+
+
+def _server_timing(stats: RequestStats, duration: float) -> str:
+    return ", ".join([
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_statements} queries"',
+        f"render;dur={stats.render_time * 1000:.1f}",
+        f"llm;dur={stats.llm_time * 1000:.1f}",
+        f"total;dur={duration * 1000:.1f}",
+    ])
+
+
+def _wants_profile(scope) -> bool:
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", [""])[-1] == "1"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route timings.
+
+    Routes are labelled by endpoint function name (``read_groups``,
+    ``get_group_balances`` ...). For streaming responses (a body sent in
+    more than one chunk, such as the chat event stream) the recorded
+    duration stops when the response starts, and they are labelled
+    ``streaming="true"``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        want_timing = SERVER_TIMING == "always" or (SERVER_TIMING == "opt-in" and b"x-server-timing" in headers)
+        if PROFILING_ENABLED and _wants_profile(scope):
+            await self.profile(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        started = None
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, started, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                started = time.perf_counter()
+                if want_timing:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", _server_timing(stats, started - start).encode("latin-1"))
+                    ]
+            elif message["type"] == "http.response.body" and message.get("more_body", False):
+                streaming = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            endpoint = scope.get("endpoint")
+            route = getattr(endpoint, "__name__", "unmatched")
+            end = started if streaming else time.perf_counter()
+            registry.observe(route, scope["method"], status, end - start, stats, streaming)
+
+    async def profile(self, scope, receive, send):
+        """Run the request under the sampling profiler and return its report"""
+        if Profiler is None:
+            response = JSONResponse({"detail": "Profiling requires the pyinstrument package"}, status_code=501)
+            await response(scope, receive, send)
+            return
+
+        async def discard(message):
+            pass
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+        await HTMLResponse(profiler.output_html())(scope, receive, send)
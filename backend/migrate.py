@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""Create and upgrade the database schema.
+
+Run once per deploy, before starting the API workers:
+
+    python migrate.py
+
+To convert existing expense tables to group_id hash partitions (PostgreSQL,
+with EXPENSE_PARTITIONS set):
+
+    python migrate.py partition-expenses
+
+To recompute the analytics rollups from the expenses:
+
+    python migrate.py rebuild-rollups
+
+New tables come from the SQLAlchemy models. Changes to existing tables are
+listed in MIGRATIONS and applied once each, tracked in schema_migrations.
+"""
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import inspect, select, text
+
+import analytics
+import fx
+import models
+from database import engine, single_writer
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def add_expenses_created_at_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_expenses_created_at ON expenses (created_at)"))
+
+
+def add_expense_splits_group_id(conn):
+    # Denormalized group_id on splits, backfilled from their expenses
+    conn.execute(text("ALTER TABLE expense_splits ADD COLUMN group_id INTEGER REFERENCES groups(id)"))
+    conn.execute(text(
+        "UPDATE expense_splits SET group_id = "
+        "(SELECT expenses.group_id FROM expenses WHERE expenses.id = expense_splits.expense_id)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_expense_splits_group_user ON expense_splits (group_id, user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_expense_splits_expense_id ON expense_splits (expense_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_expenses_group_payer ON expenses (group_id, paid_by)"))
+
+
+def add_group_members_unique_index(conn):
+    # Drop duplicate memberships first, keeping the oldest row
+    conn.execute(text(
+        "DELETE FROM group_members WHERE id NOT IN "
+        "(SELECT MIN(id) FROM group_members GROUP BY group_id, user_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_group_members_group_user ON group_members (group_id, user_id)"
+    ))
+
+
+def build_expense_rollups(conn):
+    # From the amounts as they stood before currencies
+    analytics.rebuild_rollups(conn, models.Expense.amount, models.ExpenseSplit.amount)
+
+
+def add_expense_search_indexes(conn):
+    for statement in models.search_index_statements("expenses", conn.dialect.name):
+        conn.execute(text(statement))
+    if conn.dialect.name == "sqlite":
+        # Index the expenses that existed before the FTS table
+        conn.execute(text("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')"))
+
+
+def add_currencies(conn):
+    conn.execute(text(
+        f"ALTER TABLE groups ADD COLUMN base_currency VARCHAR(3) NOT NULL DEFAULT '{fx.FX_BASE_CURRENCY}'"
+    ))
+    conn.execute(text("ALTER TABLE expenses ADD COLUMN currency VARCHAR(3)"))
+
+
+def add_base_amounts(conn):
+    """Store every expense and split in its group's base currency, then
+    rebuild the rollups from the stored amounts"""
+    conn.execute(text("ALTER TABLE expenses ADD COLUMN base_amount FLOAT"))
+    conn.execute(text("ALTER TABLE expense_splits ADD COLUMN base_amount FLOAT"))
+
+    Expense, Split, Group = models.Expense, models.ExpenseSplit, models.Group
+    splits = defaultdict(list)
+    for split_id, expense_id, amount in conn.execute(
+        select(Split.id, Split.expense_id, Split.amount).order_by(Split.id)
+    ):
+        splits[expense_id].append((split_id, amount))
+
+    expense_rows, split_rows = [], []
+    expenses = select(
+        Expense.id, Expense.amount, Expense.currency, Expense.created_at, Group.base_currency
+    ).join(Group, Group.id == Expense.group_id)
+    for expense_id, amount, currency, created_at, base_currency in conn.execute(expenses):
+        parts = splits.get(expense_id, [])
+        total, shares = fx.convert_split(
+            amount, [part for _, part in parts], currency or base_currency, base_currency, created_at
+        )
+        expense_rows.append({"row_id": expense_id, "base_amount": total / 100})
+        split_rows.extend({"row_id": split_id, "base_amount": cents / 100} for (split_id, _), cents in zip(parts, shares))
+
+    if expense_rows:
+        conn.execute(text("UPDATE expenses SET base_amount = :base_amount WHERE id = :row_id"), expense_rows)
+    if split_rows:
+        conn.execute(text("UPDATE expense_splits SET base_amount = :base_amount WHERE id = :row_id"), split_rows)
+    analytics.rebuild_rollups(conn)
+
+
+# (name, step) pairs, applied in order. Steps receive a connection inside
+# the migration transaction. Never rename or reorder applied entries.
+MIGRATIONS = [
+    ("0001_expenses_created_at_index", add_expenses_created_at_index),
+    ("0002_expense_splits_group_id", add_expense_splits_group_id),
+    ("0003_group_members_unique", add_group_members_unique_index),
+    ("0004_expense_rollups", build_expense_rollups),
+    ("0005_expense_search", add_expense_search_indexes),
+    ("0006_currencies", add_currencies),
+    ("0007_expense_base_amounts", add_base_amounts),
+]
+
+
+def upgrade(bind=engine):
+    fresh = not inspect(bind).has_table("users")
+    models.Base.metadata.create_all(bind=bind)
+
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+        for name, step in MIGRATIONS:
+            if name in applied:
+                continue
+            # A fresh database already has the current schema from create_all
+            if not fresh:
+                logger.info("Applying migration", extra={"migration": name})
+                step(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                {"name": name, "applied_at": datetime.utcnow()}
+            )
+
+    logger.info("Database schema is up to date")
+
+
+def partition_expenses(bind=engine):
+    """Rebuild expenses and expense_splits as tables hash-partitioned by group_id.
+
+    PostgreSQL only; run with EXPENSE_PARTITIONS set, after `upgrade` and
+    with the API stopped. The old tables are renamed (along with their
+    indexes and sequences, whose names would clash), copied into the new
+    partitioned tables and dropped, all in one transaction.
+    """
+    if not models.PARTITION_BY_GROUP:
+        raise RuntimeError("Set EXPENSE_PARTITIONS and use a PostgreSQL DATABASE_URL")
+
+    tables = ["expenses", "expense_splits"]
+    with bind.begin() as conn:
+        for table in tables:
+            partitioned = conn.execute(
+                text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+                {"t": table}
+            ).first()
+            if partitioned:
+                logger.info("Table is already partitioned", extra={"table": table})
+                return
+
+        for table in tables:
+            indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": table}).scalars().all()
+            conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+            for index in indexes:
+                conn.execute(text(f"ALTER INDEX {index} RENAME TO {index}_old"))
+            conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {table}_old_id_seq"))
+
+        models.Expense.__table__.create(conn)
+        models.ExpenseSplit.__table__.create(conn)
+
+        conn.execute(text(
+            "INSERT INTO expenses (id, description, amount, currency, base_amount, paid_by, group_id, split_type, created_at) "
+            "SELECT id, description, amount, currency, base_amount, paid_by, group_id, split_type, created_at FROM expenses_old"
+        ))
+        conn.execute(text(
+            "INSERT INTO expense_splits (id, expense_id, group_id, user_id, amount, base_amount, percentage) "
+            "SELECT s.id, s.expense_id, e.group_id, s.user_id, s.amount, s.base_amount, s.percentage "
+            "FROM expense_splits_old s JOIN expenses_old e ON e.id = s.expense_id"
+        ))
+        for table in tables:
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"
+            ))
+
+        conn.execute(text("DROP TABLE expense_splits_old"))
+        conn.execute(text("DROP TABLE expenses_old"))
+
+    logger.info("Expenses partitioned by group", extra={"partitions": models.EXPENSE_PARTITIONS})
+
+
+@single_writer
+def rebuild_rollups(bind=engine):
+    """Recompute the analytics rollups from scratch.
+
+    Expense writers are held off until the rebuild commits, so no rollup
+    delta lands between reading the expenses and rewriting the rollups.
+    """
+    with bind.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Writers block on their rollup upsert; their expenses are
+            # either committed before this lock (and read below) or
+            # counted by that upsert once the rebuild commits
+            conn.execute(text("LOCK TABLE expense_rollups IN EXCLUSIVE MODE"))
+        elif conn.dialect.name == "sqlite":
+            # Take the write lock up front so other processes wait too
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        analytics.rebuild_rollups(conn)
+    logger.info("Expense rollups rebuilt")
+
+
+COMMANDS = {
+    "upgrade": upgrade,
+    "rebuild-rollups": rebuild_rollups,
+    "partition-expenses": partition_expenses,
+}
+
+
+if __name__ == "__main__":
+    setup_logging()
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command not in COMMANDS:
+        print(f"Usage: python migrate.py [{'|'.join(COMMANDS)}]")
+        sys.exit(2)
+    try:
+        COMMANDS[command]()
+    except Exception:
+        logger.exception("Migration failed")
+        sys.exit(1)
@@ -1,14 +1,41 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, ForeignKeyConstraint, Index, JSON, Text, Enum, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from database import DATABASE_URL
+from fx import FX_BASE_CURRENCY
 import enum
+import os
 
 Base = declarative_base()
 
+# Hash-partition expenses and expense_splits by group_id on PostgreSQL into
+# this many partitions (0 keeps plain tables). Partitioned tables carry
+# group_id in their primary keys. Existing databases are converted with
+# `python migrate.py partition-expenses`.
+EXPENSE_PARTITIONS = int(os.getenv("EXPENSE_PARTITIONS", "0"))
+PARTITION_BY_GROUP = EXPENSE_PARTITIONS > 0 and DATABASE_URL.startswith("postgresql")
+
+def partitioned_table_args(*args):
+    if not PARTITION_BY_GROUP:
+        return args
+    return args + ({"postgresql_partition_by": "HASH (group_id)"},)
+
+def create_partitions(table):
+    """Create the hash partitions right after the parent table"""
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {table.name}_p{i} PARTITION OF {table.name} "
+        f"FOR VALUES WITH (MODULUS {EXPENSE_PARTITIONS}, REMAINDER {i})"
+        for i in range(EXPENSE_PARTITIONS)
+    ]
+    event.listen(table, "after_create", DDL("; ".join(statements)).execute_if(dialect="postgresql"))
+
 class SplitType(enum.Enum):
     EQUAL = "equal"
     PERCENTAGE = "percentage"
+    EXACT = "exact"
+    SHARES = "shares"
+    ITEMIZED = "itemized"
 
 class User(Base):
     __tablename__ = "users"
@@ -23,6 +50,8 @@ class Group(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
+    # Balances and totals are reported in this currency
+    base_currency = Column(String(3), nullable=False, default=FX_BASE_CURRENCY)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -31,6 +60,9 @@ class Group(Base):
 
 class GroupMember(Base):
     __tablename__ = "group_members"
+    __table_args__ = (
+        Index("uq_group_members_group_user", "group_id", "user_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     group_id = Column(Integer, ForeignKey("groups.id"))
@@ -42,15 +74,21 @@ class GroupMember(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = partitioned_table_args(
+        Index("ix_expenses_group_payer", "group_id", "paid_by"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     description = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
+    currency = Column(String(3), nullable=True)  # NULL: the group's base currency
+    # Amount in the group's base currency, converted once at write time
+    base_amount = Column(Float, nullable=True)
     paid_by = Column(Integer, ForeignKey("users.id"))
-    group_id = Column(Integer, ForeignKey("groups.id"))
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=PARTITION_BY_GROUP)
     # Use String instead of Enum to avoid PostgreSQL enum issues
     split_type = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     group = relationship("Group", back_populates="expenses")
@@ -59,13 +97,119 @@ class Expense(Base):
 
 class ExpenseSplit(Base):
     __tablename__ = "expense_splits"
+    __table_args__ = partitioned_table_args(
+        Index("ix_expense_splits_group_user", "group_id", "user_id"),
+        # Partitioned expenses are only unique on (id, group_id)
+        *([ForeignKeyConstraint(["expense_id", "group_id"], ["expenses.id", "expenses.group_id"])] if PARTITION_BY_GROUP else [])
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    expense_id = Column(Integer, ForeignKey("expenses.id"))
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    expense_id = Column(Integer, *([] if PARTITION_BY_GROUP else [ForeignKey("expenses.id")]), index=True)
+    # Denormalized from the expense so split queries filter (and prune
+    # partitions) by group without joining expenses
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=PARTITION_BY_GROUP)
     user_id = Column(Integer, ForeignKey("users.id"))
     amount = Column(Float, nullable=False)
+    # Share of the expense's base_amount; the splits add up to it exactly
+    base_amount = Column(Float, nullable=True)
     percentage = Column(Float, nullable=True)
     
     # Relationships
     expense = relationship("Expense", back_populates="splits")
     user = relationship("User")
+
+class Settlement(Base):
+    """A repayment from one member to another, in the group's base
+    currency; counts towards balances but not towards expense totals"""
+    __tablename__ = "settlements"
+    __table_args__ = (
+        Index("ix_settlements_group_users", "group_id", "from_user_id", "to_user_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    from_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    to_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    amount = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    """Client-supplied Idempotency-Key of an expense write, kept for
+    IDEMPOTENCY_KEY_TTL seconds so retries replay the original result"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)  # sha256 of group and body
+    group_id = Column(Integer, nullable=False)
+    expense_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class Job(Base):
+    """A background job (see jobs.py), shared by every worker so any of
+    them can report its status"""
+    __tablename__ = "jobs"
+    
+    id = Column(String(32), primary_key=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+def search_index_statements(table_name: str, dialect: str):
+    """DDL for full-text search over expense descriptions.
+
+    PostgreSQL: a tsvector GIN index plus a pg_trgm index for fuzzy matches.
+    SQLite: an FTS5 table kept in sync with expenses by triggers (one
+    statement each, as SQLite runs one statement per execute).
+    """
+    if dialect == "postgresql":
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"CREATE INDEX IF NOT EXISTS ix_{table_name}_description_fts ON {table_name} "
+            "USING GIN (to_tsvector('english', description))",
+            f"CREATE INDEX IF NOT EXISTS ix_{table_name}_description_trgm ON {table_name} "
+            "USING GIN (description gin_trgm_ops)",
+        ]
+    if dialect == "sqlite":
+        fts = f"{table_name}_fts"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"description, content='{table_name}', content_rowid='id')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table_name} BEGIN "
+            f"INSERT INTO {fts}(rowid, description) VALUES (new.id, new.description); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, description) VALUES ('delete', old.id, old.description); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF description ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, description) VALUES ('delete', old.id, old.description); "
+            f"INSERT INTO {fts}(rowid, description) VALUES (new.id, new.description); END",
+        ]
+    return []
+
+def create_search_indexes(table):
+    for dialect in ("postgresql", "sqlite"):
+        for statement in search_index_statements(table.name, dialect):
+            event.listen(table, "after_create", DDL(statement).execute_if(dialect=dialect))
+
+class ExpenseRollup(Base):
+    """Spend per group, user and day/week/month, kept up to date on every
+    expense write so analytics never scan expenses"""
+    __tablename__ = "expense_rollups"
+    __table_args__ = (
+        Index("ix_expense_rollups_user", "user_id", "period", "period_start"),
+    )
+    
+    group_id = Column(Integer, ForeignKey("groups.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # "day", "week" or "month"
+    period_start = Column(Date, primary_key=True)
+    paid = Column(Float, nullable=False, default=0.0)  # expenses this user paid
+    share = Column(Float, nullable=False, default=0.0)  # this user's splits
+    expense_count = Column(Integer, nullable=False, default=0)  # expenses this user paid
+
+if PARTITION_BY_GROUP:
+    create_partitions(Expense.__table__)
+    create_partitions(ExpenseSplit.__table__)
+create_search_indexes(Expense.__table__)
@@ -1,11 +1,14 @@
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from pydantic import BaseModel, model_validator
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime
 from enum import Enum
 
 class SplitType(str, Enum):
     EQUAL = "equal"
     PERCENTAGE = "percentage"
+    EXACT = "exact"
+    SHARES = "shares"
+    ITEMIZED = "itemized"
 
 class UserBase(BaseModel):
     name: str
@@ -32,13 +35,28 @@ class GroupMember(BaseModel):
     class Config:
         from_attributes = True
 
+class BulkUserCreate(BaseModel):
+    users: List[UserCreate]
+
+class GroupMembersUpdate(BaseModel):
+    user_ids: List[int]
+
+class GroupMembersResult(BaseModel):
+    group_id: int
+    added: List[int]
+    removed: List[int]
+    missing: List[int]  # user ids that do not exist
+    member_count: int
+
 class GroupCreate(BaseModel):
     name: str
     user_ids: List[int]
+    base_currency: Optional[str] = None  # defaults to FX_BASE_CURRENCY
 
 class Group(BaseModel):
     id: int
     name: str
+    base_currency: str
     created_at: datetime
     members: List[GroupMember]
     
@@ -48,6 +66,13 @@ class Group(BaseModel):
 class ExpenseSplitCreate(BaseModel):
     user_id: int
     percentage: Optional[float] = None
+    amount: Optional[float] = None  # exact splits
+    shares: Optional[float] = None
+
+class ExpenseItem(BaseModel):
+    description: str
+    amount: float
+    user_ids: List[int]
 
 class ExpenseCreate(BaseModel):
     description: str
@@ -55,6 +80,44 @@ class ExpenseCreate(BaseModel):
     paid_by: int
     split_type: SplitType
     splits: Optional[List[ExpenseSplitCreate]] = None
+    items: Optional[List[ExpenseItem]] = None  # itemized splits
+    currency: Optional[str] = None  # ISO 4217 code; defaults to the group's base currency
+
+    @model_validator(mode="after")
+    def check_splits(self):
+        if self.currency is not None:
+            self.currency = self.currency.upper()
+            if len(self.currency) != 3 or not self.currency.isalpha():
+                raise ValueError("Currency must be a three letter code such as EUR")
+        
+        if self.splits and len({split.user_id for split in self.splits}) != len(self.splits):
+            raise ValueError("Each user can appear only once in splits")
+        
+        if self.split_type in (SplitType.PERCENTAGE, SplitType.EXACT, SplitType.SHARES):
+            field = {
+                SplitType.PERCENTAGE: "percentage",
+                SplitType.EXACT: "amount",
+                SplitType.SHARES: "shares",
+            }[self.split_type]
+            if not self.splits:
+                raise ValueError(f"{self.split_type.value.capitalize()} splits require a list of splits")
+            if any(getattr(split, field) is None for split in self.splits):
+                raise ValueError(f"Every {self.split_type.value} split needs a {field}")
+        
+        if self.split_type == SplitType.PERCENTAGE:
+            total = sum(split.percentage for split in self.splits)
+            if abs(total - 100) > 0.01:
+                raise ValueError(f"Split percentages must add up to 100, got {total:g}")
+        elif self.split_type == SplitType.EXACT:
+            total = sum(split.amount for split in self.splits)
+            if abs(total - self.amount) > 0.005:
+                raise ValueError(f"Split amounts must add up to {self.amount:g}, got {total:g}")
+        elif self.split_type == SplitType.ITEMIZED and not self.items:
+            raise ValueError("Itemized splits require a list of items")
+        return self
+
+class BulkExpenseCreate(BaseModel):
+    expenses: List[ExpenseCreate]
 
 class ExpenseSplit(BaseModel):
     id: int
@@ -70,6 +133,7 @@ class Expense(BaseModel):
     id: int
     description: str
     amount: float
+    currency: Optional[str] = None
     paid_by: int
     split_type: SplitType
     created_at: datetime
@@ -83,6 +147,96 @@ class GroupDetails(Group):
     expenses: List[Expense]
     total_expenses: float
 
+class GroupView(str, Enum):
+    SUMMARY = "summary"
+    FULL = "full"
+
+class GroupFields(BaseModel):
+    """A group with only the requested fields (?view= or ?fields=) set"""
+    id: int
+    name: Optional[str] = None
+    base_currency: Optional[str] = None
+    created_at: Optional[datetime] = None
+    member_count: Optional[int] = None
+    expense_count: Optional[int] = None
+    total_expenses: Optional[float] = None
+    members: Optional[List[GroupMember]] = None
+    expenses: Optional[List[Expense]] = None
+
+class ResponseShape(str, Enum):
+    NESTED = "nested"
+    NORMALIZED = "normalized"  # users listed once, referenced by id
+
+class NormalizedGroupMember(BaseModel):
+    id: int
+    user_id: int
+    
+    class Config:
+        from_attributes = True
+
+class NormalizedExpenseSplit(BaseModel):
+    id: int
+    user_id: int
+    amount: float
+    percentage: Optional[float]
+    
+    class Config:
+        from_attributes = True
+
+class NormalizedExpense(BaseModel):
+    id: int
+    description: str
+    amount: float
+    currency: Optional[str] = None
+    paid_by: int
+    split_type: SplitType
+    created_at: datetime
+    splits: List[NormalizedExpenseSplit]
+    
+    class Config:
+        from_attributes = True
+
+class NormalizedGroup(BaseModel):
+    """GroupFields with members, payers and split users given by id and
+    the users themselves in ``users``"""
+    id: int
+    name: Optional[str] = None
+    base_currency: Optional[str] = None
+    created_at: Optional[datetime] = None
+    member_count: Optional[int] = None
+    expense_count: Optional[int] = None
+    total_expenses: Optional[float] = None
+    members: Optional[List[NormalizedGroupMember]] = None
+    expenses: Optional[List[NormalizedExpense]] = None
+    users: Dict[int, User]
+
+class SettlementCreate(BaseModel):
+    from_user_id: int  # who paid the money back
+    to_user_id: int
+    amount: float
+
+    @model_validator(mode="after")
+    def check_settlement(self):
+        if self.amount <= 0:
+            raise ValueError("Settlement amount must be positive")
+        if self.from_user_id == self.to_user_id:
+            raise ValueError("A user cannot settle with themselves")
+        return self
+
+class SettlementBatch(BaseModel):
+    settlements: List[SettlementCreate]
+
+class Settlement(BaseModel):
+    id: int
+    group_id: int
+    from_user_id: int
+    to_user_id: int
+    amount: float
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 class Balance(BaseModel):
     user_id: int
     user_name: str
@@ -95,3 +249,104 @@ class UserBalance(BaseModel):
     user_name: str
     groups: List[dict]  # Group balances across all groups
     total_net_balance: float
+
+class NormalizedUserBalance(BaseModel):
+    """UserBalance with user names only in ``users``"""
+    user_id: int
+    groups: List[dict]  # owes_to/owed_by entries are {"user_id": int, "amount": float}
+    total_net_balance: float
+    users: Dict[int, str]
+
+class SimplifiedBalance(BaseModel):
+    """A user's transfers after netting debts across all groups"""
+    user_id: int
+    user_name: str
+    net_balance: float
+    owes_to: List[dict]  # [{"user_id": int, "user_name": str, "amount": float}]
+    owed_by: List[dict]  # [{"user_id": int, "user_name": str, "amount": float}]
+    component_size: int  # users connected to this one by debts
+
+class AnalyticsPeriod(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+class GroupAnalyticsPoint(BaseModel):
+    period_start: date
+    total: float
+    expense_count: int
+
+class UserAmount(BaseModel):
+    user_id: int
+    user_name: str
+    amount: float
+
+class GroupAnalytics(BaseModel):
+    group_id: int
+    period: AnalyticsPeriod
+    start: Optional[date]
+    end: Optional[date]
+    total: float
+    expense_count: int
+    series: List[GroupAnalyticsPoint]
+    by_payer: List[UserAmount]  # what each member paid
+    by_member: List[UserAmount]  # each member's share of the spend
+
+class UserAnalyticsPoint(BaseModel):
+    period_start: date
+    paid: float
+    share: float
+
+class GroupSpend(BaseModel):
+    group_id: int
+    group_name: str
+    paid: float
+    share: float
+
+class UserAnalytics(BaseModel):
+    user_id: int
+    period: AnalyticsPeriod
+    start: Optional[date]
+    end: Optional[date]
+    total_paid: float
+    total_share: float
+    series: List[UserAnalyticsPoint]
+    by_group: List[GroupSpend]
+
+class ExpenseSearchHit(BaseModel):
+    id: int
+    description: str
+    amount: float
+    currency: Optional[str]
+    paid_by: int
+    payer_name: str
+    group_id: int
+    group_name: str
+    split_type: SplitType
+    created_at: datetime
+    rank: float
+
+class ExpenseSearchResults(BaseModel):
+    total: int
+    items: List[ExpenseSearchHit]
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+class ChatJobCreate(BaseModel):
+    query: str
+    user_context: Dict[str, Any] = {}
@@ -0,0 +1,139 @@
+"""Split computation for expenses.
+
+All amounts are worked out in integer cents. Wherever a total does not
+divide evenly, the leftover cents go to the largest fractional parts,
+ties broken by position, so the shares always add up to the expense
+amount and the same input always gives the same split.
+
+Supported split types:
+
+- equal: between the listed users, or every group member if none are listed
+- percentage: ``percentage`` per user, adding up to 100
+- exact: ``amount`` per user, adding up to the expense amount
+- shares: ``shares`` per user (e.g. 2 for a couple, 1 for a single)
+- itemized: each item is split equally between its ``user_ids``; anything
+  left over (tax, tip) is spread in proportion to each user's items
+"""
+from fractions import Fraction
+from typing import Dict, List, Sequence, Tuple
+
+# (user_id, amount, percentage)
+Split = Tuple[int, float, float]
+
+
+class SplitError(ValueError):
+    pass
+
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def allocate(total: int, weights: Sequence) -> List[int]:
+    """Divide ``total`` cents in proportion to ``weights`` (largest remainder).
+
+    A negative total (a refund) is divided like its absolute value, so the
+    shares still add up to it exactly.
+    """
+    weights = [Fraction(str(weight)) for weight in weights]
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise SplitError("Split weights must add up to more than zero")
+
+    sign = -1 if total < 0 else 1
+    total = abs(total)
+    exact = [total * weight / weight_sum for weight in weights]
+    cents = [int(share) for share in exact]  # floor for non-negative shares
+    leftover = total - sum(cents)
+    order = sorted(range(len(exact)), key=lambda i: (-(exact[i] - cents[i]), i))
+    for i in order[:leftover]:
+        cents[i] += 1
+    return [sign * share for share in cents]
+
+
+def _weighted(expense, key: str) -> Dict[int, int]:
+    total = to_cents(expense.amount)
+    weights = [getattr(split, key) for split in expense.splits]
+    if any(weight is None or weight < 0 for weight in weights):
+        raise SplitError(f"Every split needs a non-negative {key}")
+    user_ids = [split.user_id for split in expense.splits]
+    return dict(zip(user_ids, allocate(total, weights)))
+
+
+def _equal(expense, member_ids: Sequence[int]) -> Dict[int, int]:
+    user_ids = [split.user_id for split in expense.splits] if expense.splits else list(member_ids)
+    if not user_ids:
+        raise SplitError("Group has no members to split between")
+    return dict(zip(user_ids, allocate(to_cents(expense.amount), [1] * len(user_ids))))
+
+
+def _exact(expense, member_ids: Sequence[int]) -> Dict[int, int]:
+    if any(split.amount is None for split in expense.splits):
+        raise SplitError("Every exact split needs an amount")
+    cents = {split.user_id: to_cents(split.amount) for split in expense.splits}
+    if sum(cents.values()) != to_cents(expense.amount):
+        raise SplitError("Exact split amounts must add up to the expense amount")
+    return cents
+
+
+def _itemized(expense, member_ids: Sequence[int]) -> Dict[int, int]:
+    cents = {}
+    for item in expense.items:
+        if not item.user_ids:
+            raise SplitError(f"Item '{item.description}' has no users")
+        for user_id, share in zip(item.user_ids, allocate(to_cents(item.amount), [1] * len(item.user_ids))):
+            cents[user_id] = cents.get(user_id, 0) + share
+
+    # What is left over has the sign of the total: tax and tip on a
+    # purchase, or their refund along with the items of a refund
+    total = to_cents(expense.amount)
+    extra = total - sum(cents.values())
+    if extra and (total == 0 or (extra < 0) != (total < 0)):
+        raise SplitError("Items add up to more than the expense amount")
+    if extra:
+        user_ids = list(cents)
+        for user_id, share in zip(user_ids, allocate(extra, [abs(cents[user_id]) for user_id in user_ids])):
+            cents[user_id] += share
+    return cents
+
+
+_CALCULATORS = {
+    "equal": _equal,
+    "percentage": lambda expense, member_ids: _weighted(expense, "percentage"),
+    "shares": lambda expense, member_ids: _weighted(expense, "shares"),
+    "exact": _exact,
+    "itemized": _itemized,
+}
+
+
+def compute_batch(expenses: Sequence, member_ids: Sequence[int]) -> List[List[Split]]:
+    """Splits for each expense, all paid within the same group.
+
+    ``expenses`` are ``schemas.ExpenseCreate`` objects. Raises SplitError
+    naming the position of the first invalid expense.
+    """
+    results = []
+    for position, expense in enumerate(expenses):
+        split_type = expense.split_type.value if hasattr(expense.split_type, "value") else str(expense.split_type)
+        calculator = _CALCULATORS.get(split_type)
+        if calculator is None:
+            raise SplitError(f"Unknown split type '{split_type}'")
+        try:
+            cents = calculator(expense, member_ids)
+        except SplitError as e:
+            if len(expenses) == 1:
+                raise
+            raise SplitError(f"Expense {position}: {e}") from None
+
+        total = to_cents(expense.amount)
+        if split_type == "percentage":
+            percentages = {split.user_id: split.percentage for split in expense.splits}
+        else:
+            percentages = {user_id: share * 100 / total if total else 0.0 for user_id, share in cents.items()}
+        results.append([(user_id, share / 100, percentages[user_id]) for user_id, share in cents.items()])
+    return results
+
+
+def compute_splits(expense, member_ids: Sequence[int]) -> List[Split]:
+    return compute_batch([expense], member_ids)[0]
+
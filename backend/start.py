@@ -2,48 +2,72 @@
 import os
 import sys
 import time
-import psycopg2
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import OperationalError
 
 def wait_for_db():
     """Wait for database to be ready"""
     db_url = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/splitwise")
-    
+
+    # Embedded SQLite: nothing to wait for, the file is created on connect
+    if db_url.startswith("sqlite"):
+        path = db_url.split(":///", 1)[-1]
+        if path and path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        print("Using SQLite database")
+        return True
+
     print("Waiting for database to be ready...")
     max_retries = 30
     retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            engine = create_engine(db_url)
-            connection = engine.connect()
-            connection.close()
-            print("Database is ready!")
-            return True
-        except OperationalError as e:
-            retry_count += 1
-            print(f"Database not ready (attempt {retry_count}/{max_retries}): {e}")
-            time.sleep(2)
-    
+
+    # One engine for all attempts; each attempt just opens a connection
+    engine = create_engine(db_url, pool_pre_ping=True)
+    try:
+        while retry_count < max_retries:
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                print("Database is ready!")
+                return True
+            except OperationalError as e:
+                retry_count += 1
+                print(f"Database not ready (attempt {retry_count}/{max_retries}): {e}")
+                time.sleep(2)
+    finally:
+        engine.dispose()
+
     print("Database failed to become ready!")
     return False
 
 def main():
     print("Starting Splitwise Backend...")
-    print(f"Python version: {sys.version}")
-    print(f"Working directory: {os.getcwd()}")
-    print(f"Python path: {sys.path}")
-    
+
     # Check if database is ready
     if not wait_for_db():
         sys.exit(1)
-    
-    # Import and start the application
+
+    # Apply schema changes here, once, rather than in every worker
+    if os.getenv("RUN_MIGRATIONS", "true").lower() in ("1", "true", "yes"):
+        import migrate
+        from logging_config import setup_logging
+        setup_logging()
+        migrate.upgrade()
+
+    # Multi-worker gunicorn server; exec so it receives SIGTERM directly
+    if os.getenv("SERVER_MODE", "development") == "production":
+        print("Starting gunicorn server...")
+        from logging_config import shutdown_logging
+        shutdown_logging()
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn_conf.py", "main:app"])
+
+    # Auto-reload is for local development only
+    reload = os.getenv("RELOAD", "false").lower() in ("1", "true", "yes")
+
     try:
         import uvicorn
         print("Starting uvicorn server...")
-        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+        uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=reload)
     except Exception as e:
         print(f"Failed to start server: {e}")
         sys.exit(1)
@@ -0,0 +1,81 @@
+"""Analytics from the expense rollups"""
+from datetime import date, datetime, timedelta
+
+import analytics
+import migrate
+import models
+
+
+def rollups(db):
+    db.expire_all()
+    return sorted(
+        (row.group_id, row.user_id, row.period, row.period_start, round(row.paid, 2), round(row.share, 2), row.expense_count)
+        for row in db.query(models.ExpenseRollup)
+    )
+
+
+def test_period_start():
+    moment = datetime(2024, 5, 16, 13, 30)  # a Thursday
+    assert analytics.period_start(moment, "day") == date(2024, 5, 16)
+    assert analytics.period_start(moment, "week") == date(2024, 5, 13)
+    assert analytics.period_start(moment, "month") == date(2024, 5, 1)
+
+
+def test_group_analytics(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+    add_expense(group_id, amount=30, paid_by=b, split_type="exact",
+                splits=[{"user_id": a, "amount": 10}, {"user_id": b, "amount": 20}])
+
+    result = client.get(f"/groups/{group_id}/analytics").json()
+
+    assert result["total"] == 120.0 and result["expense_count"] == 2
+    assert [point["total"] for point in result["series"]] == [120.0]
+    assert [(payer["user_id"], payer["amount"]) for payer in result["by_payer"]] == [(a, 90.0), (b, 30.0)]
+    assert [(member["user_id"], member["amount"]) for member in result["by_member"]] == [(b, 50.0), (a, 40.0), (c, 30.0)]
+    assert client.get("/groups/9999/analytics").status_code == 404
+
+
+def test_user_analytics_across_groups(client, make_group, add_expense):
+    first, (a, b, c) = make_group()
+    second = client.post("/groups/", json={"name": "Flat", "user_ids": [a, b]}).json()["id"]
+    add_expense(first, amount=90, paid_by=a)
+    add_expense(second, amount=50, paid_by=b)
+
+    result = client.get(f"/users/{a}/analytics", params={"period": "day"}).json()
+
+    assert (result["total_paid"], result["total_share"]) == (90.0, 55.0)
+    assert [(group["group_id"], group["paid"], group["share"]) for group in result["by_group"]] == [(first, 90.0, 30.0), (second, 0.0, 25.0)]
+
+
+def test_periods_and_windows(client, db, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=30, paid_by=a)
+    old = add_expense(group_id, amount=60, paid_by=b)
+    last_year = datetime.utcnow() - timedelta(days=400)
+    db.query(models.Expense).filter(models.Expense.id == old["id"]).update({"created_at": last_year})
+    db.commit()
+    migrate.rebuild_rollups()
+
+    monthly = client.get(f"/groups/{group_id}/analytics").json()
+    assert [(point["period_start"], point["total"]) for point in monthly["series"]] == [
+        (last_year.date().replace(day=1).isoformat(), 60.0),
+        (date.today().replace(day=1).isoformat(), 30.0),
+    ]
+
+    recent = client.get(f"/groups/{group_id}/analytics", params={"period": "week", "start": (date.today() - timedelta(days=30)).isoformat()}).json()
+    assert recent["total"] == 30.0
+    assert client.get(f"/groups/{group_id}/analytics", params={"end": last_year.date().isoformat()}).json()["total"] == 60.0
+
+
+def test_incremental_rollups_match_a_rebuild(client, db, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+    add_expense(group_id, amount=-12.5, paid_by=c)
+    expenses = [{"description": "Taxi", "amount": 20, "paid_by": b, "split_type": "equal"}] * 3
+    client.post(f"/groups/{group_id}/expenses/bulk", json={"expenses": expenses})
+    incremental = rollups(db)
+
+    migrate.rebuild_rollups()
+
+    assert rollups(db) == incremental
@@ -0,0 +1,40 @@
+"""App factory, lifespan and schema migrations"""
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect, text
+
+import jobs
+import main
+import migrate
+
+
+def test_create_app_builds_an_independent_app():
+    app = main.create_app()
+
+    assert app is not main.app
+    assert {"/health", "/groups/{group_id}/expenses", "/jobs/{job_id}"} <= set(app.openapi()["paths"])
+
+
+def test_lifespan_stops_jobs_and_closes_connections(database, monkeypatch):
+    app = main.create_app()
+    stopped = []
+    disposed = []
+    monkeypatch.setattr(jobs, "shutdown", lambda: stopped.append(True))
+    monkeypatch.setattr(main, "all_engines", lambda: [type("Engine", (), {"dispose": lambda self: disposed.append(True)})()])
+
+    with TestClient(app) as client:
+        assert client.get("/health").json()["status"] == "healthy"
+        assert stopped == [] and disposed == []
+
+    assert stopped == [True] and disposed == [True]
+
+
+def test_upgrade_records_every_migration_once(database):
+    with database.engine.connect() as conn:
+        applied = [row[0] for row in conn.execute(text("SELECT name FROM schema_migrations ORDER BY name"))]
+    assert applied == [name for name, _ in migrate.MIGRATIONS]
+
+    migrate.upgrade()  # nothing left to apply
+
+    with database.engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_migrations")).scalar() == len(migrate.MIGRATIONS)
+    assert "expense_rollups" in inspect(database.engine).get_table_names()
@@ -0,0 +1,65 @@
+"""Group balances in the base currency"""
+import pytest
+
+import group_state
+
+
+def net_balances(client, group_id):
+    return {balance["user_id"]: balance["net_balance"] for balance in client.get(f"/groups/{group_id}/balances").json()}
+
+
+@pytest.fixture(params=[False, True], ids=["sql", "group_state"])
+def state_enabled(request, monkeypatch):
+    monkeypatch.setattr(group_state, "ENABLED", request.param)
+    return request.param
+
+
+def test_foreign_currency_balances_add_up_to_zero(client, make_group, add_expense, state_enabled):
+    group_id, (a, b, c) = make_group()
+    if state_enabled:
+        net_balances(client, group_id)  # load the state, so later writes apply deltas
+    add_expense(group_id, amount=90, currency="EUR", paid_by=a)
+    add_expense(group_id, amount=100, currency="GBP", paid_by=b, split_type="shares",
+                splits=[{"user_id": a, "shares": 1}, {"user_id": b, "shares": 1}, {"user_id": c, "shares": 1}])
+    add_expense(group_id, amount=-45.5, currency="EUR", paid_by=c)
+
+    balances = net_balances(client, group_id)
+    assert round(sum(balances.values()), 2) == 0
+
+    settlements = client.post(f"/groups/{group_id}/settle-all").json()
+    assert settlements
+    assert all(balance == 0 for balance in net_balances(client, group_id).values())
+    assert client.post(f"/groups/{group_id}/settle-all").json() == []
+
+
+def test_cached_and_sql_balances_agree(client, make_group, add_expense, monkeypatch):
+    monkeypatch.setattr(group_state, "ENABLED", True)
+    group_id, (a, b, c) = make_group()
+    net_balances(client, group_id)
+    for amount, currency in [(90, "EUR"), (33.33, "JPY"), (10.01, "GBP")]:
+        add_expense(group_id, amount=amount, currency=currency, paid_by=a)
+    cached = net_balances(client, group_id)
+
+    group_state._states.clear()
+    assert net_balances(client, group_id) == cached
+
+
+def test_rollups_match_the_converted_total(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, currency="EUR", paid_by=a)
+    add_expense(group_id, amount=142.42, currency="GBP", paid_by=b)
+
+    analytics = client.get(f"/groups/{group_id}/analytics").json()
+    assert round(sum(member["amount"] for member in analytics["by_member"]), 2) == analytics["total"]
+    assert round(sum(payer["amount"] for payer in analytics["by_payer"]), 2) == analytics["total"]
+
+
+def test_group_totals_agree_across_views(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    for _ in range(4):
+        # Each converts to a fraction of a cent over 1.13 USD
+        add_expense(group_id, amount=1.10, currency="EUR", paid_by=a)
+
+    summary = client.get(f"/groups/{group_id}", params={"view": "summary"}).json()
+    full = client.get(f"/groups/{group_id}").json()
+    assert full["total_expenses"] == summary["total_expenses"]
@@ -0,0 +1,74 @@
+"""Bulk user upsert and group membership endpoints"""
+import group_state
+
+
+def members(client, group_id):
+    return sorted(member["user_id"] for member in client.get(f"/groups/{group_id}").json()["members"])
+
+
+def test_bulk_upsert_inserts_and_renames_by_email(client):
+    first = client.post("/users/bulk", json={"users": [
+        {"name": "alice", "email": "alice@example.com"},
+        {"name": "bob", "email": "bob@example.com"},
+    ]}).json()
+    second = client.post("/users/bulk", json={"users": [
+        {"name": "Alice", "email": "alice@example.com"},
+        {"name": "Al", "email": "alice@example.com"},  # the last entry for an email wins
+        {"name": "carol", "email": "carol@example.com"},
+    ]}).json()
+
+    ids = {user["email"]: user["id"] for user in first}
+    assert {user["email"]: user["id"] for user in second}["alice@example.com"] == ids["alice@example.com"]
+    names = {user["email"]: user["name"] for user in client.get("/users/").json()}
+    assert names == {"alice@example.com": "Al", "bob@example.com": "bob", "carol@example.com": "carol"}
+
+
+def test_bulk_upsert_renames_users_in_cached_balances(client, make_group, add_expense, monkeypatch):
+    monkeypatch.setattr(group_state, "ENABLED", True)
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+    client.get(f"/groups/{group_id}/balances")
+    assert group_state.get(group_id) is not None
+
+    client.post("/users/bulk", json={"users": [{"name": "Alice B.", "email": "alice@example.com"}]})
+
+    names = {balance["user_id"]: balance["user_name"] for balance in client.get(f"/groups/{group_id}/balances").json()}
+    assert names[a] == "Alice B."
+
+
+def test_add_members_skips_existing_and_reports_missing(client, make_group):
+    group_id, (a, b, c) = make_group()
+    _, (d,) = make_group(names=("dave",))
+
+    result = client.post(f"/groups/{group_id}/members", json={"user_ids": [a, d, d, 9999]}).json()
+
+    assert result["added"] == [d]
+    assert result["missing"] == [9999]
+    assert result["member_count"] == 4
+    assert members(client, group_id) == sorted([a, b, c, d])
+
+
+def test_remove_members_with_settled_balances(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=20, paid_by=a, split_type="exact",
+                splits=[{"user_id": a, "amount": 10}, {"user_id": b, "amount": 10}])
+
+    result = client.post(f"/groups/{group_id}/members/remove", json={"user_ids": [c]}).json()
+
+    assert result["removed"] == [c]
+    assert result["member_count"] == 2
+    assert members(client, group_id) == sorted([a, b])
+
+
+def test_remove_members_with_a_balance_is_refused(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    response = client.post(f"/groups/{group_id}/members/remove", json={"user_ids": [b, c]})
+
+    assert response.status_code == 400
+    assert f"[{b}, {c}]" in response.json()["detail"]
+    assert members(client, group_id) == sorted([a, b, c])
+
+    client.post(f"/groups/{group_id}/settle-all")
+    assert client.post(f"/groups/{group_id}/members/remove", json={"user_ids": [b, c]}).json()["removed"] == sorted([b, c])
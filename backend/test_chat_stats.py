@@ -0,0 +1,62 @@
+"""/chat/stats and its write-through cache"""
+import crud
+import models
+
+
+def stats(client):
+    response = client.get("/chat/stats")
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_stats_count_and_list_recent_expenses(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    for i in range(6):
+        add_expense(group_id, description=f"Expense {i}", amount=10 + i, paid_by=a)
+
+    result = stats(client)
+
+    assert result["total_users"] == 3
+    assert result["total_groups"] == 1
+    assert result["total_expenses"] == 75.0
+    assert [expense["description"] for expense in result["recent_expenses"]] == [f"Expense {i}" for i in range(5, 0, -1)]
+    assert result["recent_expenses"][0]["paid_by"] == "alice"
+    assert result["recent_expenses"][0]["group_name"] == "Trip"
+
+
+def test_cached_stats_follow_writes_in_this_process(client, db, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=30, paid_by=a)
+    stats(client)  # cache them
+
+    make_group(names=("dave",))
+    add_expense(group_id, amount=90, currency="EUR", paid_by=b)
+    add_expense(group_id, amount=12.5, paid_by=c)
+    cached = stats(client)
+
+    assert cached["total_users"] == 4
+    assert cached["total_groups"] == 2
+    assert cached == crud.compute_chat_stats(db)
+
+
+def test_bulk_import_refreshes_stats(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=30, paid_by=a)
+    stats(client)
+
+    expenses = [{"description": "Taxi", "amount": 20, "paid_by": b, "split_type": "equal"}] * 2
+    assert client.post(f"/groups/{group_id}/expenses/bulk", json={"expenses": expenses}).status_code == 200
+
+    assert stats(client)["total_expenses"] == 70.0
+
+
+def test_writes_by_other_workers_show_after_the_ttl(client, db, make_group):
+    make_group()
+    assert stats(client)["total_users"] == 3
+
+    db.add(models.User(name="erin", email="erin@example.com"))  # as another worker would
+    db.commit()
+    assert stats(client)["total_users"] == 3
+
+    crud._chat_stats_cache["expires_at"] = 0.0
+    assert stats(client)["total_users"] == 4
@@ -0,0 +1,89 @@
+"""Server-sent events from /chat/stream"""
+import json
+
+import pytest
+
+import chatbot
+from inference import BackendError, InferenceBackend, InferenceManager
+
+
+class WordsBackend(InferenceBackend):
+    """Streams ``words``, or raises ``error`` before the first one"""
+
+    def __init__(self, words=("You", " owe", " Bob"), error=None):
+        self.words = words
+        self.error = error
+        self.prompts = []
+
+    def generate(self, model, payload):
+        raise NotImplementedError
+
+    async def stream(self, model, prompt, parameters):
+        self.prompts.append(prompt)
+        if self.error is not None:
+            raise self.error
+        for word in self.words:
+            yield word
+
+
+@pytest.fixture
+def use_backend(monkeypatch):
+    def use(backend):
+        manager = InferenceManager(["model"], backend=backend)
+        monkeypatch.setattr(chatbot, "get_inference_manager", lambda models: manager)
+        return backend
+    return use
+
+
+def events(client, query):
+    response = client.post("/chat/stream", json={"query": query})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return parsed
+
+
+def test_tokens_stream_then_done(client, use_backend):
+    backend = use_backend(WordsBackend())
+
+    result = events(client, "who do I owe?")
+
+    assert [data["token"] for kind, data in result[:-1]] == ["You", " owe", " Bob"]
+    assert result[-1][0] == "done" and result[-1][1]["query"] == "who do I owe?"
+    assert "who do I owe?" in backend.prompts[0]
+
+
+def test_canned_query_skips_the_model(client, use_backend, make_group):
+    backend = use_backend(WordsBackend())
+    make_group()
+
+    result = events(client, "List all groups")
+
+    assert "Trip" in "".join(data["token"] for kind, data in result[:-1])
+    assert backend.prompts == []
+
+
+def test_loading_model_says_so(client, use_backend):
+    use_backend(WordsBackend(error=BackendError("loading", retry_after=20)))
+
+    result = events(client, "who do I owe?")
+
+    assert len(result) == 2
+    assert "loading" in result[0][1]["token"]
+    assert result[1][0] == "done"
+
+
+def test_failed_model_falls_back_to_rules(client, use_backend):
+    use_backend(WordsBackend(error=BackendError("error")))
+
+    result = events(client, "what are the balances?")
+
+    assert result[0][1]["token"].startswith("Here are the current balances")
+    assert result[-1][0] == "done"
+
+
+def test_empty_query_is_rejected(client):
+    assert client.post("/chat/stream", json={"query": "  "}).status_code == 400
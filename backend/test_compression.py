@@ -0,0 +1,122 @@
+"""Response compression, Cache-Control and ETags"""
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+
+
+@pytest.fixture
+def small_app():
+    app = FastAPI()
+
+    @app.get("/big")
+    def big():
+        return {"items": ["x" * 10] * 200}
+
+    @app.get("/small")
+    def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        async def events():
+            for i in range(3):
+                yield f"data: {'x' * 1000}{i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_middleware(compression.CompressionMiddleware, cache_policies={"big": "private, no-cache"})
+    return TestClient(app)
+
+
+def raw_get(client, url, **headers):
+    """GET without the client decoding the body"""
+    with client.stream("GET", url, headers=headers) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_choose_encoding():
+    assert compression.choose_encoding("gzip, deflate") == "gzip"
+    assert compression.choose_encoding("gzip;q=0, deflate") is None
+    assert compression.choose_encoding("*") == "gzip"
+    assert compression.choose_encoding("") is None
+
+
+def test_large_body_is_gzipped(small_app, monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    response, body = raw_get(small_app, "/big", **{"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    assert gzip.decompress(body) == small_app.get("/big").content
+
+
+def test_small_or_unaccepted_bodies_are_not_compressed(small_app):
+    response, _ = raw_get(small_app, "/small", **{"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response, body = raw_get(small_app, "/big", **{"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert body.startswith(b'{"items"')
+
+
+def test_streamed_body_passes_through(small_app):
+    response, body = raw_get(small_app, "/stream", **{"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert body.count(b"data: ") == 3
+
+
+def test_etag_is_revalidated_with_304(small_app):
+    first = small_app.get("/big")
+    assert first.headers["cache-control"] == "private, no-cache"
+    tag = first.headers["etag"]
+    assert tag.startswith('W/"')
+
+    again = small_app.get("/big", headers={"If-None-Match": f'W/"other", {tag}'})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == tag
+
+    # Routes without a policy get no ETag
+    assert "etag" not in small_app.get("/small").headers
+
+
+def test_group_etag_changes_after_a_write(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    tag = client.get(f"/groups/{group_id}").headers["etag"]
+    assert client.get(f"/groups/{group_id}", headers={"If-None-Match": tag}).status_code == 304
+
+    add_expense(group_id, amount=90, paid_by=a)
+
+    changed = client.get(f"/groups/{group_id}", headers={"If-None-Match": tag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != tag
+
+
+def test_cache_policies_of_the_api(client, make_group):
+    group_id, _ = make_group()
+
+    analytics = client.get(f"/groups/{group_id}/analytics")
+    assert analytics.headers["cache-control"].startswith("private, max-age=")
+    jobs = client.get("/jobs")
+    assert jobs.headers["cache-control"] == "no-store"
+    assert "etag" not in jobs.headers
+
+
+def test_normalized_group_lists_each_user_once(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    group = client.get(f"/groups/{group_id}", params={"shape": "normalized"}).json()
+
+    assert sorted(group["users"]) == sorted(str(user_id) for user_id in (a, b, c))
+    assert group["users"][str(a)]["name"] == "alice"
+    assert group["expenses"][0]["paid_by"] == a
+    assert "payer" not in group["expenses"][0]
+    assert {split["user_id"] for split in group["expenses"][0]["splits"]} == {a, b, c}
@@ -0,0 +1,68 @@
+"""SQLite single-writer mode"""
+import threading
+import time
+
+import pytest
+
+import crud
+import database
+import jobs
+import migrate
+
+WRITE_PATHS = [
+    crud.create_user,
+    crud.bulk_upsert_users,
+    crud.create_group,
+    crud.add_group_members,
+    crud.remove_group_members,
+    crud.create_expense,
+    crud.create_expense_once,
+    crud.create_expenses,
+    crud.create_settlements,
+    crud.settle_group,
+    crud._find_idempotency_key,
+    crud._purge_idempotency_keys,
+    jobs._insert_job,
+    jobs._update,
+    migrate.rebuild_rollups,
+]
+
+
+@pytest.mark.parametrize("func", WRITE_PATHS, ids=lambda func: func.__name__)
+def test_write_path_goes_through_the_single_writer(func):
+    assert getattr(func, "__wrapped__", None) is not None
+
+
+def test_single_writer_runs_one_writer_at_a_time():
+    active, overlaps = [], []
+
+    @database.single_writer
+    def write():
+        active.append(1)
+        if len(active) > 1:
+            overlaps.append(len(active))
+        time.sleep(0.01)
+        active.pop()
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+
+
+def test_lock_for_write_holds_the_sqlite_write_lock(db):
+    database.lock_for_write(db)
+    try:
+        assert db.connection().connection.dbapi_connection.in_transaction
+        other = database.engine.raw_connection()
+        try:
+            other.execute("PRAGMA busy_timeout = 0")
+            with pytest.raises(Exception, match="locked"):
+                other.execute("BEGIN IMMEDIATE")
+        finally:
+            other.close()
+    finally:
+        db.rollback()
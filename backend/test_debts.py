@@ -0,0 +1,82 @@
+"""Cross-group debt simplification"""
+import pytest
+
+import debts
+
+
+@pytest.fixture
+def edge_loads(monkeypatch):
+    """The user_ids argument of every load_edges call (None: all edges)"""
+    calls = []
+    load_edges = debts.load_edges
+
+    def recording_load_edges(db, user_ids=None):
+        calls.append(None if user_ids is None else set(user_ids))
+        return load_edges(db, user_ids)
+
+    monkeypatch.setattr(debts, "load_edges", recording_load_edges)
+    return calls
+
+
+def simplified(client, user_id):
+    return client.get(f"/users/{user_id}/balances/simplified").json()
+
+
+def test_simplify_settles_everyone_with_few_transfers():
+    balances = {1: -500, 2: -300, 3: 300, 4: 500}
+    transfers = debts.simplify(balances)
+
+    assert sorted(transfers) == [(1, 4, 500), (2, 3, 300)]
+    for debtor, creditor, cents in transfers:
+        balances[debtor] += cents
+        balances[creditor] -= cents
+    assert set(balances.values()) == {0}
+
+
+def test_debts_are_netted_across_groups(client, make_group, add_expense):
+    first, (a, b) = make_group(names=("alice", "bob"))
+    second = client.post("/groups/", json={"name": "Flat", "user_ids": [a, b]}).json()["id"]
+    add_expense(first, amount=100, paid_by=a)
+    add_expense(second, amount=60, paid_by=b)
+
+    result = simplified(client, b)
+    assert result["net_balance"] == -20.0
+    assert result["owes_to"] == [{"user_id": a, "user_name": "alice", "amount": 20.0}]
+    assert result["component_size"] == 2
+
+
+def test_write_reloads_only_the_written_component(client, make_group, add_expense, edge_loads):
+    first, (a, b) = make_group(names=("alice", "bob"))
+    second, (c, d) = make_group(names=("carol", "dave"))
+    add_expense(first, amount=100, paid_by=a)
+    add_expense(second, amount=50, paid_by=c)
+    before = simplified(client, a)
+    cached = debts._graph["graph"]
+    assert edge_loads == [None]
+
+    add_expense(second, amount=30, paid_by=d)
+
+    assert simplified(client, c)["net_balance"] == 10.0
+    assert edge_loads == [None, {c, d}]
+    assert simplified(client, a) == before
+    # The untouched component is shared with the previous graph
+    assert debts._graph["graph"].component(a) is cached.component(a)
+
+
+def test_write_joining_two_components_merges_them(client, make_group, add_expense, edge_loads):
+    first, (a, b) = make_group(names=("alice", "bob"))
+    second, (c, d) = make_group(names=("carol", "dave"))
+    add_expense(first, amount=100, paid_by=a)
+    add_expense(second, amount=50, paid_by=c)
+    simplified(client, a)
+
+    both = client.post("/groups/", json={"name": "All", "user_ids": [a, c]}).json()["id"]
+    add_expense(both, amount=40, paid_by=a)
+
+    result = simplified(client, d)
+    assert result["component_size"] == 4
+    assert edge_loads == [None, {a, b, c, d}]
+
+    debts.invalidate()  # and a full rebuild agrees
+    assert simplified(client, d) == result
+    assert simplified(client, a)["net_balance"] == 70.0
@@ -0,0 +1,70 @@
+"""Group views (?view=) and sparse fieldsets (?fields=)"""
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def statements(database):
+    """SQL statements run by the engine during the test"""
+    run = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        run.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield run
+    event.remove(database.engine, "before_cursor_execute", record)
+
+
+def test_summary_view_has_counts_and_no_nested_data(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+    add_expense(group_id, amount=10.5, paid_by=b)
+
+    group = client.get(f"/groups/{group_id}", params={"view": "summary"}).json()
+
+    assert set(group) == {"id", "name", "base_currency", "created_at", "member_count", "expense_count", "total_expenses"}
+    assert (group["member_count"], group["expense_count"], group["total_expenses"]) == (3, 2, 100.5)
+
+
+def test_summary_of_a_page_is_one_query(client, make_group, add_expense, statements):
+    for name in ("alice", "bob", "carol"):
+        group_id, (user_id,) = make_group(names=(name,))
+        add_expense(group_id, amount=30, paid_by=user_id)
+    statements.clear()
+
+    groups = client.get("/groups/", params={"view": "summary"}).json()
+
+    assert [group["expense_count"] for group in groups] == [1, 1, 1]
+    assert len([statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]) == 1
+
+
+def test_full_view_nests_members_and_expenses(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    group = client.get(f"/groups/{group_id}").json()
+
+    assert [member["user"]["name"] for member in group["members"]] == ["alice", "bob", "carol"]
+    assert group["expenses"][0]["payer"]["id"] == a
+    assert len(group["expenses"][0]["splits"]) == 3
+    assert group["total_expenses"] == 90.0
+    assert "member_count" not in group
+
+
+def test_fields_select_exactly_what_is_asked(client, make_group):
+    group_id, _ = make_group()
+    client.post("/groups/", json={"name": "Empty", "user_ids": []})
+
+    groups = client.get("/groups/", params={"fields": "name, member_count"}).json()
+
+    assert groups == [{"id": group_id, "name": "Trip", "member_count": 3}, {"id": groups[1]["id"], "name": "Empty", "member_count": 0}]
+
+
+def test_unknown_field_is_rejected(client, make_group):
+    make_group()
+
+    response = client.get("/groups/", params={"fields": "name,password"})
+
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
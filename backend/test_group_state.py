@@ -0,0 +1,92 @@
+"""In-process group balances: write tracking, eviction and expiry"""
+import pytest
+
+import group_state
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(group_state, "ENABLED", True)
+    group_state._states.clear()
+    group_state._versions.clear()
+    group_state._writing.clear()
+    monkeypatch.setattr(group_state, "_total_bytes", 0)
+
+
+def test_load_finishing_after_a_write_is_not_cached():
+    seen = group_state.version(1)
+    # The write commits after the reader's version check but before its query
+    group_state.begin_write(1)
+    group_state.apply(1, {1: 500, 2: -500})
+    group_state.put(1, {1: 5.0, 2: -5.0}, {}, seen)
+    assert group_state.get(1) is None
+
+
+def test_load_during_a_write_is_not_cached():
+    group_state.begin_write(1)
+    seen = group_state.version(1)
+    group_state.put(1, {1: 0.0, 2: 0.0}, {}, seen)
+    group_state.apply(1, {1: 500, 2: -500})
+    assert group_state.get(1) is None
+
+
+def test_write_after_load_is_applied_once():
+    group_state.put(1, {1: 0.0, 2: 0.0}, {}, group_state.version(1))
+    group_state.begin_write(1)
+    group_state.apply(1, {1: 500, 2: -500})
+    assert group_state.get(1).net_balances() == {1: 5.0, 2: -5.0}
+
+
+def test_aborted_write_lets_later_loads_be_cached():
+    group_state.begin_write(1)
+    group_state.abort_write(1)
+    group_state.put(1, {1: 0.0}, {}, group_state.version(1))
+    assert group_state.get(1) is not None
+
+
+def test_write_for_an_untracked_user_drops_the_state():
+    group_state.put(1, {1: 0.0, 2: 0.0}, {}, group_state.version(1))
+    group_state.begin_write(1)
+    group_state.apply(1, {1: 500, 3: -500})
+    assert group_state.get(1) is None
+    assert group_state._total_bytes == 0
+
+
+def test_expired_state_is_dropped():
+    state = group_state.put(1, {1: 0.0}, {}, group_state.version(1))
+    state.expires_at = 0.0
+    assert group_state.get(1) is None
+    assert group_state._total_bytes == 0
+
+
+def test_least_recently_used_state_is_evicted(monkeypatch):
+    size = group_state.GroupState(0, {1: 0.0, 2: 0.0}, {}).nbytes
+    monkeypatch.setattr(group_state, "MEMORY_BUDGET", 2 * size)
+    for group_id in (1, 2):
+        group_state.put(group_id, {1: 0.0, 2: 0.0}, {}, group_state.version(group_id))
+    group_state.get(1)
+
+    group_state.put(3, {1: 0.0, 2: 0.0}, {}, group_state.version(3))
+
+    assert list(group_state._states) == [1, 3]
+    assert group_state._total_bytes == 2 * size
+
+
+def test_rename_updates_cached_names():
+    group_state.put(1, {1: 0.0, 2: 0.0}, {1: "alice", 2: "bob"}, group_state.version(1))
+    group_state.rename({2: "Bob", 3: "carol"})
+    assert group_state.get(1).user_names() == {1: "alice", 2: "Bob"}
+
+
+def test_balances_are_served_from_the_state(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=30, paid_by=b)
+    client.get(f"/groups/{group_id}/balances")
+    state = group_state.get(group_id)
+
+    add_expense(group_id, amount=90, paid_by=a)
+    client.post(f"/groups/{group_id}/settlements", json={"from_user_id": b, "to_user_id": a, "amount": 30})
+
+    balances = {balance["user_id"]: balance["net_balance"] for balance in client.get(f"/groups/{group_id}/balances").json()}
+    assert group_state.get(group_id) is state
+    assert balances == {a: 20.0, b: 20.0, c: -40.0}
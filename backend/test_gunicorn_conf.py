@@ -0,0 +1,45 @@
+"""Production server settings"""
+import os
+import runpy
+
+import pytest
+
+CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn_conf.py")
+
+
+@pytest.fixture
+def load_conf(monkeypatch):
+    def load(**env):
+        for name in ("DB_MAX_CONNECTIONS", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "WEB_CONCURRENCY"):
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return runpy.run_path(CONF)
+    return load
+
+
+@pytest.mark.parametrize("max_connections,workers", [("40", "4"), ("20", "3"), ("100", "8")])
+def test_connection_budget_is_split_between_workers(load_conf, max_connections, workers):
+    conf = load_conf(DB_MAX_CONNECTIONS=max_connections, WEB_CONCURRENCY=workers)
+
+    per_worker = int(os.environ["DB_POOL_SIZE"]) + int(os.environ["DB_MAX_OVERFLOW"])
+    assert conf["workers"] == int(workers)
+    assert conf["workers"] * per_worker <= int(max_connections)
+    assert int(os.environ["DB_POOL_SIZE"]) >= 1
+
+
+def test_overflow_fills_what_an_explicit_pool_size_leaves(load_conf):
+    load_conf(DB_MAX_CONNECTIONS="40", WEB_CONCURRENCY="4", DB_POOL_SIZE="3")
+    assert (os.environ["DB_POOL_SIZE"], os.environ["DB_MAX_OVERFLOW"]) == ("3", "7")
+
+    load_conf(DB_MAX_CONNECTIONS="40", WEB_CONCURRENCY="4", DB_POOL_SIZE="10")
+    assert os.environ["DB_MAX_OVERFLOW"] == "0"
+
+
+def test_pool_settings_left_alone_without_a_budget(load_conf):
+    conf = load_conf(WEB_CONCURRENCY="2")
+
+    assert "DB_POOL_SIZE" not in os.environ
+    assert conf["preload_app"] is True
+    assert conf["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert conf["max_requests_jitter"] == conf["max_requests"] // 10
@@ -0,0 +1,73 @@
+"""Idempotency-Key on expense creation"""
+from datetime import datetime, timedelta
+
+import crud
+import models
+
+
+def post_expense(client, group_id, key, **fields):
+    body = {"description": "Dinner", "split_type": "equal", **fields}
+    return client.post(f"/groups/{group_id}/expenses", json=body, headers={"Idempotency-Key": key})
+
+
+def expense_count(db, group_id):
+    db.expire_all()
+    return db.query(models.Expense).filter(models.Expense.group_id == group_id).count()
+
+
+def test_retry_returns_the_original_expense(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+
+    first = post_expense(client, group_id, "key-1", amount=90, paid_by=a)
+    retry = post_expense(client, group_id, "key-1", amount=90, paid_by=a)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert expense_count(db, group_id) == 1
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+    post_expense(client, group_id, "key-1", amount=90, paid_by=a)
+
+    response = post_expense(client, group_id, "key-1", amount=91, paid_by=a)
+
+    assert response.status_code == 422
+    assert expense_count(db, group_id) == 1
+
+
+def test_same_key_in_another_group_is_a_different_request(client, make_group):
+    group_id, (a, b, c) = make_group()
+    other_group = client.post("/groups/", json={"name": "Flat", "user_ids": [a, b]}).json()["id"]
+    post_expense(client, group_id, "key-1", amount=90, paid_by=a)
+
+    assert post_expense(client, other_group, "key-1", amount=90, paid_by=a).status_code == 422
+
+
+def test_expired_key_is_forgotten(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+    first = post_expense(client, group_id, "key-1", amount=90, paid_by=a).json()
+    db.query(models.IdempotencyKey).update({"created_at": datetime.utcnow() - timedelta(seconds=crud.IDEMPOTENCY_KEY_TTL + 1)})
+    db.commit()
+
+    again = post_expense(client, group_id, "key-1", amount=90, paid_by=a)
+
+    assert again.status_code == 200
+    assert again.json()["id"] != first["id"]
+    assert "Idempotent-Replayed" not in again.headers
+    assert expense_count(db, group_id) == 2
+
+
+def test_expired_keys_are_purged_on_write(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+    post_expense(client, group_id, "old", amount=10, paid_by=a)
+    db.query(models.IdempotencyKey).update({"created_at": datetime.utcnow() - timedelta(seconds=crud.IDEMPOTENCY_KEY_TTL + 1)})
+    db.commit()
+    crud._idempotency_purge["next_at"] = 0.0
+
+    post_expense(client, group_id, "new", amount=20, paid_by=a)
+
+    db.expire_all()
+    assert [row.key for row in db.query(models.IdempotencyKey)] == ["new"]
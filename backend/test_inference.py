@@ -0,0 +1,164 @@
+"""Shared inference: circuit breakers, failover, single-flight and batching"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from chatbot import ChatbotService
+from inference import BackendError, CircuitBreaker, InferenceBackend, InferenceManager, InferenceUnavailable
+
+
+class SlowBackend(InferenceBackend):
+    """Counts upstream calls; each takes ``delay`` seconds"""
+
+    def __init__(self, delay: float = 0.3):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def generate(self, model, payload):
+        with self.lock:
+            self.calls.append(payload)
+        time.sleep(self.delay)
+        if isinstance(payload["inputs"], list):
+            return [[{"generated_text": f"answer to {prompt}"}] for prompt in payload["inputs"]]
+        return [{"generated_text": f"answer to {payload['inputs']}"}]
+
+    async def stream(self, model, prompt, parameters):
+        yield f"answer to {prompt}"
+
+
+def chatbot(manager: InferenceManager) -> ChatbotService:
+    service = ChatbotService(db=None)
+    service.inference = manager
+    service.get_context_data = lambda: {"users": [], "groups": [], "expenses": [], "balances": []}
+    return service
+
+
+async def ask_concurrently(service: ChatbotService, queries):
+    return await asyncio.gather(*(service.process_query(query) for query in queries))
+
+
+def test_concurrent_identical_prompts_share_one_upstream_call():
+    backend = SlowBackend()
+    service = chatbot(InferenceManager(["model"], backend=backend, batch_window_ms=0))
+
+    start = time.perf_counter()
+    responses = asyncio.run(ask_concurrently(service, ["who owes whom?"] * 5))
+    elapsed = time.perf_counter() - start
+
+    assert len(backend.calls) == 1
+    assert len(set(responses)) == 1
+    assert elapsed < 5 * backend.delay
+
+
+def test_concurrent_prompts_are_batched():
+    backend = SlowBackend()
+    service = chatbot(InferenceManager(["model"], backend=backend, batch_window_ms=100))
+
+    responses = asyncio.run(ask_concurrently(service, ["first?", "second?", "third?"]))
+
+    assert len(backend.calls) == 1
+    assert len(backend.calls[0]["inputs"]) == 3
+    assert len(set(responses)) == 3
+
+
+def test_backend_missing_a_method_fails_when_created():
+    class GenerateOnly(InferenceBackend):
+        def generate(self, model, payload):
+            return []
+
+    with pytest.raises(TypeError):
+        GenerateOnly()
+
+
+class FailingBackend(InferenceBackend):
+    """Models listed in ``failures`` raise that BackendError; others answer"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = []
+
+    def generate(self, model, payload):
+        self.calls.append(model)
+        if model in self.failures:
+            raise self.failures[model]
+        return [{"generated_text": f"{model} says hi"}]
+
+    async def stream(self, model, prompt, parameters):
+        self.calls.append(model)
+        if model in self.failures:
+            raise self.failures[model]
+        for word in ("hi", "from", model):
+            yield word
+
+
+async def collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_breaker_backoff_doubles_up_to_the_cap():
+    breaker = CircuitBreaker(base_backoff=5, max_backoff=12)
+    now = time.monotonic()
+
+    breaker.record_failure("error")
+    assert breaker.is_open(now + 4) and not breaker.is_open(now + 6)
+    breaker.record_failure("error")
+    assert breaker.is_open(now + 9)
+    breaker.record_failure("rate_limited", retry_after=60)
+    assert breaker.is_open(now + 50)
+    breaker.record_failure("error")
+    assert not breaker.is_open(now + 13)
+
+    breaker.record_success()
+    assert not breaker.is_open(time.monotonic())
+    assert breaker.failures == 0 and breaker.last_reason is None
+
+
+def test_failing_model_is_skipped_until_its_breaker_closes():
+    backend = FailingBackend({"first": BackendError("loading", retry_after=20)})
+    manager = InferenceManager(["first", "second"], backend=backend)
+
+    assert manager.generate("hello", {}) == "second says hi"
+    assert manager.generate("hello again", {}) == "second says hi"
+
+    assert backend.calls == ["first", "second", "second"]
+    first, second = manager.status()
+    assert (first["available"], first["last_error"], first["failures"]) == (False, "loading", 1)
+    assert first["retry_in"] > 19
+    assert second["available"]
+
+
+def test_no_healthy_model_raises_unavailable():
+    backend = FailingBackend({"only": BackendError("rate_limited", retry_after=30)})
+    manager = InferenceManager(["only"], backend=backend)
+
+    for _ in range(2):
+        with pytest.raises(InferenceUnavailable) as raised:
+            manager.generate("hello", {})
+        assert raised.value.reason == "rate_limited"
+    assert backend.calls == ["only"]
+
+
+def test_stream_fails_over_before_the_first_chunk():
+    backend = FailingBackend({"first": BackendError("error")})
+    manager = InferenceManager(["first", "second"], backend=backend)
+
+    assert asyncio.run(collect(manager.stream("hello", {}))) == ["hi", "from", "second"]
+    assert [model["available"] for model in manager.status()] == [False, True]
+
+
+def test_responses_are_cached():
+    backend = FailingBackend({})
+    manager = InferenceManager(["model"], backend=backend, cache_size=1)
+
+    manager.generate("hello", {})
+    manager.generate("hello", {})
+    manager.generate("other", {})
+    manager.generate("hello", {})
+
+    assert len(backend.calls) == 3
@@ -0,0 +1,90 @@
+"""Background jobs on the thread pool"""
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def job_pool(database, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_PROCESS_POOL", False)
+    monkeypatch.setattr(jobs, "_pending", 0)
+    yield jobs
+    jobs.shutdown()
+
+
+def wait_for(job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in jobs.FINISHED:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_result_is_stored(job_pool):
+    queued = jobs.submit("add", lambda a, b: {"sum": a + b}, 2, 3)
+    assert queued["status"] == "queued"
+
+    job = wait_for(queued["id"])
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"sum": 5}
+    assert job["started_at"] is not None and job["finished_at"] is not None
+    assert [listed["id"] for listed in jobs.list_jobs(kind="add")] == [queued["id"]]
+
+
+def test_job_failure_is_recorded(job_pool):
+    def fail():
+        raise RuntimeError("rollups are broken")
+
+    job = wait_for(jobs.submit("fail", fail)["id"])
+
+    assert job["status"] == "failed"
+    assert job["error"] == "rollups are broken"
+    assert job["result"] is None
+
+
+def test_full_queue_is_refused_until_a_job_finishes(job_pool, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_QUEUE_SIZE", 2)
+    release = threading.Event()
+    queued = [jobs.submit("wait", release.wait) for _ in range(2)]
+
+    with pytest.raises(jobs.JobQueueFull):
+        jobs.submit("wait", release.wait)
+    assert jobs.get(queued[0]["id"])["status"] in ("queued", "running")
+
+    release.set()
+    for job in queued:
+        wait_for(job["id"])
+    deadline = time.monotonic() + 5
+    while jobs._pending and time.monotonic() < deadline:
+        time.sleep(0.01)  # done callbacks run just after the status is written
+    assert wait_for(jobs.submit("wait", release.wait)["id"])["status"] == "succeeded"
+
+
+def test_job_endpoints(client, job_pool, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    response = client.post("/jobs/rebuild-debts")
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    wait_for(job_id)
+
+    job = client.get(f"/jobs/{job_id}").json()
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"users": 3, "components": 1}
+    assert [job["id"] for job in client.get("/jobs", params={"status": "succeeded"}).json()] == [job_id]
+    assert client.get("/jobs/missing").status_code == 404
+
+
+def test_full_queue_returns_503(client, job_pool, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_QUEUE_SIZE", 0)
+
+    response = client.post("/jobs/rebuild-rollups")
+
+    assert response.status_code == 503
+    assert client.get("/jobs").json() == []
@@ -0,0 +1,66 @@
+"""Structured JSON logging through the queue listener"""
+import io
+import json
+import logging
+import sys
+
+import pytest
+
+import logging_config
+
+
+def record(message="Expense created", level=logging.INFO, exc_info=None, **extra):
+    entry = logging.LogRecord("crud", level, __file__, 1, message, (), exc_info)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_json_lines_carry_extra_fields():
+    line = logging_config.JsonFormatter().format(record(expense_id=7, group_id=2))
+
+    entry = json.loads(line)
+    assert (entry["level"], entry["logger"], entry["message"]) == ("INFO", "crud", "Expense created")
+    assert (entry["expense_id"], entry["group_id"]) == (7, 2)
+    assert "sample" not in entry and "args" not in entry
+
+
+def test_queue_handler_keeps_the_traceback_apart():
+    try:
+        raise ValueError("bad split")
+    except ValueError:
+        prepared = logging_config._QueueHandler(None).prepare(record("Error creating expense", logging.ERROR, sys.exc_info()))
+
+    entry = json.loads(logging_config.JsonFormatter().format(prepared))
+    assert entry["message"] == "Error creating expense"
+    assert "ValueError: bad split" in entry["exception"]
+
+
+def test_only_sampled_records_are_dropped():
+    sampling = logging_config.SamplingFilter(0.0)
+
+    assert sampling.filter(record())
+    assert not sampling.filter(record(sample=True))
+    assert sampling.filter(record(level=logging.WARNING, sample=True))
+    assert logging_config.SamplingFilter(1.0).filter(record(sample=True))
+
+
+@pytest.fixture
+def stdout(monkeypatch):
+    """Restart logging writing to a buffer; restored afterwards"""
+    logging_config.shutdown_logging()
+    buffer = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", buffer)
+    logging_config.setup_logging()
+    yield buffer
+    logging_config.shutdown_logging()
+    monkeypatch.undo()
+    logging_config.setup_logging()
+
+
+def test_records_are_written_by_the_listener(stdout):
+    logging_config.setup_logging()  # a second call keeps the running listener
+    logging.getLogger("jobs").warning("Job failed", extra={"job_id": "abc"})
+    logging_config.shutdown_logging()  # flushes the queue
+
+    entries = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [(entry["logger"], entry["message"], entry["job_id"]) for entry in entries] == [("jobs", "Job failed", "abc")]
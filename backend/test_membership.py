@@ -0,0 +1,70 @@
+"""Group membership cache used to validate expenses"""
+import crud
+import models
+
+
+def post_expense(client, group_id, **fields):
+    return client.post(f"/groups/{group_id}/expenses", json={"description": "Dinner", "split_type": "equal", **fields})
+
+
+def test_membership_is_cached(db, make_group):
+    group_id, user_ids = make_group()
+
+    membership = crud.get_group_membership(db, group_id)
+
+    assert membership.member_ids == tuple(user_ids)
+    assert membership.name == "Trip" and membership.base_currency == "USD"
+    assert crud.get_group_membership(db, group_id) is membership
+    assert crud.get_group_membership(db, 9999) is None
+
+
+def test_expense_members_are_checked(client, make_group):
+    group_id, (a, b, c) = make_group()
+    _, (outsider,) = make_group(names=("dave",))
+
+    response = post_expense(client, group_id, amount=10, paid_by=outsider)
+    assert response.status_code == 400
+    assert "not a member" in response.json()["detail"]
+
+    response = post_expense(client, group_id, amount=10, paid_by=a, split_type="exact",
+                            splits=[{"user_id": outsider, "amount": 10}])
+    assert response.status_code == 400
+    assert f"[{outsider}]" in response.json()["detail"]
+
+
+def test_membership_changes_in_this_process_apply_at_once(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+    _, (d,) = make_group(names=("dave",))
+    crud.get_group_membership(db, group_id)
+
+    client.post(f"/groups/{group_id}/members", json={"user_ids": [d]})
+    assert post_expense(client, group_id, amount=40, paid_by=d).status_code == 200
+    # The equal split now includes the new member
+    assert len(post_expense(client, group_id, amount=40, paid_by=a).json()["splits"]) == 4
+
+
+def test_changes_by_other_workers_show_after_the_ttl(client, db, make_group):
+    group_id, (a, b, c) = make_group()
+    _, (d,) = make_group(names=("dave",))
+    crud.get_group_membership(db, group_id)
+
+    db.add(models.GroupMember(group_id=group_id, user_id=d))  # as another worker would
+    db.commit()
+    assert post_expense(client, group_id, amount=10, paid_by=d).status_code == 400
+
+    crud._membership_cache[group_id].expires_at = 0.0
+    assert post_expense(client, group_id, amount=10, paid_by=d).status_code == 200
+
+
+def test_membership_changed_while_loading_is_not_cached(db, make_group, monkeypatch):
+    group_id, _ = make_group()
+    loaded = crud.GroupMembership
+
+    def changed_while_loading(*args):
+        crud._invalidate_membership(group_id)
+        return loaded(*args)
+
+    monkeypatch.setattr(crud, "GroupMembership", changed_while_loading)
+    crud.get_group_membership(db, group_id)
+
+    assert group_id not in crud._membership_cache
@@ -0,0 +1,65 @@
+"""Per-route request metrics"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import metrics
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.MetricsRegistry())
+    app = FastAPI(default_response_class=metrics.TimedJSONResponse)
+
+    @app.get("/plain")
+    def plain():
+        return {"ok": True}
+
+    @app.get("/stream")
+    def stream():
+        async def events():
+            for i in range(3):
+                await asyncio.sleep(0.1)
+                yield f"data: {i}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    return TestClient(app)
+
+
+def test_plain_route_is_timed_and_labelled():
+    registry = metrics.MetricsRegistry()
+    stats = metrics.RequestStats()
+    stats.render_time = 0.002
+    registry.observe("plain", "GET", 200, 0.02, stats)
+
+    text = registry.render()
+    assert 'splitwise_requests_total{route="plain",method="GET",streaming="false",status="200"} 1' in text
+    assert 'splitwise_render_seconds_total{route="plain",method="GET",streaming="false"} 0.002000' in text
+
+
+def test_streaming_route_is_labelled_and_timed_until_it_starts(client):
+    assert client.get("/plain").status_code == 200
+    assert client.get("/stream").text.count("data:") == 3
+
+    routes = metrics.registry.routes
+    assert ("plain", "GET", False) in routes
+    streamed = routes[("stream", "GET", True)]
+    assert sum(streamed.requests.values()) == 1
+    # The body took about 0.3s to stream; only the time to start counts
+    assert streamed.duration < 0.1
+
+
+@pytest.mark.parametrize("query, wanted", [
+    (b"profile=1", True),
+    (b"a=2&profile=1", True),
+    (b"noprofile=1", False),
+    (b"x=profile=1", False),
+    (b"profile=0", False),
+    (b"", False),
+])
+def test_profile_is_requested_only_by_the_profile_parameter(query, wanted):
+    assert metrics._wants_profile({"query_string": query}) is wanted
@@ -0,0 +1,69 @@
+"""Read replicas and read-your-writes"""
+import os
+
+import pytest
+
+import models
+
+
+@pytest.fixture
+def replica(database, monkeypatch, tmp_path):
+    """An empty replica, so reads served by it find nothing"""
+    router = database.ReplicaRouter([f"sqlite:///{tmp_path / 'replica.db'}"])
+    models.Base.metadata.create_all(router.engines[0])
+    monkeypatch.setattr(database, "replicas", router)
+    yield router
+    for replica_engine in router.engines:
+        replica_engine.dispose()
+
+
+def test_reads_go_to_the_replica(client, replica, make_group):
+    group_id, _ = make_group()
+    client.cookies.clear()
+
+    assert client.get(f"/groups/{group_id}").status_code == 404
+    assert client.get("/groups/").json() == []
+
+
+def test_writer_reads_its_writes_from_the_primary(client, replica, database):
+    response = client.post("/users/", json={"name": "alice", "email": "alice@example.com"})
+    assert database.READ_YOUR_WRITES_COOKIE in response.cookies
+
+    group = client.post("/groups/", json={"name": "Trip", "user_ids": [response.json()["id"]]}).json()
+
+    assert client.get(f"/groups/{group['id']}").status_code == 200
+
+
+def test_expired_or_bad_cookie_reads_from_the_replica(client, replica, database, make_group):
+    group_id, _ = make_group()
+
+    for value in ("0", "not-a-time"):
+        client.cookies.set(database.READ_YOUR_WRITES_COOKIE, value)
+        assert client.get(f"/groups/{group_id}").status_code == 404
+
+
+def test_lagging_replica_is_skipped(client, replica, make_group, monkeypatch):
+    group_id, _ = make_group()
+    client.cookies.clear()
+    monkeypatch.setattr(replica, "replica_lag", lambda index: float("inf"))
+
+    assert client.get(f"/groups/{group_id}").status_code == 200
+
+
+def test_replicas_are_used_in_turn(database, tmp_path):
+    router = database.ReplicaRouter([f"sqlite:///{tmp_path / name}" for name in ("a.db", "b.db")])
+    try:
+        sessions = [router.session() for _ in range(4)]
+        assert [os.path.basename(session.get_bind().url.database) for session in sessions] == ["a.db", "b.db"] * 2
+        for session in sessions:
+            session.close()
+    finally:
+        for replica_engine in router.engines:
+            replica_engine.dispose()
+
+
+def test_no_cookie_without_replicas(client):
+    response = client.post("/users/", json={"name": "alice", "email": "alice@example.com"})
+
+    assert response.status_code == 200
+    assert not response.cookies
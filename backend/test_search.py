@@ -0,0 +1,75 @@
+"""Expense search: SQLite FTS5 and the LIKE fallback"""
+from datetime import date, timedelta
+
+import pytest
+
+import crud
+
+
+@pytest.fixture
+def expenses(make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    other_group, (d,) = make_group(names=("dave",))
+    add_expense(group_id, description="Dinner at Luigi's", amount=60, paid_by=a)
+    add_expense(group_id, description="Pizza dinner with dinner drinks", amount=30, paid_by=b)
+    add_expense(group_id, description="Taxi to the airport", amount=45, paid_by=c,
+                split_type="exact", splits=[{"user_id": c, "amount": 45}])
+    add_expense(other_group, description="Dinner alone", amount=12, paid_by=d)
+    return group_id, other_group, (a, b, c, d)
+
+
+def search(client, **params):
+    response = client.get("/expenses/search", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def descriptions(results):
+    return [item["description"] for item in results["items"]]
+
+
+def test_fts_matches_word_prefixes_best_first(client, expenses):
+    results = search(client, q="dinn")
+
+    assert results["total"] == 3
+    assert descriptions(results)[0] == "Pizza dinner with dinner drinks"
+    assert all(item["rank"] != 0 for item in results["items"])
+
+
+def test_fts_needs_every_word(client, expenses):
+    assert descriptions(search(client, q="dinner luigi")) == ["Dinner at Luigi's"]
+    assert search(client, q="dinner taxi")["total"] == 0
+
+
+def test_fts_ignores_query_syntax(client, expenses):
+    assert search(client, q='"*')["total"] == 0
+    assert descriptions(search(client, q="luigi's")) == ["Dinner at Luigi's"]
+
+
+def test_search_filters(client, expenses):
+    group_id, other_group, (a, b, c, d) = expenses
+
+    assert search(client, q="dinner", group_id=other_group)["total"] == 1
+    assert descriptions(search(client, q="taxi", user_id=a)) == []
+    assert descriptions(search(client, q="dinner", user_id=b)) == ["Pizza dinner with dinner drinks", "Dinner at Luigi's"]
+    tomorrow = date.today() + timedelta(days=1)
+    assert search(client, q="dinner", **{"from": tomorrow.isoformat()})["total"] == 0
+    assert search(client, q="dinner", to=date.today().isoformat())["total"] == 3
+
+
+def test_search_pages(client, expenses):
+    first = search(client, q="dinner", limit=2)
+    second = search(client, q="dinner", limit=2, skip=2)
+
+    assert first["total"] == second["total"] == 3
+    assert len(first["items"]) == 2
+    assert len(set(descriptions(first)) | set(descriptions(second))) == 3
+
+
+def test_like_fallback_matches_substrings(client, expenses, monkeypatch):
+    monkeypatch.setattr(crud, "_search_backend", lambda db: "like")
+
+    results = search(client, q="IRPOR")
+    assert descriptions(results) == ["Taxi to the airport"]
+    assert results["items"][0]["rank"] == 0.0
+    assert search(client, q="dinner")["total"] == 3
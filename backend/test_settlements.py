@@ -0,0 +1,122 @@
+"""Settlements and settle-all"""
+import threading
+
+import crud
+import models
+
+
+def net_balances(client, group_id):
+    return {balance["user_id"]: balance["net_balance"] for balance in client.get(f"/groups/{group_id}/balances").json()}
+
+
+def test_settlement_moves_balance_from_receiver_to_payer(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    response = client.post(f"/groups/{group_id}/settlements", json={"from_user_id": b, "to_user_id": a, "amount": 30})
+    assert response.status_code == 200
+
+    assert net_balances(client, group_id) == {a: 30.0, b: 0.0, c: -30.0}
+    assert [s["amount"] for s in client.get(f"/groups/{group_id}/settlements").json()] == [30.0]
+
+
+def test_settlement_with_an_outsider_is_rejected(client, make_group):
+    group_id, (a, b, c) = make_group()
+    _, (outsider,) = make_group(names=("dave",))
+
+    response = client.post(f"/groups/{group_id}/settlements", json={"from_user_id": outsider, "to_user_id": a, "amount": 5})
+    assert response.status_code == 400
+    assert client.get(f"/groups/{group_id}/settlements").json() == []
+
+
+def test_settle_all_uses_the_simplified_plan(client, make_group, add_expense):
+    group_id, (a, b, c, d) = make_group(names=("alice", "bob", "carol", "dave"))
+    add_expense(group_id, amount=100, paid_by=a)
+    add_expense(group_id, amount=40, paid_by=b)
+    add_expense(group_id, amount=20, paid_by=b, split_type="exact",
+                splits=[{"user_id": c, "amount": 10}, {"user_id": d, "amount": 10}])
+
+    settlements = client.post(f"/groups/{group_id}/settle-all").json()
+
+    # At most n - 1 transfers, each from a debtor to a creditor
+    assert len(settlements) <= 3
+    assert {s["to_user_id"] for s in settlements} <= {a, b}
+    assert all(balance == 0 for balance in net_balances(client, group_id).values())
+
+
+def test_settle_all_again_writes_nothing(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    first = client.post(f"/groups/{group_id}/settle-all").json()
+    second = client.post(f"/groups/{group_id}/settle-all")
+
+    assert len(first) == 2
+    assert second.status_code == 200 and second.json() == []
+    assert len(client.get(f"/groups/{group_id}/settlements").json()) == 2
+
+
+def test_concurrent_settle_all_settles_once(client, make_group, add_expense):
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    results = []
+    start = threading.Barrier(6)
+
+    def settle():
+        start.wait()
+        results.append(client.post(f"/groups/{group_id}/settle-all").json())
+
+    threads = [threading.Thread(target=settle) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(len(result) for result in results) == [0, 0, 0, 0, 0, 2]
+    assert len(client.get(f"/groups/{group_id}/settlements").json()) == 2
+
+
+def test_settle_all_from_two_workers_settles_once(database, make_group, add_expense, monkeypatch):
+    """Two workers do not share single_writer; the database lock must hold"""
+    group_id, (a, b, c) = make_group()
+    add_expense(group_id, amount=90, paid_by=a)
+
+    # Give both callers the chance to read the balances before either writes
+    both_read = threading.Barrier(2, timeout=1)
+    read_balances = crud.get_group_net_balances
+
+    def get_group_net_balances(db, group_id):
+        balances = read_balances(db, group_id)
+        try:
+            both_read.wait()
+        except threading.BrokenBarrierError:
+            pass  # the other caller is waiting for the write lock
+        return balances
+
+    monkeypatch.setattr(crud, "get_group_net_balances", get_group_net_balances)
+    settle_unlocked = crud.settle_group.__wrapped__  # without this process's writer lock
+
+    errors = []
+
+    def settle():
+        db = database.SessionLocal()
+        try:
+            settle_unlocked(db, group_id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=settle) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    db = database.SessionLocal()
+    try:
+        assert db.query(models.Settlement).filter(models.Settlement.group_id == group_id).count() == 2
+    finally:
+        db.close()
@@ -0,0 +1,123 @@
+"""Cent-exact split computation"""
+import pytest
+
+from schemas import ExpenseCreate, ExpenseSplitCreate, SplitType
+from splits import SplitError, allocate, compute_batch, compute_splits, to_cents
+
+MEMBERS = [1, 2, 3]
+
+
+def expense(**fields) -> ExpenseCreate:
+    fields.setdefault("description", "Dinner")
+    fields.setdefault("paid_by", 1)
+    return ExpenseCreate(**fields)
+
+
+def unchecked_exact(amount: float, split_amounts) -> ExpenseCreate:
+    """An exact split that skips the schema's own checks, to reach the engine's"""
+    return ExpenseCreate.model_construct(
+        description="Dinner", amount=amount, paid_by=1, split_type=SplitType.EXACT, items=None,
+        splits=[ExpenseSplitCreate(user_id=user_id, amount=share) for user_id, share in split_amounts]
+    )
+
+
+def total_cents(splits) -> int:
+    return sum(to_cents(amount) for _, amount, _ in splits)
+
+
+@pytest.mark.parametrize("total", [100, -100, 1, -1, 0, 99999, -99999])
+@pytest.mark.parametrize("weights", [[1, 1, 1], [1, 2, 3], [33.3, 33.3, 33.4], [7]])
+def test_allocate_adds_up(total, weights):
+    assert sum(allocate(total, weights)) == total
+
+
+def test_allocate_gives_leftover_to_largest_remainders_then_position():
+    assert allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate(200, [1, 1, 1]) == [67, 67, 66]
+
+
+def test_allocate_negative_total_mirrors_positive():
+    assert allocate(-100, [1, 1, 1]) == [-34, -33, -33]
+    assert allocate(-200, [1, 2, 3]) == [-x for x in allocate(200, [1, 2, 3])]
+
+
+def test_allocate_rejects_zero_weights():
+    with pytest.raises(SplitError):
+        allocate(100, [0, 0])
+
+
+def test_equal_split_between_all_members():
+    splits = compute_splits(expense(amount=10, split_type="equal"), MEMBERS)
+    assert [amount for _, amount, _ in splits] == [3.34, 3.33, 3.33]
+
+
+def test_negative_equal_split_adds_up():
+    splits = compute_splits(expense(amount=-1, split_type="equal"), MEMBERS)
+    assert total_cents(splits) == -100
+    assert [amount for _, amount, _ in splits] == [-0.34, -0.33, -0.33]
+
+
+def test_percentage_split():
+    splits = compute_splits(expense(
+        amount=50, split_type="percentage",
+        splits=[{"user_id": 1, "percentage": 33.3}, {"user_id": 2, "percentage": 66.7}]
+    ), MEMBERS)
+    assert total_cents(splits) == 5000
+    assert splits[0][2] == 33.3
+
+
+def test_shares_split():
+    splits = compute_splits(expense(
+        amount=90, split_type="shares",
+        splits=[{"user_id": 1, "shares": 2}, {"user_id": 2, "shares": 1}]
+    ), MEMBERS)
+    assert [(user_id, amount) for user_id, amount, _ in splits] == [(1, 60.0), (2, 30.0)]
+
+
+def test_exact_split_must_match_amount():
+    with pytest.raises(SplitError):
+        compute_splits(unchecked_exact(10, [(1, 4), (2, 5)]), MEMBERS)
+
+
+def test_itemized_split_spreads_tax_by_items():
+    splits = compute_splits(expense(
+        amount=33, split_type="itemized",
+        items=[
+            {"description": "Pasta", "amount": 20, "user_ids": [1]},
+            {"description": "Wine", "amount": 10, "user_ids": [1, 2]},
+        ]
+    ), MEMBERS)
+    assert dict((user_id, amount) for user_id, amount, _ in splits) == {1: 27.5, 2: 5.5}
+
+
+def test_itemized_refund_mirrors_the_purchase():
+    splits = compute_splits(expense(
+        amount=-33, split_type="itemized",
+        items=[
+            {"description": "Pasta", "amount": -20, "user_ids": [1]},
+            {"description": "Wine", "amount": -10, "user_ids": [1, 2]},
+        ]
+    ), MEMBERS)
+    assert dict((user_id, amount) for user_id, amount, _ in splits) == {1: -27.5, 2: -5.5}
+
+
+@pytest.mark.parametrize("amount, item_amount", [(10, 12), (-10, -12), (0, 5)])
+def test_itemized_items_cannot_exceed_the_total(amount, item_amount):
+    with pytest.raises(SplitError, match="more than the expense amount"):
+        compute_splits(expense(
+            amount=amount, split_type="itemized",
+            items=[{"description": "Pasta", "amount": item_amount, "user_ids": [1]}]
+        ), MEMBERS)
+
+
+def test_compute_batch_names_the_invalid_expense():
+    valid = expense(amount=10, split_type="equal")
+    invalid = unchecked_exact(10, [(1, 3)])
+    with pytest.raises(SplitError, match="Expense 1"):
+        compute_batch([valid, invalid], MEMBERS)
+
+
+def test_compute_batch_every_expense_adds_up():
+    amounts = [0.01, 0.1, 1, 10.01, 99.99, 1234.56, -12.34]
+    results = compute_batch([expense(amount=amount, split_type="equal") for amount in amounts], MEMBERS)
+    assert [total_cents(splits) for splits in results] == [to_cents(amount) for amount in amounts]
@@ -3,10 +3,10 @@
 import type React from "react"
 import { useState, useEffect } from "react"
 import { Link } from "react-router-dom"
-import { apiService, type User, type GroupDetails } from "../services/api"
+import { apiService, type User, type GroupSummary } from "../services/api"
 
 const GroupList: React.FC = () => {
-  const [groups, setGroups] = useState<GroupDetails[]>([])
+  const [groups, setGroups] = useState<GroupSummary[]>([])
   const [users, setUsers] = useState<User[]>([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
@@ -18,7 +18,7 @@ const GroupList: React.FC = () => {
   const loadData = async () => {
     try {
       console.log("Loading groups and users data...")
-      const [groupsData, usersData] = await Promise.all([apiService.getGroups(), apiService.getUsers()])
+      const [groupsData, usersData] = await Promise.all([apiService.getGroupSummaries(), apiService.getUsers()])
 
       console.log("Groups loaded:", groupsData)
       console.log("Users loaded:", usersData)
@@ -87,10 +87,10 @@ const GroupList: React.FC = () => {
             >
               <h3 className="text-lg font-medium text-gray-900 mb-2">{group.name}</h3>
               <div className="text-sm text-gray-600 space-y-1">
-                <p>{group.members.length} members</p>
+                <p>{group.member_count} members</p>
                 <p className="font-medium text-green-600">${group.total_expenses.toFixed(2)} total expenses</p>
                 <p className="text-xs text-gray-500">
-                  {group.expenses.length} expense{group.expenses.length !== 1 ? "s" : ""}
+                  {group.expense_count} expense{group.expense_count !== 1 ? "s" : ""}
                 </p>
               </div>
 
@@ -129,7 +129,7 @@ const GroupList: React.FC = () => {
             </div>
             <div className="text-center">
               <div className="text-2xl font-bold text-blue-600">
-                {groups.reduce((sum, group) => sum + group.expenses.length, 0)}
+                {groups.reduce((sum, group) => sum + group.expense_count, 0)}
               </div>
               <div className="text-sm text-gray-500">Total Expenses</div>
             </div>
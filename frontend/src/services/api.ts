@@ -25,12 +25,23 @@ export interface GroupDetails extends Group {
   total_expenses: number
 }
 
+export interface GroupSummary {
+  id: number
+  name: string
+  member_count: number
+  expense_count: number
+  total_expenses: number
+  members: GroupMember[]
+}
+
+export type SplitType = "equal" | "percentage" | "exact" | "shares" | "itemized"
+
 export interface Expense {
   id: number
   description: string
   amount: number
   paid_by: number
-  split_type: "equal" | "percentage"
+  split_type: SplitType
   created_at: string
   payer: User
   splits: ExpenseSplit[]
@@ -82,6 +93,15 @@ class ApiService {
   }
 
   // Groups
+  async getGroupSummaries(): Promise<GroupSummary[]> {
+    const fields = "id,name,member_count,expense_count,total_expenses,members"
+    const response = await fetch(`${API_BASE_URL}/groups/?fields=${fields}`)
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    return response.json()
+  }
+
   async getGroups(): Promise<GroupDetails[]> {
     console.log("API: Fetching all groups")
     try {
@@ -130,8 +150,9 @@ class ApiService {
       description: string
       amount: number
       paid_by: number
-      split_type: "equal" | "percentage"
-      splits?: Array<{ user_id: number; percentage?: number }>
+      split_type: SplitType
+      splits?: Array<{ user_id: number; percentage?: number; amount?: number; shares?: number }>
+      items?: Array<{ description: string; amount: number; user_ids: number[] }>
     },
   ): Promise<Expense> {
     console.log("API: Creating expense", { groupId, expenseData })
@@ -183,13 +204,47 @@ class ApiService {
     return response.json()
   }
 
+  async streamChatQuery(
+    query: string,
+    onToken: (token: string) => void,
+    userContext?: any,
+    signal?: AbortSignal,
+  ): Promise<void> {
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ query, user_context: userContext }),
+      signal,
+    })
+    if (!response.body) return
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ""
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      const events = buffer.split("\n\n")
+      buffer = events.pop() || ""
+      for (const event of events) {
+        if (event.startsWith("event: done")) return
+        if (event.startsWith("data: ")) {
+          onToken(JSON.parse(event.slice(6)).token)
+        }
+      }
+    }
+  }
+
   async getChatStats(): Promise<{
     total_users: number
     total_groups: number
     total_expenses: number
+    currency: string
     recent_expenses: Array<{
       description: string
       amount: number
+      currency: string
       paid_by: string
       group_name: string
       created_at: string